@@ -6,20 +6,21 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
-
-
-# asgi.py (snippet)
 import os
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
+
 from django.core.asgi import get_asgi_application
-from notifications.routing import websocket_urlpatterns
-from notifications.token_middleware import QueryStringTokenAuthMiddleware
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "your_project.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
+# set up Django before importing anything that touches models
 django_asgi_app = get_asgi_application()
 
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+
+from notifications.routing import websocket_urlpatterns  # noqa: E402
+from notifications.token_middleware import QueryStringTokenAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
@@ -0,0 +1,139 @@
+# backend/async_api.py
+"""
+Async read endpoints for the ASGI server.
+
+DRF views are synchronous. Under ASGI every request to one runs in Django's
+thread-sensitive executor and holds it for the whole request, so slow
+clients on a few hot endpoints queue behind each other. The hot GET
+endpoints are served by `async def` views instead:
+
+- authentication, the IsAuthenticated check and throttling (cache reads and
+  at most one query, see users.authentication) run in one sync_to_async hop,
+  then methods other than the allowed ones get 405 (as with api_view);
+- data is read with the async ORM;
+- the body is rendered with DRF's JSONRenderer, so responses (including
+  errors) look exactly like the sync views'.
+
+`get_or_sync` mounts such a view for GET on a URL whose other methods stay
+with the DRF view. `list_page` runs a viewset's list action (get_queryset,
+filters, keyset pagination, serializer) with the page query made async.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework.exceptions import (
+    APIException, AuthenticationFailed, MethodNotAllowed, NotAuthenticated, Throttled,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+
+class AsyncAPIResponse(HttpResponse):
+    """JSON response rendered up front; keeps `.data` like DRF's Response."""
+
+    def __init__(self, data, status=200, headers=None):
+        super().__init__(JSONRenderer().render(data), status=status, content_type='application/json', headers=headers)
+        self.data = data
+
+
+class _ViewStub:
+    """What throttles get as `view`: the APIView attributes they read."""
+
+    def __init__(self, view, request, args, kwargs, throttle_scope):
+        self.view = view
+        self.request = request
+        self.args = args
+        self.kwargs = kwargs
+        if throttle_scope is not None:
+            self.throttle_scope = throttle_scope
+
+    def get_view_name(self):
+        return self.view.__name__
+
+
+def _check_access(request, view):
+    # APIView.initial(): authenticate, require a user, then throttle
+    if not (request.user and request.user.is_authenticated):
+        raise NotAuthenticated()
+    waits = [
+        throttle.wait() for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, view)
+    ]
+    if waits:
+        raise Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+
+def _error_response(request, exc):
+    # as APIView.handle_exception(): 401 with WWW-Authenticate when the first
+    # authenticator provides one, 403 otherwise
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        auth_header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            exc.status_code = 403
+    response = exception_handler(exc, {'request': request})
+    headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+    return AsyncAPIResponse(response.data, status=response.status_code, headers=headers)
+
+
+def async_api_view(http_method_names=('GET',), throttle_scope=None):
+    """
+    Decorator turning `async def view(request, *args, **kwargs) -> data` into
+    an authenticated, throttled Django async view that accepts the methods in
+    `http_method_names` (HEAD too when GET is allowed) and answers any other
+    with 405, like api_view(). `request` is a DRF Request; `throttle_scope` is
+    what ScopedRateThrottle reads from the view.
+    """
+    allowed = {method.upper() for method in http_method_names}
+    if 'GET' in allowed:
+        allowed.add('HEAD')
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            request = Request(request, authenticators=[cls() for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+            stub = _ViewStub(view, request, args, kwargs, throttle_scope)
+            try:
+                await sync_to_async(_check_access)(request, stub)
+                if request.method not in allowed:
+                    raise MethodNotAllowed(request.method)
+                data = await view(request, *args, **kwargs)
+            except APIException as exc:
+                response = _error_response(request, exc)
+                if isinstance(exc, MethodNotAllowed):
+                    response['Allow'] = ', '.join(sorted(allowed))
+                return response
+            return AsyncAPIResponse(data)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+def get_or_sync(async_view, sync_view):
+    """Serve GET with `async_view`; every other method goes to the DRF `sync_view`."""
+    sync_handler = sync_to_async(sync_view)
+
+    async def dispatch(request, *args, **kwargs):
+        if request.method == 'GET':
+            return await async_view(request, *args, **kwargs)
+        return await sync_handler(request, *args, **kwargs)
+
+    dispatch.csrf_exempt = True
+    # lets backend.metrics name the endpoint after the DRF view
+    dispatch.cls = getattr(sync_view, 'cls', None)
+    dispatch.actions = getattr(sync_view, 'actions', None)
+    return dispatch
+
+
+async def list_page(viewset_class, request):
+    """The data of `viewset_class`'s list response, with the page read through the async ORM."""
+    view = viewset_class(request=request, action='list', format_kwarg=None, args=(), kwargs={})
+    queryset = view.filter_queryset(view.get_queryset())
+    page = await view.paginator.apaginate_queryset(queryset, request, view=view)
+    return view.paginator.get_paginated_data(view.get_serializer(page, many=True).data)
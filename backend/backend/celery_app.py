@@ -10,6 +10,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 app = Celery('backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+# task metrics and SQL profiling (connect Celery's task signals)
+from backend import metrics, profiling  # noqa: E402,F401
 # set timezone safely from environment variable (avoid importing settings at top-level)
 app.conf.timezone = os.environ.get("DJANGO_TIME_ZONE", "Asia/Kathmandu")
 
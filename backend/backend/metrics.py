@@ -0,0 +1,367 @@
+# backend/metrics.py
+"""
+Prometheus-style metrics for HTTP requests, Celery tasks and WebSockets.
+
+Each process keeps its counters, gauges and histograms in memory; recording
+is a dict update under a lock. `GET /metrics` returns them in the Prometheus
+text format (version 0.0.4).
+
+With several worker processes (gunicorn/uvicorn), set METRICS_MULTIPROC_DIR
+to a directory shared by the workers of a host. Each process then writes a
+snapshot of its values to `<pid>.json` there, at most every FLUSH_INTERVAL
+seconds and at exit. A scrape adds up the snapshots of all processes.
+Counters and histograms of exited workers keep counting, so totals never go
+backwards. Gauges only count live processes. Empty the directory when the
+whole service is restarted.
+
+Recorded here:
+- http_request_duration_seconds / http_request_db_queries, per view (DRF
+  viewsets as `<ViewSet>.<action>`), by MetricsMiddleware;
+- celery_task_duration_seconds / celery_task_failures_total, per task, from
+  Celery's task signals;
+- websocket_connections and channels_group_send_duration_seconds, from
+  notifications.consumers and notifications.tasks.
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import task_failure, task_postrun, task_prerun
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+FLUSH_INTERVAL = 5
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with REGISTRY.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        REGISTRY.maybe_flush()
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with REGISTRY.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        REGISTRY.maybe_flush()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Values are [count per bucket (not cumulative)..., sum, count]."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with REGISTRY.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 3)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[index] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1  # +Inf
+            row[-2] += value
+            row[-1] += 1
+        REGISTRY.maybe_flush()
+
+
+class _Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._last_flush = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {key_to_json(key): value for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write this process's snapshot into METRICS_MULTIPROC_DIR."""
+        directory = self.directory
+        if not directory:
+            return
+        self._last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self.snapshot(), fh)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """{metric name: {label key: value}} summed over every process."""
+        if not self.directory:
+            return {name: dict(metric.values) for name, metric in self.metrics.items()}
+        self.flush()
+        merged = {name: {} for name in self.metrics}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            pid = int(filename[:-len('.json')])
+            try:
+                with open(os.path.join(self.directory, filename), encoding='utf-8') as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(pid)
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                for key, value in values.items():
+                    key = key_from_json(key)
+                    current = merged[name].get(key)
+                    if current is None:
+                        merged[name][key] = value
+                    elif isinstance(value, list):
+                        merged[name][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[name][key] = current + value
+        return merged
+
+
+def key_to_json(key):
+    return json.dumps(key)
+
+
+def key_from_json(key):
+    return tuple(json.loads(key))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = _Registry()
+atexit.register(REGISTRY.flush)
+
+
+# --- exposition ---
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    lines = []
+    collected = REGISTRY.collect()
+    for name, metric in sorted(REGISTRY.metrics.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for key, value in sorted(collected.get(name, {}).items()):
+            if metric.type != 'histogram':
+                lines.append(f'{name}{_labels(metric.labelnames, key)} {_format_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*metric.buckets, '+Inf'), value):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_number(float(bound))
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, key, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, key)} {_format_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    GET /metrics; requires `Authorization: Bearer <METRICS_TOKEN>`. Without
+    that setting the endpoint is only served when DEBUG is on.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+# --- metrics ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by view.', ['view', 'method', 'status'],
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries issued per HTTP request by view.', ['view', 'method'],
+    buckets=QUERY_BUCKETS,
+)
+CELERY_TASK_SECONDS = Histogram('celery_task_duration_seconds', 'Celery task run time.', ['task', 'state'])
+CELERY_TASK_FAILURES = Counter('celery_task_failures_total', 'Celery tasks that raised.', ['task'])
+WEBSOCKET_CONNECTIONS = Gauge('websocket_connections', 'Open notification WebSocket connections.')
+GROUP_SEND_SECONDS = Histogram(
+    'channels_group_send_duration_seconds', 'channel_layer.group_send latency for notification pushes.',
+)
+
+
+# --- HTTP ---
+
+# mutable [count] of the request being handled; sync_to_async copies the
+# context, so queries run in executor threads are counted too
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    box = _request_queries.get()
+    if box is not None:
+        box[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_counter, dispatch_uid='backend.metrics.query_counter')
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return f'{match.func.__module__}.{match.func.__qualname__}'
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        return f'{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    return view_class.__name__
+
+
+class MetricsMiddleware:
+    """Records latency and SQL query count per view; place it first in MIDDLEWARE."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # connections opened before this module was imported
+        _install_query_counter(connection)
+        token = _request_queries.set([0])
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            queries = _request_queries.get()[0]
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        token = _request_queries.set([0])
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            queries = _request_queries.get()[0]
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, queries):
+        if request.path == '/metrics':
+            return
+        view = view_name(request)
+        HTTP_REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        HTTP_REQUEST_QUERIES.observe(queries, view=view, method=request.method)
+
+
+# --- Celery ---
+
+_task_started = {}
+
+
+@task_prerun.connect(dispatch_uid='backend.metrics.task_prerun')
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect(dispatch_uid='backend.metrics.task_postrun')
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_SECONDS.observe(time.perf_counter() - started, task=task.name, state=state or 'UNKNOWN')
+
+
+@task_failure.connect(dispatch_uid='backend.metrics.task_failure')
+def _task_failure(sender=None, **kwargs):
+    CELERY_TASK_FAILURES.inc(task=sender.name)
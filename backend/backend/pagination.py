@@ -0,0 +1,193 @@
+# backend/pagination.py
+"""
+Keyset (cursor) pagination shared by the connections and notifications APIs.
+
+Unlike offset pagination, each page is selected with a range predicate on the
+ordering columns (e.g. `created_at < :c OR (created_at = :c AND id < :id)`),
+so with a matching composite index every page is an index range scan whose
+cost does not depend on how deep the client has paged.
+"""
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_position_value(value):
+    # full microsecond precision: DjangoJSONEncoder truncates to milliseconds,
+    # which would break the equality half of the keyset predicate
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Cursor pagination over a fixed, unique ordering.
+
+    `ordering` must end with a unique column (the primary key) so that the
+    position encoded in a cursor identifies exactly one row. Query params:
+    - cursor: opaque token taken from the `next`/`previous` links
+    - limit: page size, bounded by `max_page_size`
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+        position, reverse = self.decode_cursor(request, queryset)
+        self.has_cursor = position is not None
+
+        rows = list(self.get_page_queryset(queryset, position, reverse, self.limit))
+        return self.build_page(rows, reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views: the page is fetched with the async ORM."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+        position, reverse = self.decode_cursor(request, queryset)
+        self.has_cursor = position is not None
+
+        rows = [row async for row in self.get_page_queryset(queryset, position, reverse, self.limit)]
+        return self.build_page(rows, reverse)
+
+    # --- core keyset logic (kept free of DRF request handling so async views can reuse it) ---
+
+    def get_page_queryset(self, queryset, position, reverse, limit):
+        """Return the sliced queryset for one page (fetches limit + 1 rows to detect more)."""
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        if position is not None:
+            queryset = queryset.filter(self._after_position(ordering, position))
+        return queryset.order_by(*ordering)[:limit + 1]
+
+    def build_page(self, rows, reverse):
+        """Trim the over-fetched row and work out which links exist."""
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.has_cursor, has_more
+        self.page = rows
+        return rows
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if limit < 1:
+            return self.page_size
+        return min(limit, self.max_page_size)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            reverse = bool(payload.get('r', 0))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # a well-formed token can still carry values the filter would reject
+        try:
+            position = [
+                self._ordering_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        position = [getattr(instance, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps({'p': position, 'r': int(reverse)}, default=_encode_position_value, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def _ordering_field(queryset, name):
+        """Model field (or annotation output field) an ordering column compares against."""
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def _reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    @staticmethod
+    def _after_position(ordering, position):
+        """
+        Expand the row-value comparison `(f1, f2, ...) > (v1, v2, ...)` (in the
+        direction given by each field's sign) into an OR of prefix equalities,
+        ANDed with the inclusive bound `f1 >= v1` that the OR implies. The OR
+        alone gives the planner no range to start the index scan from, so
+        every page would walk the index from its head.
+        """
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{name}__{lookup}': position[index]})
+            for prev_field, prev_value in zip(ordering[:index], position[:index]):
+                term &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= term
+        leading = ordering[0]
+        bound = 'lte' if leading.startswith('-') else 'gte'
+        return Q(**{f'{leading.lstrip("-")}__{bound}': position[0]}) & condition
+
+    # --- links / response ---
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
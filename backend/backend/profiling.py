@@ -0,0 +1,175 @@
+# backend/profiling.py
+"""
+Sampling SQL profiler for HTTP requests and Celery tasks.
+
+A request (or task) is profiled when it is sampled (SQL_PROFILE_SAMPLE_RATE)
+or, with SQL_PROFILE_SLOW_REQUEST_MS set, whenever it runs longer than that.
+The second mode has to time every query of every request: one perf_counter
+pair and a list append per query. With both settings off, a query costs a
+single context-variable lookup.
+
+The report is one log line on the `backend.profiling` logger, keyed by view
+name (as in backend.metrics) or task name. It gives the total time, the
+query count and SQL time, the statements repeated within the request
+grouped by fingerprint (the usual N+1 suspects), and the slowest statement.
+Captured queries slower than SQL_PROFILE_SLOW_QUERY_MS are also logged one
+by one (the slow-query log).
+"""
+import contextvars
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from .metrics import view_name
+
+logger = logging.getLogger(__name__)
+
+# statements shown per report
+REPORT_TOP = 3
+SQL_PREVIEW_CHARS = 200
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalise `sql` so statements differing only in values compare equal."""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERALS.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class _Profile:
+    __slots__ = ('sampled', 'queries')
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.queries = []  # (sql, duration in seconds)
+
+
+_current = contextvars.ContextVar('sql_profile', default=None)
+
+
+def _profile_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries.append((sql, time.perf_counter() - started))
+
+
+def _install_profiler(connection, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+connection_created.connect(_install_profiler, dispatch_uid='backend.profiling.profiler')
+
+
+def start():
+    """Begin profiling the current request/task if it is sampled or may turn out slow."""
+    sampled = random.random() < settings.SQL_PROFILE_SAMPLE_RATE
+    if not sampled and settings.SQL_PROFILE_SLOW_REQUEST_MS is None:
+        return None
+    _install_profiler(connection)  # connections opened before this module was imported
+    profile = _Profile(sampled)
+    return profile, _current.set(profile)
+
+
+def finish(started, label, elapsed):
+    """Stop profiling and log the report when due; `started` is start()'s return value."""
+    if started is None:
+        return
+    profile, token = started
+    _current.reset(token)
+    elapsed_ms = elapsed * 1000
+    slow_query_ms = settings.SQL_PROFILE_SLOW_QUERY_MS
+    for sql, duration in profile.queries:
+        if duration * 1000 >= slow_query_ms:
+            logger.warning('slow query in %s: %.1f ms %s', label, duration * 1000, sql[:SQL_PREVIEW_CHARS])
+    slow = settings.SQL_PROFILE_SLOW_REQUEST_MS is not None and elapsed_ms >= settings.SQL_PROFILE_SLOW_REQUEST_MS
+    if profile.sampled or slow:
+        logger.log(logging.WARNING if slow else logging.INFO, '%s', report(label, elapsed_ms, profile.queries))
+
+
+def report(label, elapsed_ms, queries):
+    groups = defaultdict(lambda: [0, 0.0])
+    for sql, duration in queries:
+        group = groups[fingerprint(sql)]
+        group[0] += 1
+        group[1] += duration
+    sql_ms = sum(duration for _, duration in queries) * 1000
+    parts = [f'SQL profile {label}: {elapsed_ms:.1f} ms, {len(queries)} queries in {sql_ms:.1f} ms']
+    repeated = sorted(
+        ((count, total, sql) for sql, (count, total) in groups.items() if count > 1), reverse=True,
+    )[:REPORT_TOP]
+    if repeated:
+        parts.append('repeated: ' + ' | '.join(
+            f'{count}x {total * 1000:.1f} ms {sql[:SQL_PREVIEW_CHARS]}' for count, total, sql in repeated
+        ))
+    if queries:
+        sql, duration = max(queries, key=lambda query: query[1])
+        parts.append(f'slowest: {duration * 1000:.1f} ms {sql[:SQL_PREVIEW_CHARS]}')
+    return '; '.join(parts)
+
+
+class SQLProfilerMiddleware:
+    """Profiles sampled or slow requests; see the module docstring for settings."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = start()
+        began = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            finish(started, f'{request.method} {view_name(request)}', time.perf_counter() - began)
+
+    async def __acall__(self, request):
+        started = start()
+        began = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            finish(started, f'{request.method} {view_name(request)}', time.perf_counter() - began)
+
+
+# --- Celery ---
+
+_task_profiles = {}
+
+
+@task_prerun.connect(dispatch_uid='backend.profiling.task_prerun')
+def _task_prerun(task_id=None, **kwargs):
+    started = start()
+    if started is not None:
+        _task_profiles[task_id] = (started, time.perf_counter())
+
+
+@task_postrun.connect(dispatch_uid='backend.profiling.task_postrun')
+def _task_postrun(task_id=None, task=None, **kwargs):
+    entry = _task_profiles.pop(task_id, None)
+    if entry is not None:
+        started, began = entry
+        finish(started, f'task {task.name}', time.perf_counter() - began)
@@ -75,6 +75,9 @@ INSTALLED_APPS = [
 APPEND_SLASH=False
 
 MIDDLEWARE = [
+    # first, so latency covers the whole stack (backend.metrics)
+    'backend.metrics.MetricsMiddleware',
+    'backend.profiling.SQLProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -113,7 +116,8 @@ from datetime import timedelta
 REST_FRAMEWORK = {
     # Authentication
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with the user served from the cache
+        'users.authentication.CachedJWTAuthentication',
     ),
 
     # Permissions
@@ -123,8 +127,8 @@ REST_FRAMEWORK = {
 
     # Throttling
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'backend.throttling.AnonRateThrottle',
+        'backend.throttling.UserRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/minute',
@@ -157,8 +161,19 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # the users migrations swap the primary key under existing FKs and cannot
+        # be replayed on an empty database, so test databases are built from models
+        # (backend.testing.TestRunner adds the pg_trgm extension and indexes)
+        'TEST': {'MIGRATE': False},
     }
 }
+TEST_RUNNER = 'backend.testing.TestRunner'
+
+# pg_trgm lookups used by connections.search (trigram_word_similar) are only
+# registered when contrib.postgres is installed; it needs psycopg, so only
+# enable it when actually running on PostgreSQL.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
 
 
 # Password validation
@@ -231,8 +246,65 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Installed into django_celery_beat's DatabaseScheduler on beat start-up.
+CELERY_BEAT_SCHEDULE = {
+    'refresh-connection-suggestions': {
+        'task': 'connections.tasks.refresh_connection_suggestions',
+        'schedule': timedelta(minutes=5),
+    },
+    'rebuild-connection-suggestions': {
+        'task': 'connections.tasks.refresh_connection_suggestions',
+        'schedule': timedelta(days=1),
+        'kwargs': {'full': True},
+    },
+    'relay-notification-outbox': {
+        'task': 'notifications.tasks.relay_notification_outbox',
+        'schedule': timedelta(seconds=2),
+    },
+    'purge-notification-outbox': {
+        'task': 'notifications.tasks.purge_notification_outbox',
+        'schedule': timedelta(days=1),
+    },
+    'reconcile-unread-counters': {
+        'task': 'notifications.tasks.reconcile_unread_counters',
+        'schedule': timedelta(hours=1),
+    },
+    'resume-stalled-broadcasts': {
+        'task': 'notifications.tasks.resume_stalled_broadcasts',
+        'schedule': timedelta(minutes=1),
+    },
+    'rebuild-connection-graph': {
+        'task': 'connections.tasks.rebuild_connection_graph',
+        'schedule': timedelta(hours=1),
+    },
+}
+CONNECTION_SUGGESTIONS_TOP_K = 50
+# CSR snapshot used by the degrees-of-separation endpoint; must be on storage
+# shared by every web worker on a host (the file is memory-mapped read-only)
+CONNECTION_GRAPH_PATH = os.getenv('CONNECTION_GRAPH_PATH', str(BASE_DIR / 'var' / 'connection_graph.csr'))
+CONNECTION_PATH_MAX_HOPS = 6
+# -------- Metrics (backend.metrics) ----------
+# shared by the worker processes of a host; unset for a single process
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+# GET /metrics requires "Authorization: Bearer <token>"; unset, it is only
+# served with DEBUG on
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# -------- SQL profiler (backend.profiling) ----------
+# fraction of requests and tasks whose queries are logged
+SQL_PROFILE_SAMPLE_RATE = float(os.getenv('SQL_PROFILE_SAMPLE_RATE', '0'))
+# also log every request/task slower than this (times all queries); unset = off
+_slow_request_ms = os.getenv('SQL_PROFILE_SLOW_REQUEST_MS')
+SQL_PROFILE_SLOW_REQUEST_MS = float(_slow_request_ms) if _slow_request_ms else None
+# captured queries at least this slow are logged individually
+SQL_PROFILE_SLOW_QUERY_MS = float(os.getenv('SQL_PROFILE_SLOW_QUERY_MS', '100'))
 # -------- Channels / ASGI ----------
-ASGI_APPLICATION = 'user_backend.asgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [REDIS_URL]},
+    },
+}
 
 # Hard-coded cache settings (no env lookups)
 CACHES = {
@@ -259,4 +331,9 @@ LOGGING.setdefault('loggers', {})['users.utils'] = {
     'handlers': ['console'],
     'level': 'INFO',
     'propagate': False,
-}
\ No newline at end of file
+}
+LOGGING['loggers']['backend.profiling'] = {
+    'handlers': ['console'],
+    'level': 'INFO',
+    'propagate': False,
+}
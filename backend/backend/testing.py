@@ -0,0 +1,210 @@
+# backend/testing.py
+"""
+Shared helpers for the per-app API test suites.
+
+`QueryBudgetAPITestCase` seeds a small but realistic social graph, talks to the
+API with real Bearer tokens (so authentication queries are counted) and
+provides `assertQueryBudget`, which fails when an endpoint issues more SQL
+queries than its budget and records the wall-clock latency of every call.
+
+The suites run on whatever database DB_ENGINE points at, e.g.:
+
+    DB_ENGINE=django.db.backends.sqlite3 python manage.py test     # local
+    python manage.py test                                          # PostgreSQL from .env
+
+Set QUERY_BUDGET_SCALE to seed a larger dataset (e.g. 10) and
+QUERY_BUDGET_REPORT=<path> to append the recorded timings as JSON lines.
+
+Test databases are built from the models (DATABASES TEST MIGRATE is off), so
+`TestRunner` adds what the skipped migrations would have created and the
+tests rely on: the pg_trgm extension and the search trigram indexes.
+"""
+import importlib
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models.signals import post_migrate
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from backend.celery_app import app as celery_app
+from connections.models import Connection, ConnectionRequest
+from connections.utils import sync_connection_edges
+from notifications import counters
+from notifications.models import Notification
+
+User = get_user_model()
+
+TEST_PASSWORD = 'Str0ng-test-pass!'
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+TEST_CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
+
+
+def _create_search_indexes(sender, using, **kwargs):
+    migration = importlib.import_module('users.migrations.0003_user_search_trigram_indexes')
+    with connections[using].schema_editor(atomic=False) as schema_editor:
+        migration.create_trigram_indexes(None, schema_editor)
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner that also creates the pg_trgm extension and indexes on PostgreSQL."""
+
+    def setup_databases(self, **kwargs):
+        # post_migrate is sent by the syncdb run that builds each test
+        # database, before it is cloned for --parallel
+        users_app = apps.get_app_config('users')
+        post_migrate.connect(_create_search_indexes, sender=users_app, dispatch_uid='backend.testing.search_indexes')
+        try:
+            return super().setup_databases(**kwargs)
+        finally:
+            post_migrate.disconnect(sender=users_app, dispatch_uid='backend.testing.search_indexes')
+
+
+def seed_social_graph(users=60, connections_per_user=6, pending_per_user=2,
+                      notifications_per_user=15, seed=1234):
+    """
+    Create a deterministic social graph and return the list of users.
+
+    User 0 is the "power user" every endpoint is exercised as: it gets extra
+    connections, incoming/outgoing pending requests and a notification backlog.
+    Rows are inserted with bulk_create and a single pre-hashed password.
+    """
+    rng = random.Random(seed)
+    password = make_password(TEST_PASSWORD)
+    people = User.objects.bulk_create([
+        User(
+            user_id=f'SPC-20250101-{index:06x}',
+            username=f'user{index}',
+            email=f'user{index}@example.com',
+            full_name=f'Test User {index}',
+            contact=f'+9779800{index:06d}',
+            company_name=rng.choice(['Acme', 'Globex', 'Initech', 'Umbrella', '']),
+            industry=rng.choice(['Software', 'Finance', 'Health', '']),
+            password=password,
+        )
+        for index in range(users)
+    ])
+
+    pairs = set()
+    for index, person in enumerate(people):
+        wanted = connections_per_user * (3 if index == 0 else 1)
+        for other in rng.sample(people, min(wanted, users - 1)):
+            if other.user_id != person.user_id:
+                pairs.add(tuple(sorted((person.user_id, other.user_id))))
+    Connection.objects.bulk_create(
+        [Connection(user1_id=a, user2_id=b) for a, b in sorted(pairs)]
+    )
+    sync_connection_edges()
+
+    requested = set()
+    requests = []
+    for index, person in enumerate(people):
+        wanted = pending_per_user * (5 if index == 0 else 1)
+        for other in rng.sample(people, min(wanted * 3, users - 1)):
+            pair = tuple(sorted((person.user_id, other.user_id)))
+            if other.user_id == person.user_id or pair in pairs or pair in requested:
+                continue
+            # the power user receives its requests, everyone else sends theirs
+            sender, receiver = (other, person) if index == 0 else (person, other)
+            requested.add(pair)
+            requests.append(ConnectionRequest(from_user=sender, to_user=receiver))
+            wanted -= 1
+            if wanted <= 0:
+                break
+    ConnectionRequest.objects.bulk_create(requests)
+
+    Notification.objects.bulk_create([
+        Notification(
+            recipient=person,
+            actor=rng.choice(people),
+            verb='accepted your connection request',
+            message='Someone accepted your connection request.',
+            read=rng.random() < 0.3,
+        )
+        for index, person in enumerate(people)
+        for _ in range(notifications_per_user * (4 if index == 0 else 1))
+    ])
+    # bulk_create bypasses the maintained unread counters
+    counters.backfill()
+    return people
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class QueryBudgetAPITestCase(APITestCase):
+    """Base class for endpoint tests that assert a per-request SQL query budget."""
+
+    scale = int(os.getenv('QUERY_BUDGET_SCALE', '1'))
+    report_path = os.getenv('QUERY_BUDGET_REPORT')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.timings = []
+        # run Celery tasks inline so their queries are part of the request budget
+        cls._celery_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    @classmethod
+    def tearDownClass(cls):
+        celery_app.conf.task_always_eager = cls._celery_eager
+        if cls.report_path and cls.timings:
+            with open(cls.report_path, 'a', encoding='utf-8') as fh:
+                for row in cls.timings:
+                    fh.write(json.dumps(row) + '\n')
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_social_graph(
+            users=60 * cls.scale,
+            notifications_per_user=15 * cls.scale,
+        )
+        cls.user = cls.users[0]
+
+    def setUp(self):
+        # throttle history lives in the cache
+        cache.clear()
+        self.client = self.client_for(self.user)
+
+    @staticmethod
+    def client_for(user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {SlidingToken.for_user(user)}')
+        return client
+
+    @contextmanager
+    def assertQueryBudget(self, budget, label):
+        """Fail if the block runs more than `budget` queries; record its latency."""
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            yield ctx
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        type(self).timings.append({
+            'endpoint': label,
+            'queries': len(ctx.captured_queries),
+            'budget': budget,
+            'ms': round(elapsed_ms, 3),
+            'vendor': connection.vendor,
+            'scale': self.scale,
+        })
+        executed = '\n'.join(q['sql'] for q in ctx.captured_queries)
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            f'{label}: {len(ctx.captured_queries)} queries (budget {budget})\n{executed}',
+        )
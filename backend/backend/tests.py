@@ -0,0 +1,164 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework.throttling import BaseThrottle
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from backend import metrics
+from backend.profiling import fingerprint
+from backend.testing import TEST_CACHES, TEST_PASSWORD, QueryBudgetAPITestCase
+from notifications import outbox as notification_outbox
+from notifications.tasks import relay_notification_outbox
+
+
+def sample(text, line_prefix):
+    """Value of the first exposition line starting with `line_prefix`."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(QueryBudgetAPITestCase):
+
+    def scrape(self):
+        response = self.client_class().get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_http_requests_are_recorded_per_view(self):
+        labels = 'view="NotificationViewSet.list",method="GET"'
+        before = self.scrape()
+        with self.assertQueryBudget(2, 'GET /api/notifications/notifications/') as ctx:
+            self.client.get('/api/notifications/notifications/')
+        queries = len(ctx.captured_queries)  # read before the next request resets the log
+        text = self.scrape()
+        for suffix, added in (('count', 1), ('sum', queries)):
+            line = f'http_request_db_queries_{suffix}{{{labels}}}'
+            self.assertEqual(sample(text, line), (sample(before, line) or 0) + added)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},status="200",le="+Inf"}}', text)
+
+        # function views are named by their dotted path
+        self.client.get('/api/connections/search/?q=user1')
+        self.assertIn('http_request_db_queries_bucket{view="connections.views.search_users"', self.scrape())
+
+    def test_celery_tasks_are_recorded(self):
+        relay_notification_outbox.delay()
+        text = self.scrape()
+        self.assertGreaterEqual(sample(
+            text,
+            'celery_task_duration_seconds_count{task="notifications.tasks.relay_notification_outbox",state="SUCCESS"}',
+        ), 1)
+
+    def test_token_is_required_when_configured(self):
+        client = self.client_class()
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_without_a_token_only_debug_is_served(self):
+        self.assertEqual(self.client_class().get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client_class().get('/metrics').status_code, 200)
+
+    def test_snapshots_of_all_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            dead_pid = 2 ** 22 + 1  # above the highest possible pid_max, so never alive
+            with open(os.path.join(directory, f'{dead_pid}.json'), 'w', encoding='utf-8') as fh:
+                json.dump({
+                    'celery_task_failures_total': {'["x.task"]': 2},
+                    'websocket_connections': {'[]': 50},
+                }, fh)
+            metrics.CELERY_TASK_FAILURES.inc(task='x.task')
+            text = self.scrape()
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+        own = metrics.CELERY_TASK_FAILURES.values[('x.task',)]
+        self.assertEqual(sample(text, 'celery_task_failures_total{task="x.task"}'), own + 2)
+        # gauges of exited workers are dropped
+        self.assertEqual(
+            sample(text, 'websocket_connections ') or 0, metrics.WEBSOCKET_CONNECTIONS.values.get((), 0),
+        )
+
+
+class FingerprintTests(SimpleTestCase):
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) AND "n" = 42 AND "s" = \'x\''),
+            fingerprint('SELECT  "a" FROM "t" WHERE "id" IN (%s) AND "n" = 7 AND "s" = \'it\'\'s\''),
+        )
+
+
+class SQLProfilerTests(QueryBudgetAPITestCase):
+
+    def test_unsampled_requests_are_not_profiled(self):
+        with self.assertNoLogs('backend.profiling'):
+            self.client.get('/api/notifications/notifications/')
+
+    @override_settings(SQL_PROFILE_SAMPLE_RATE=1.0, SQL_PROFILE_SLOW_QUERY_MS=10 ** 6)
+    def test_sampled_request_is_reported(self):
+        with self.assertLogs('backend.profiling', 'INFO') as logs:
+            self.client.get('/api/notifications/notifications/')
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertIn('SQL profile GET NotificationViewSet.list:', logs.output[0])
+        self.assertIn('slowest:', logs.output[0])
+
+    @override_settings(SQL_PROFILE_SLOW_REQUEST_MS=0, SQL_PROFILE_SLOW_QUERY_MS=0)
+    def test_slow_task_and_queries_are_logged(self):
+        notification_outbox.enqueue([
+            {'recipient_id': user.pk, 'actor_id': self.user.pk, 'action': 'posted'} for user in self.users[1:4]
+        ])
+        with self.assertLogs('backend.profiling', 'INFO') as logs:
+            relay_notification_outbox.delay()
+        report = logs.output[-1]
+        self.assertTrue(report.startswith('WARNING:backend.profiling:SQL profile task notifications.tasks.relay_notification_outbox'))
+        self.assertTrue(any('slow query in task' in line for line in logs.output[:-1]))
+
+
+class RecordingThrottle(BaseThrottle):
+    views = []
+
+    def allow_request(self, request, view):
+        self.views.append(view)
+        return True
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncAPIViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('async-view', 'async-view@example.com', TEST_PASSWORD)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {SlidingToken.for_user(self.user)}')
+
+    def test_other_methods_are_not_allowed(self):
+        self.assertEqual(self.client.get('/api/connections/search/?q=ab').status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/connections/search/?q=ab')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(response.json(), {'detail': 'Method "POST" not allowed.'})
+        self.assertEqual(response['Allow'], 'GET, HEAD')
+        # authentication still comes first
+        self.assertEqual(self.client_class().post('/api/connections/search/?q=ab').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_throttles_get_a_view(self):
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': ['backend.tests.RecordingThrottle']}
+        RecordingThrottle.views.clear()
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            self.client.get('/api/connections/search/?q=ab')
+        view, = RecordingThrottle.views
+        self.assertIsNone(getattr(view, 'throttle_scope', None))
+        self.assertEqual(view.get_view_name(), 'search_users')
+        self.assertEqual(view.request.user, self.user)
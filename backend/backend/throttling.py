@@ -0,0 +1,116 @@
+# backend/throttling.py
+"""
+Sliding-window throttles with one cache round trip per request.
+
+DRF's SimpleRateThrottle keeps a list of timestamps per client in the cache
+and reads, trims and writes it back on every request: two round trips, the
+list pickled each way, and concurrent requests on other workers overwrite
+each other's history. Here the whole check runs as one Lua script on a Redis
+sorted set, so limits are exact under concurrency. The script trims entries
+older than the window, counts the rest and records the request only if it is
+allowed. Timestamps come from the Redis clock, so web servers with skewed
+clocks agree.
+
+With any other cache backend (locmem in tests) the same window is kept as a
+timestamp list through the regular cache API, guarded by a process lock.
+
+The rates, scopes and cache keys are DRF's; only the storage changes.
+"""
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from rest_framework import throttling
+
+CACHE_ALIAS = 'default'
+
+_HIT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('zremrangebyscore', KEYS[1], '-inf', now - window)
+local count = redis.call('zcard', KEYS[1])
+if count < limit then
+    redis.call('zadd', KEYS[1], now, ARGV[3])
+    redis.call('pexpire', KEYS[1], window)
+    return 0
+end
+local oldest = redis.call('zrange', KEYS[1], 0, 0, 'WITHSCORES')
+return tonumber(oldest[2]) + window - now
+"""
+
+
+class _LocalWindows:
+    """Timestamp lists stored through the Django cache API (non-Redis backends)."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def hit(self, key, limit, duration):
+        """Record a request if allowed; returns seconds to wait, 0 when allowed."""
+        now = time.time()
+        with self._lock:
+            history = [ts for ts in self.cache.get(key, []) if ts > now - duration]
+            if len(history) >= limit:
+                return max(history[0] + duration - now, 0.001)
+            history.append(now)
+            self.cache.set(key, history, duration)
+        return 0
+
+
+class _RedisWindows:
+    """Sorted sets on the django_redis connection, one script call per request."""
+
+    _script = None
+
+    def __init__(self, cache):
+        from django_redis import get_redis_connection
+
+        self.cache = cache
+        self.client = get_redis_connection(CACHE_ALIAS)
+        if _RedisWindows._script is None:
+            _RedisWindows._script = self.client.register_script(_HIT)
+
+    def hit(self, key, limit, duration):
+        wait_ms = self._script(
+            keys=[self.cache.make_and_validate_key(key)],
+            args=[int(duration * 1000), limit, uuid.uuid4().hex],
+        )
+        return int(wait_ms) / 1000
+
+
+def _windows():
+    cache = caches[CACHE_ALIAS]
+    if type(cache).__module__.startswith('django_redis'):
+        return _RedisWindows(cache)
+    return _LocalWindows(cache)
+
+
+class SlidingWindowThrottleMixin:
+    """Replaces SimpleRateThrottle's cache history with a single atomic hit()."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.retry_after = _windows().hit(self.key, self.num_requests, self.duration)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonRateThrottle(SlidingWindowThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowThrottleMixin, throttling.UserRateThrottle):
+    pass
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from backend.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/users/', include('users.urls')), 
     path('api/connections/', include('connections.urls')), 
     path('api/notifications/', include('notifications.urls')), 
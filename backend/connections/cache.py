@@ -0,0 +1,268 @@
+# connections/cache.py
+"""
+Per-user relationship sets kept in the default cache.
+
+For every user we cache two sets of user ids:
+- connected: the user's connections (peers of their ConnectionEdge rows)
+- pending:   users they have a pending outgoing ConnectionRequest to
+
+Reads that miss rebuild the set from the database. Writes go through the
+helpers at the bottom of this module, which update a cached set in place
+(after the surrounding transaction commits) and leave cold sets alone so the
+next read rebuilds them.
+
+Every write also bumps a per-set generation counter. A rebuild reads the
+generation before loading from the database and stores its result only if
+the generation is unchanged, so a write that lands between the load and the
+store cannot leave a stale set cached for CACHE_TTL.
+
+With django_redis the sets are native Redis sets and every check or update is
+one atomic round trip (a small Lua script); any other cache backend (locmem in
+tests) stores Python frozensets through the regular cache API.
+"""
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import ConnectionEdge, ConnectionRequest
+
+CACHE_ALIAS = 'default'
+CACHE_TTL = 60 * 60 * 6
+KEY_VERSION = 1
+
+# Redis drops empty sets, so every cached set carries this member to tell
+# "loaded and empty" apart from "not cached"
+_LOADED = '__loaded__'
+
+_CONTAINS = """
+if redis.call('exists', KEYS[1]) == 0 then return -1 end
+return redis.call('sismember', KEYS[1], ARGV[1])
+"""
+# KEYS: set, generation; ARGV: expected generation, ttl, members...
+_REPLACE_IF_CURRENT = """
+if (redis.call('get', KEYS[2]) or '0') ~= ARGV[1] then return 0 end
+redis.call('del', KEYS[1])
+for i = 3, #ARGV, 1000 do
+  redis.call('sadd', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('expire', KEYS[1], ARGV[2])
+return 1
+"""
+# KEYS: set, generation; ARGV: ttl, members...
+_ADD_IF_LOADED = """
+redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[1])
+if redis.call('exists', KEYS[1]) == 0 then return 0 end
+redis.call('sadd', KEYS[1], unpack(ARGV, 2))
+return 1
+"""
+_REMOVE_IF_LOADED = """
+redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[1])
+if redis.call('exists', KEYS[1]) == 0 then return 0 end
+redis.call('srem', KEYS[1], unpack(ARGV, 2))
+return 1
+"""
+
+
+def _generation_key(key):
+    return f'{key}:gen'
+
+
+class _LocalSets:
+    """Frozensets stored through the Django cache API (non-Redis backends)."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def contains(self, key, member):
+        members = self.cache.get(key)
+        return None if members is None else member in members
+
+    def members(self, key):
+        return self.cache.get(key)
+
+    def generation(self, key):
+        return self.cache.get(_generation_key(key), 0)
+
+    def replace(self, key, members, generation):
+        if self.generation(key) == generation:
+            self.cache.set(key, frozenset(members), CACHE_TTL)
+
+    def _bump(self, key):
+        gen_key = _generation_key(key)
+        self.cache.set(gen_key, self.cache.get(gen_key, 0) + 1, CACHE_TTL)
+
+    def add(self, key, members):
+        self._bump(key)
+        current = self.cache.get(key)
+        if current is not None:
+            self.cache.set(key, current | frozenset(members), CACHE_TTL)
+
+    def remove(self, key, members):
+        self._bump(key)
+        current = self.cache.get(key)
+        if current is not None:
+            self.cache.set(key, current - frozenset(members), CACHE_TTL)
+
+
+class _RedisSets:
+    """Native Redis sets on the django_redis connection."""
+
+    _scripts = {}
+
+    def __init__(self, cache):
+        from django_redis import get_redis_connection
+
+        self.cache = cache
+        self.client = get_redis_connection(CACHE_ALIAS)
+
+    def _script(self, source):
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.client.register_script(source)
+        return script
+
+    def _keys(self, key):
+        # honour KEY_PREFIX / VERSION like the regular cache API does
+        return [self.cache.make_and_validate_key(key), self.cache.make_and_validate_key(_generation_key(key))]
+
+    def contains(self, key, member):
+        found = self._script(_CONTAINS)(keys=self._keys(key)[:1], args=[member])
+        return None if found == -1 else bool(found)
+
+    def members(self, key):
+        raw = self.client.smembers(self._keys(key)[0])
+        if not raw:
+            return None
+        return frozenset(m.decode() for m in raw) - {_LOADED}
+
+    def generation(self, key):
+        return int(self.client.get(self._keys(key)[1]) or 0)
+
+    def replace(self, key, members, generation):
+        self._script(_REPLACE_IF_CURRENT)(
+            keys=self._keys(key), args=[str(generation), CACHE_TTL, _LOADED, *members],
+        )
+
+    def add(self, key, members):
+        if members:
+            self._script(_ADD_IF_LOADED)(keys=self._keys(key), args=[CACHE_TTL, *members])
+
+    def remove(self, key, members):
+        if members:
+            self._script(_REMOVE_IF_LOADED)(keys=self._keys(key), args=[CACHE_TTL, *members])
+
+
+def _sets():
+    cache = caches[CACHE_ALIAS]
+    if type(cache).__module__.startswith('django_redis'):
+        return _RedisSets(cache)
+    return _LocalSets(cache)
+
+
+def _connected_key(user_id):
+    return f'connections:v{KEY_VERSION}:{user_id}:connected'
+
+
+def _pending_key(user_id):
+    return f'connections:v{KEY_VERSION}:{user_id}:pending'
+
+
+def _load_connected(user_id):
+    return ConnectionEdge.objects.filter(user_id=user_id).values_list('peer_id', flat=True)
+
+
+def _load_pending(user_id):
+    return ConnectionRequest.objects.filter(
+        from_user_id=user_id, status=ConnectionRequest.STATUS_PENDING
+    ).values_list('to_user_id', flat=True)
+
+
+def _rebuild(sets, key, loader, user_id):
+    generation = sets.generation(key)
+    members = frozenset(loader(user_id))
+    sets.replace(key, members, generation)
+    return members
+
+
+def _members(key, loader, user_id):
+    sets = _sets()
+    members = sets.members(key)
+    if members is None:
+        members = _rebuild(sets, key, loader, user_id)
+    return members
+
+
+def _contains(key, loader, user_id, member):
+    sets = _sets()
+    found = sets.contains(key, member)
+    if found is None:
+        found = member in _rebuild(sets, key, loader, user_id)
+    return found
+
+
+# --- reads ---
+
+def connected_ids(user_id):
+    """Return the ids of every user connected to `user_id`."""
+    return _members(_connected_key(user_id), _load_connected, user_id)
+
+
+def pending_ids(user_id):
+    """Return the ids of users `user_id` has a pending outgoing request to."""
+    return _members(_pending_key(user_id), _load_pending, user_id)
+
+
+def is_connected(user_id, other_id):
+    return _contains(_connected_key(user_id), _load_connected, user_id, other_id)
+
+
+def has_pending_request(from_user_id, to_user_id):
+    return _contains(_pending_key(from_user_id), _load_pending, from_user_id, to_user_id)
+
+
+# --- write-through (applied once the current transaction commits) ---
+
+def connections_added(pairs):
+    """Record new connections; `pairs` is an iterable of (user_id, user_id)."""
+    pairs = list(pairs)
+
+    def apply():
+        sets = _sets()
+        for a, b in pairs:
+            sets.add(_connected_key(a), [b])
+            sets.add(_connected_key(b), [a])
+    transaction.on_commit(apply)
+
+
+def connections_removed(pairs):
+    pairs = list(pairs)
+
+    def apply():
+        sets = _sets()
+        for a, b in pairs:
+            sets.remove(_connected_key(a), [b])
+            sets.remove(_connected_key(b), [a])
+    transaction.on_commit(apply)
+
+
+def requests_created(pairs):
+    """Record new pending requests; `pairs` is an iterable of (from_user_id, to_user_id)."""
+    pairs = list(pairs)
+
+    def apply():
+        sets = _sets()
+        for from_id, to_id in pairs:
+            sets.add(_pending_key(from_id), [to_id])
+    transaction.on_commit(apply)
+
+
+def requests_resolved(pairs):
+    """Drop requests that stopped being pending (accepted, rejected or withdrawn)."""
+    pairs = list(pairs)
+
+    def apply():
+        sets = _sets()
+        for from_id, to_id in pairs:
+            sets.remove(_pending_key(from_id), [to_id])
+    transaction.on_commit(apply)
@@ -0,0 +1,433 @@
+# connections/graph.py
+"""
+Compressed sparse row (CSR) snapshot of the connection graph, used for
+degrees-of-separation queries.
+
+The snapshot is built from ConnectionEdge in streaming chunks and written to a
+single file that every worker process memory-maps read-only, so the arrays
+are shared through the page cache instead of being copied per process:
+
+    header | user ids (fixed width, sorted) | neighbours (int32) | offsets (int64)
+
+User ids are remapped to their position in the sorted id table; the
+neighbours of node i are neighbours[offsets[i]:offsets[i + 1]].
+
+The build reads the node table and the edges in one REPEATABLE READ
+transaction, so every edge it writes refers to a node in the table.
+
+Between rebuilds (connections.tasks.rebuild_connection_graph) each process
+keeps the snapshot current incrementally: edges with a higher primary key than
+the snapshot's watermark are added to an in-memory overlay, and a path that
+crosses a removed connection is rejected when it is verified against the
+database, with the search retried around it. Edges can commit out of primary
+key order, so each refresh also re-reads the OVERLAY_LOOKBACK keys below the
+watermark.
+
+Until a snapshot file exists, paths are searched in the database
+(`find_path_in_db`) and a rebuild is queued on Celery.
+"""
+import bisect
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+
+from .models import ConnectionEdge
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CSRG'
+FORMAT_VERSION = 1
+# magic, version, byte order, id width, nodes, neighbours, edge watermark, built_at,
+# then the byte offsets of the three sections
+HEADER = struct.Struct('<4sIBxxxIQQQdQQQ')
+BYTE_ORDER = {'little': 0, 'big': 1}[sys.byteorder]
+BUILD_CHUNK_SIZE = 20000
+# how often a process looks for new edges / a newer snapshot file
+REFRESH_INTERVAL_SECONDS = 30
+MAX_VERIFY_RETRIES = 3
+# edge keys below the watermark re-read by every refresh, for rows whose
+# transaction committed after a higher key was already seen
+OVERLAY_LOOKBACK = 2000
+
+
+def snapshot_path():
+    return Path(getattr(settings, 'CONNECTION_GRAPH_PATH', Path(settings.BASE_DIR) / 'var' / 'connection_graph.csr'))
+
+
+def _align(fh, boundary=8):
+    padding = -fh.tell() % boundary
+    if padding:
+        fh.write(b'\0' * padding)
+    return fh.tell()
+
+
+@contextmanager
+def _consistent_reads():
+    """One transaction in which every query sees the same snapshot of the data."""
+    # SQLite transactions are serializable already; inside an outer
+    # transaction its isolation level can no longer be changed
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def build_snapshot(path=None, chunk_size=BUILD_CHUNK_SIZE):
+    """
+    Build a snapshot from ConnectionEdge and atomically replace the file at
+    `path`. Edges are read in (user, peer) order in keyset-paginated chunks.
+    Returns the path written.
+    """
+    path = Path(path or snapshot_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _consistent_reads():
+        written, node_count = _write_snapshot(path, chunk_size)
+    logger.info("Connection graph snapshot written: %s nodes, %s edges -> %s", node_count, written, path)
+    return path
+
+
+def _write_snapshot(path, chunk_size):
+    watermark = ConnectionEdge.objects.aggregate(last=Max('pk'))['last'] or 0
+    edges = ConnectionEdge.objects.filter(pk__lte=watermark)
+
+    # pass 1: node table (every user with at least one edge), in id order
+    ids = []
+    last = ''
+    while True:
+        chunk = list(
+            edges.filter(user_id__gt=last).order_by('user_id')
+            .values_list('user_id', flat=True).distinct()[:chunk_size]
+        )
+        if not chunk:
+            break
+        ids.extend(chunk)
+        last = chunk[-1]
+    index = {user_id: position for position, user_id in enumerate(ids)}
+    width = max((len(user_id.encode()) for user_id in ids), default=1)
+
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(b'\0' * HEADER.size)
+            ids_at = _align(fh)
+            for user_id in ids:
+                fh.write(user_id.encode().ljust(width, b'\0'))
+
+            # pass 2: neighbour lists, streamed straight to the file
+            neighbours_at = _align(fh)
+            offsets = array('q', [0])
+            written = 0
+            current = 0
+            last_user, last_peer = '', ''
+            while True:
+                chunk = list(
+                    edges.filter(Q(user_id__gt=last_user) | Q(user_id=last_user, peer_id__gt=last_peer))
+                    .order_by('user_id', 'peer_id').values_list('user_id', 'peer_id')[:chunk_size]
+                )
+                if not chunk:
+                    break
+                block = array('i')
+                for user_id, peer_id in chunk:
+                    node = index[user_id]
+                    while current < node:
+                        offsets.append(written)
+                        current += 1
+                    block.append(index[peer_id])
+                    written += 1
+                fh.write(block.tobytes())
+                last_user, last_peer = chunk[-1]
+            while len(offsets) < len(ids) + 1:
+                offsets.append(written)
+
+            offsets_at = _align(fh)
+            fh.write(offsets.tobytes())
+            fh.seek(0)
+            fh.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, BYTE_ORDER, width, len(ids), written, watermark,
+                time.time(), ids_at, neighbours_at, offsets_at,
+            ))
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    return written, len(ids)
+
+
+class _IdTable:
+    """Sorted fixed-width id table viewed as a sequence (for bisect)."""
+
+    def __init__(self, buffer, width, count):
+        self.buffer = buffer
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        start = position * self.width
+        return bytes(self.buffer[start:start + self.width]).rstrip(b'\0')
+
+
+class CSRGraph:
+    """A memory-mapped snapshot plus an in-memory overlay of newer edges."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        (magic, version, byte_order, width, nodes, neighbours, watermark,
+         built_at, ids_at, neighbours_at, offsets_at) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or byte_order != BYTE_ORDER:
+            self.close()
+            raise ValueError(f'{self.path} is not a compatible connection graph snapshot')
+        self.mtime = os.stat(self.path).st_mtime
+        self.node_count = nodes
+        self.built_at = built_at
+        self.watermark = watermark
+        self.ids = _IdTable(view[ids_at:ids_at + width * nodes], width, nodes)
+        self.neighbours = view[neighbours_at:neighbours_at + 4 * neighbours].cast('i')
+        self.offsets = view[offsets_at:offsets_at + 8 * (nodes + 1)].cast('q')
+        # overlay: nodes/edges that appeared after the snapshot was built
+        self.extra_ids = []
+        self.extra_index = {}
+        # node -> frozenset of peers, replaced (never mutated) under the lock
+        # so searches can iterate them while a refresh runs
+        self.added = defaultdict(frozenset)
+        self.removed = set()
+        self.checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def close(self):
+        for resource in (getattr(self, '_map', None), getattr(self, '_file', None)):
+            try:
+                if resource is not None:
+                    resource.close()
+            except BufferError:
+                # memoryviews still referenced; the map is released when they are
+                pass
+
+    # --- id mapping ---
+
+    def node_of(self, user_id):
+        key = user_id.encode()
+        position = bisect.bisect_left(self.ids, key)
+        if position < self.node_count and self.ids[position] == key:
+            return position
+        return self.extra_index.get(user_id)
+
+    def user_of(self, node):
+        if node < self.node_count:
+            return self.ids[node].decode()
+        return self.extra_ids[node - self.node_count]
+
+    def _node_or_new(self, user_id):
+        node = self.node_of(user_id)
+        if node is None:
+            node = self.node_count + len(self.extra_ids)
+            self.extra_ids.append(user_id)
+            self.extra_index[user_id] = node
+        return node
+
+    # --- incremental refresh ---
+
+    def apply_new_edges(self):
+        """Pull edges created after the watermark (less OVERLAY_LOOKBACK) into the overlay."""
+        with self._lock:
+            rows = ConnectionEdge.objects.filter(pk__gt=self.watermark - OVERLAY_LOOKBACK).order_by('pk') \
+                .values_list('pk', 'user_id', 'peer_id')
+            for pk, user_id, peer_id in rows.iterator(chunk_size=BUILD_CHUNK_SIZE):
+                a, b = self._node_or_new(user_id), self._node_or_new(peer_id)
+                if b not in self.added[a] and not self._in_snapshot(a, b):
+                    self.added[a] = self.added[a] | {b}
+                self.removed.discard((a, b))
+                self.watermark = max(self.watermark, pk)
+            self.checked_at = time.monotonic()
+
+    def _in_snapshot(self, a, b):
+        if a >= self.node_count or b >= self.node_count:
+            return False
+        row = self.neighbours[self.offsets[a]:self.offsets[a + 1]]
+        # neighbour lists are sorted by peer id, which is the node order
+        position = bisect.bisect_left(row, b)
+        return position < len(row) and row[position] == b
+
+    # --- search ---
+
+    def neighbours_of(self, node):
+        if node < self.node_count:
+            found = self.neighbours[self.offsets[node]:self.offsets[node + 1]]
+        else:
+            found = ()
+        extra = self.added.get(node)
+        if extra:
+            found = list(found) + list(extra)
+        if self.removed:
+            return [peer for peer in found if (node, peer) not in self.removed]
+        return found
+
+    def shortest_path(self, source, target, max_hops):
+        """Bidirectional BFS over node ids; returns the node path or None."""
+        if source == target:
+            return [source]
+        parents = ({source: None}, {target: None})
+        frontiers = ([source], [target])
+        depth = 0
+        while frontiers[0] and frontiers[1] and depth < max_hops:
+            # expand the smaller side
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            own, other = parents[side], parents[1 - side]
+            next_frontier = []
+            for node in frontiers[side]:
+                for peer in self.neighbours_of(node):
+                    if peer in own:
+                        continue
+                    own[peer] = node
+                    if peer in other:
+                        return self._join(parents, peer)
+                    next_frontier.append(peer)
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+            depth += 1
+        return None
+
+    @staticmethod
+    def _join(parents, meeting):
+        forward, backward = parents
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = forward[node]
+        path.reverse()
+        node = backward[meeting]
+        while node is not None:
+            path.append(node)
+            node = backward[node]
+        return path
+
+    def find_path(self, source_id, target_id, max_hops):
+        """
+        Shortest path between two user ids as a list of user ids (or None).
+        The hops are verified against ConnectionEdge; hops that no longer
+        exist are excluded and the search is retried.
+        """
+        source, target = self.node_of(source_id), self.node_of(target_id)
+        if source is None or target is None:
+            return [source_id] if source_id == target_id else None
+        for _ in range(MAX_VERIFY_RETRIES + 1):
+            nodes = self.shortest_path(source, target, max_hops)
+            if nodes is None:
+                return None
+            path = [self.user_of(node) for node in nodes]
+            missing = self._missing_hops(path)
+            if not missing:
+                return path
+            with self._lock:
+                for a, b in missing:
+                    self.removed.add((self.node_of(a), self.node_of(b)))
+                    self.removed.add((self.node_of(b), self.node_of(a)))
+        return None
+
+    @staticmethod
+    def _missing_hops(path):
+        hops = list(zip(path, path[1:]))
+        if not hops:
+            return []
+        condition = Q()
+        for a, b in hops:
+            condition |= Q(user_id=a, peer_id=b)
+        present = set(ConnectionEdge.objects.filter(condition).values_list('user_id', 'peer_id'))
+        return [hop for hop in hops if hop not in present]
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_rebuild_requested_at = None
+
+
+def _request_rebuild():
+    """Queue a snapshot build, at most once per REFRESH_INTERVAL_SECONDS per process."""
+    global _rebuild_requested_at
+    now = time.monotonic()
+    if _rebuild_requested_at is not None and now - _rebuild_requested_at < REFRESH_INTERVAL_SECONDS:
+        return
+    _rebuild_requested_at = now
+    from .tasks import rebuild_connection_graph
+
+    rebuild_connection_graph.delay()
+
+
+def get_graph():
+    """
+    Return this process's graph, loading the snapshot file on first use,
+    switching to a newer file after a rebuild and pulling new edges at most
+    every REFRESH_INTERVAL_SECONDS. Returns None, and queues a build, while
+    no snapshot file exists.
+    """
+    global _graph
+    path = snapshot_path()
+    with _graph_lock:
+        if not path.exists():
+            logger.warning("No connection graph snapshot at %s; queueing a build", path)
+            _request_rebuild()
+            return None
+        if _graph is None or _graph.path != path or os.stat(path).st_mtime != _graph.mtime:
+            previous, _graph = _graph, CSRGraph(path)
+            if previous is not None:
+                previous.close()
+            _graph.apply_new_edges()
+        elif time.monotonic() - _graph.checked_at >= REFRESH_INTERVAL_SECONDS:
+            _graph.apply_new_edges()
+        return _graph
+
+
+def find_path_in_db(source_id, target_id, max_hops):
+    """
+    Bidirectional BFS over ConnectionEdge, one query per expanded level.
+    Used while no snapshot exists; returns a list of user ids or None.
+    """
+    if source_id == target_id:
+        return [source_id]
+    parents = ({source_id: None}, {target_id: None})
+    frontiers = ([source_id], [target_id])
+    depth = 0
+    while frontiers[0] and frontiers[1] and depth < max_hops:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        own, other = parents[side], parents[1 - side]
+        next_frontier = []
+        rows = ConnectionEdge.objects.filter(user_id__in=frontiers[side]).order_by().values_list('user_id', 'peer_id')
+        for node, peer in rows.iterator(chunk_size=BUILD_CHUNK_SIZE):
+            if peer in own:
+                continue
+            own[peer] = node
+            if peer in other:
+                return CSRGraph._join(parents, peer)
+            next_frontier.append(peer)
+        frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        depth += 1
+    return None
+
+
+def find_path(source_id, target_id, max_hops):
+    """Shortest connection path between two users, from the snapshot when there is one."""
+    graph = get_graph()
+    if graph is None:
+        return find_path_in_db(source_id, target_id, max_hops)
+    return graph.find_path(source_id, target_id, max_hops)
@@ -0,0 +1,241 @@
+# connections/management/commands/seed_social_graph.py
+"""
+Generate a synthetic social graph for load testing.
+
+    python manage.py seed_social_graph --users 2000000 --avg-degree 30 --seed 7
+
+Everything is derived from --seed, so two runs with the same arguments produce
+the same users, edges, requests and notifications. Rows are streamed into the
+database with bulk_create in --batch-size chunks: only per-user weights (one
+float per user) are held in memory, never the rows themselves. AppUser.save()
+and per-user password hashing are bypassed; every seeded user shares one
+pre-hashed password.
+"""
+import bisect
+import itertools
+import math
+import random
+import time
+from array import array
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from connections.models import Connection, ConnectionRequest
+from connections.utils import sync_connection_edges
+from notifications import counters
+from notifications.models import Notification
+
+User = get_user_model()
+
+COMPANIES = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne', 'Wonka', '']
+INDUSTRIES = ['Software', 'Finance', 'Health', 'Retail', 'Education', 'Energy', '']
+FIRST_NAMES = ['Aarav', 'Sita', 'Ram', 'Maya', 'Hari', 'Gita', 'John', 'Jane', 'Alex', 'Priya']
+LAST_NAMES = ['Sharma', 'Shrestha', 'Thapa', 'Gurung', 'Smith', 'Khan', 'Lee', 'Rai', 'Karki']
+
+# user ids keep the SPC-YYYYMMDD-xxxxxx shape the API validates, under a date
+# that real registrations never use
+MAX_USERS = 16 ** 6
+
+
+class Command(BaseCommand):
+    help = 'Seed a deterministic power-law social graph (users, connections, requests, notifications).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--avg-degree', type=float, default=20.0,
+                            help='Target mean number of connections per user.')
+        parser.add_argument('--alpha', type=float, default=2.5,
+                            help='Power-law exponent of the degree distribution (> 2).')
+        parser.add_argument('--max-degree', type=int, default=5000)
+        parser.add_argument('--pending', type=float, default=2.0,
+                            help='Mean pending requests sent per user.')
+        parser.add_argument('--rejected', type=float, default=1.0,
+                            help='Mean rejected requests sent per user.')
+        parser.add_argument('--notifications', type=float, default=10.0,
+                            help='Mean notification backlog per user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--password', default='seeded-password')
+        parser.add_argument('--id-date', default='20000101',
+                            help='Date segment used in generated user ids.')
+
+    def handle(self, *args, **opts):
+        n = opts['users']
+        if not 1 < n <= MAX_USERS:
+            raise CommandError(f'--users must be between 2 and {MAX_USERS}.')
+        if opts['alpha'] <= 2:
+            raise CommandError('--alpha must be greater than 2 for a finite mean degree.')
+
+        self.opts = opts
+        self.batch_size = opts['batch_size']
+        self.rng = random.Random(opts['seed'])
+        self.id_prefix = f"SPC-{opts['id_date']}-"
+        started = time.monotonic()
+
+        self.seed_users(n)
+        cumulative = self.build_weights(n)
+        self.seed_connections(n, cumulative)
+        self.seed_requests(n)
+        self.seed_notifications(n)
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded graph in {time.monotonic() - started:.1f}s'))
+
+    # --- helpers ---
+
+    def user_id(self, index):
+        return f'{self.id_prefix}{index:06x}'
+
+    def insert(self, model, rows, label):
+        """Stream `rows` into `model` in batches; returns the number of rows sent."""
+        total = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size, ignore_conflicts=True)
+            total += len(batch)
+            self.stdout.write(f'  {label}: {total}', ending='\r')
+        self.stdout.write(f'  {label}: {total}')
+        return total
+
+    def poisson(self, mean):
+        # Knuth's method; means here are small (a handful of rows per user)
+        limit, k, p = math.exp(-mean), 0, 1.0
+        while True:
+            p *= self.rng.random()
+            if p <= limit:
+                return k
+            k += 1
+
+    # --- stages ---
+
+    def seed_users(self, n):
+        password = make_password(self.opts['password'])
+        rng = self.rng
+
+        def rows():
+            for index in range(n):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                yield User(
+                    user_id=self.user_id(index),
+                    username=f'seed_{index}',
+                    email=f'seed_{index}@example.test',
+                    full_name=f'{first} {last}',
+                    contact=f'+1{index:010d}',
+                    company_name=rng.choice(COMPANIES),
+                    industry=rng.choice(INDUSTRIES),
+                    password=password,
+                )
+
+        self.insert(User, rows(), 'users')
+
+    def build_weights(self, n):
+        """
+        Draw a Pareto(alpha) weight per user and return the cumulative weights,
+        used to pick edge endpoints with probability proportional to weight
+        (Chung-Lu model), which yields a power-law degree distribution.
+        """
+        exponent = -1.0 / (self.opts['alpha'] - 1.0)
+        cumulative = array('d')
+        running = 0.0
+        for _ in range(n):
+            running += (1.0 - self.rng.random()) ** exponent
+            cumulative.append(running)
+        return cumulative
+
+    def seed_connections(self, n, cumulative):
+        rng = self.rng
+        total_weight = cumulative[-1]
+        # each edge adds one to the degree of both endpoints
+        edges_per_weight = self.opts['avg_degree'] * n / (2.0 * total_weight)
+        max_degree = self.opts['max_degree']
+
+        def pick():
+            return bisect.bisect_left(cumulative, rng.random() * total_weight)
+
+        def rows():
+            previous = 0.0
+            for index in range(n):
+                weight = cumulative[index] - previous
+                previous = cumulative[index]
+                wanted = min(max_degree, int(weight * edges_per_weight + rng.random()))
+                seen = set()
+                for _ in range(wanted):
+                    other = pick()
+                    if other == index or other in seen:
+                        continue
+                    seen.add(other)
+                    a, b = sorted((self.user_id(index), self.user_id(other)))
+                    yield Connection(user1_id=a, user2_id=b)
+
+        self.insert(Connection, rows(), 'connections')
+        # bulk_create bypasses Connection.save(), which maintains the edges
+        visited = sync_connection_edges(batch_size=self.batch_size)
+        self.stdout.write(f'  connection edges synced for: {visited}')
+
+    def seed_requests(self, n):
+        rng = self.rng
+        statuses = (
+            (ConnectionRequest.STATUS_PENDING, self.opts['pending']),
+            (ConnectionRequest.STATUS_REJECTED, self.opts['rejected']),
+        )
+
+        def rows():
+            for index in range(n):
+                seen = set()
+                for status, mean in statuses:
+                    for _ in range(self.poisson(mean)):
+                        other = rng.randrange(n)
+                        if other == index or other in seen:
+                            continue
+                        seen.add(other)
+                        yield ConnectionRequest(
+                            from_user_id=self.user_id(index),
+                            to_user_id=self.user_id(other),
+                            status=status,
+                        )
+
+        self.insert(ConnectionRequest, rows(), 'requests')
+
+        # a pending request between already-connected users is not a state the
+        # API can produce; drop those in one set-based statement
+        connected = Connection.objects.filter(
+            Q(user1=OuterRef('from_user'), user2=OuterRef('to_user'))
+            | Q(user1=OuterRef('to_user'), user2=OuterRef('from_user'))
+        )
+        removed, _ = ConnectionRequest.objects.filter(
+            from_user__user_id__startswith=self.id_prefix,
+            status=ConnectionRequest.STATUS_PENDING,
+        ).filter(Exists(connected)).delete()
+        self.stdout.write(f'  requests between connected users removed: {removed}')
+
+    def seed_notifications(self, n):
+        rng = self.rng
+        verbs = (
+            ('accepted your connection request', 'accepted your connection request.'),
+            ('rejected your connection request', 'rejected your connection request.'),
+        )
+
+        def rows():
+            for index in range(n):
+                for _ in range(self.poisson(self.opts['notifications'])):
+                    actor = rng.randrange(n)
+                    verb, text = rng.choice(verbs)
+                    yield Notification(
+                        recipient_id=self.user_id(index),
+                        actor_id=self.user_id(actor),
+                        verb=verb,
+                        message=f'seed_{actor} {text}',
+                        read=rng.random() < 0.5,
+                    )
+
+        self.insert(Notification, rows(), 'notifications')
+        # bulk_create bypasses the maintained unread counters
+        written = counters.backfill(batch_size=self.batch_size)
+        self.stdout.write(f'  unread counters written: {written}')
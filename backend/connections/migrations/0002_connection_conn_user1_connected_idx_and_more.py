@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(fields=['user1', '-connected_at', '-id'], name='conn_user1_connected_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(fields=['user2', '-connected_at', '-id'], name='conn_user2_connected_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connectionrequest',
+            index=models.Index(fields=['from_user', '-created_at', '-id'], name='conn_req_from_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connectionrequest',
+            index=models.Index(fields=['to_user', '-created_at', '-id'], name='conn_req_to_created_idx'),
+        ),
+    ]
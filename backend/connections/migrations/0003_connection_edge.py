@@ -0,0 +1,51 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_edges(apps, schema_editor):
+    Connection = apps.get_model('connections', 'Connection')
+    ConnectionEdge = apps.get_model('connections', 'ConnectionEdge')
+    last_pk = 0
+    while True:
+        batch = list(
+            Connection.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'user1_id', 'user2_id', 'connected_at')[:5000]
+        )
+        if not batch:
+            return
+        edges = []
+        for pk, user1_id, user2_id, connected_at in batch:
+            edges.append(ConnectionEdge(connection_id=pk, user_id=user1_id, peer_id=user2_id, connected_at=connected_at))
+            edges.append(ConnectionEdge(connection_id=pk, user_id=user2_id, peer_id=user1_id, connected_at=connected_at))
+        ConnectionEdge.objects.bulk_create(edges, ignore_conflicts=True)
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0002_connection_conn_user1_connected_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('connected_at', models.DateTimeField()),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edges', to='connections.connection')),
+                ('peer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='connection_edges', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'connections_edge',
+                'indexes': [models.Index(fields=['user', '-connected_at', '-connection'], name='conn_edge_user_connected_idx')],
+                'unique_together': {('user', 'peer')},
+            },
+        ),
+        migrations.RunPython(backfill_edges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0003_connection_edge'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mutual_count', models.PositiveIntegerField()),
+                ('shared_company', models.BooleanField(default=False)),
+                ('shared_industry', models.BooleanField(default=False)),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('suggested', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='connection_suggestions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'connections_suggestion',
+                'indexes': [models.Index(fields=['user', '-score', 'suggested'], name='conn_suggestion_rank_idx')],
+                'unique_together': {('user', 'suggested')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0004_connection_suggestion'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='connection',
+            name='conn_user1_connected_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='connection',
+            name='conn_user2_connected_idx',
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -36,6 +36,11 @@ class ConnectionRequest(models.Model):
         unique_together = ('from_user', 'to_user')
         ordering = ['-created_at']
         db_table = 'connections_request'
+        # composite indexes backing keyset pagination of incoming/outgoing requests
+        indexes = [
+            models.Index(fields=['from_user', '-created_at', '-id'], name='conn_req_from_created_idx'),
+            models.Index(fields=['to_user', '-created_at', '-id'], name='conn_req_to_created_idx'),
+        ]
 
     def clean(self):
         if self.from_user_id == self.to_user_id:
@@ -79,7 +84,99 @@ class Connection(models.Model):
         if self.user1_id and self.user2_id and self.user1_id > self.user2_id:
             self.user1, self.user2 = self.user2, self.user1
         self.clean()
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                # keep the symmetric adjacency rows in the same transaction
+                ConnectionEdge.objects.bulk_create(ConnectionEdge.for_connection(self))
+
+    def __str__(self):
+        return f"{self.user1} <> {self.user2}"
+
+
+class ConnectionEdge(models.Model):
+    """
+    Directed adjacency row for a Connection: every connection is stored once
+    per direction (user -> peer and peer -> user), so "connections of X" and
+    "are X and Y connected" are single index range scans on (user, ...)
+    instead of an OR over user1/user2.
+
+    Rows are created with their Connection (Connection.save, or
+    connections.utils.sync_connection_edges for bulk inserts) and removed with
+    it through the cascade.
+    """
+    connection = models.ForeignKey(
+        Connection,
+        related_name='edges',
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        User,
+        related_name='connection_edges',
+        on_delete=models.CASCADE,
+        to_field='user_id'
+    )
+    peer = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        to_field='user_id'
+    )
+    # copied from the connection so a user's neighbours can be listed newest
+    # first straight from the edge index
+    connected_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('user', 'peer'),)
+        db_table = 'connections_edge'
+        indexes = [
+            models.Index(fields=['user', '-connected_at', '-connection'], name='conn_edge_user_connected_idx'),
+        ]
+
+    @classmethod
+    def for_connection(cls, connection):
+        """Return the two (unsaved) directed edges for `connection`."""
+        return [
+            cls(connection_id=connection.pk, user_id=connection.user1_id,
+                peer_id=connection.user2_id, connected_at=connection.connected_at),
+            cls(connection_id=connection.pk, user_id=connection.user2_id,
+                peer_id=connection.user1_id, connected_at=connection.connected_at),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.peer_id}"
+
+class ConnectionSuggestion(models.Model):
+    """
+    Precomputed "people you may know" entry: a second-degree user ranked for
+    `user` by mutual connections and shared company/industry. Maintained by
+    connections.suggestions (Celery beat), read by the suggestions endpoint.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='connection_suggestions',
+        on_delete=models.CASCADE,
+        to_field='user_id'
+    )
+    suggested = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        to_field='user_id'
+    )
+    mutual_count = models.PositiveIntegerField()
+    shared_company = models.BooleanField(default=False)
+    shared_industry = models.BooleanField(default=False)
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('user', 'suggested'),)
+        db_table = 'connections_suggestion'
+        indexes = [
+            models.Index(fields=['user', '-score', 'suggested'], name='conn_suggestion_rank_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user1} <> {self.user2}"
\ No newline at end of file
+        return f"{self.user_id} ~> {self.suggested_id} ({self.score})"
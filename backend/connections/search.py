@@ -0,0 +1,121 @@
+# connections/search.py
+"""
+Ranked user search used by `connections.views.search_users`.
+
+On PostgreSQL the filter is answered by the pg_trgm GIN indexes created in
+`users/migrations/0003_user_search_trigram_indexes.py` (ILIKE '%q%' and the
+word-similarity operator are both index-backed) and results are ranked by a
+weighted sum of per-field trigram word similarity. The filter is written
+with the ILike lookups below rather than icontains/istartswith: Django
+compiles those to `UPPER("col"::text) LIKE UPPER(%s)`, which no index on the
+raw column can serve. Other backends (SQLite in
+tests) fall back to icontains filtering with an exact/prefix/substring rank
+built from the same field weights.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Case, F, FloatField, Lookup, Q, Value, When
+
+User = get_user_model()
+
+# field -> weight; higher weights rank matches in that field first
+SEARCH_FIELD_WEIGHTS = {
+    'full_name': 1.0,
+    'username': 0.9,
+    'company_name': 0.6,
+    'email': 0.4,
+    'contact': 0.3,
+}
+
+# pg_trgm cannot use an index for '%q%' when q is shorter than one trigram,
+# so shorter queries are matched on prefixes only.
+MIN_SUBSTRING_QUERY_LENGTH = 3
+
+# fields that also accept fuzzy (typo-tolerant) word-similarity matches on PostgreSQL
+FUZZY_FIELDS = ('full_name', 'company_name')
+DEFAULT_SEARCH_LIMIT = 50
+
+
+class ILikeContains(Lookup):
+    """`"col" ILIKE '%q%'` with LIKE wildcards in q escaped (PostgreSQL only)."""
+    lookup_name = 'ilike_contains'
+    pattern = '%{}%'
+
+    def process_rhs(self, compiler, connection):
+        # a plain string, or wrapped in Value when the lookup is used as a filter expression
+        value = self.rhs.value if isinstance(self.rhs, Value) else self.rhs
+        return '%s', [self.pattern.format(connection.ops.prep_for_like_query(value))]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', [*lhs_params, *rhs_params]
+
+
+class ILikeStartsWith(ILikeContains):
+    lookup_name = 'ilike_startswith'
+    pattern = '{}%'
+
+
+def _match_filter(q):
+    lookup = 'icontains' if len(q) >= MIN_SUBSTRING_QUERY_LENGTH else 'istartswith'
+    condition = Q()
+    for field in SEARCH_FIELD_WEIGHTS:
+        condition |= Q(**{f'{field}__{lookup}': q})
+    return condition
+
+
+def _postgres_match_filter(q):
+    lookup = ILikeContains if len(q) >= MIN_SUBSTRING_QUERY_LENGTH else ILikeStartsWith
+    condition = Q()
+    for field in SEARCH_FIELD_WEIGHTS:
+        condition |= Q(lookup(F(field), q))
+    return condition
+
+
+def _postgres_search(q):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    condition = _postgres_match_filter(q)
+    if len(q) >= MIN_SUBSTRING_QUERY_LENGTH:
+        for field in FUZZY_FIELDS:
+            condition |= Q(**{f'{field}__trigram_word_similar': q})
+
+    rank = None
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        term = TrigramWordSimilarity(Value(q), F(field)) * Value(weight)
+        rank = term if rank is None else rank + term
+
+    return User.objects.filter(condition).annotate(rank=rank)
+
+
+def _fallback_search(q):
+    needle = q.lower()
+    rank = None
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        term = Case(
+            When(**{f'{field}__iexact': needle}, then=Value(weight)),
+            When(**{f'{field}__istartswith': needle}, then=Value(weight * 0.75)),
+            When(**{f'{field}__icontains': needle}, then=Value(weight * 0.5)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        rank = term if rank is None else rank + term
+
+    return User.objects.filter(_match_filter(q)).annotate(rank=rank)
+
+
+def search_users_queryset(q, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Return up to `limit` users matching `q`, best matches first.
+    Each result carries a `rank` annotation (higher is better).
+    """
+    q = (q or '').strip()
+    if not q:
+        return User.objects.none()
+
+    if connection.vendor == 'postgresql':
+        qs = _postgres_search(q)
+    else:
+        qs = _fallback_search(q)
+    return qs.order_by('-rank', 'username')[:limit]
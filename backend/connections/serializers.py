@@ -1,11 +1,14 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import ConnectionRequest, Connection
+from .models import ConnectionRequest, Connection, ConnectionSuggestion
+from . import cache as relationship_cache
 from notifications.serializers import NotificationSerializer as _NotificationSerializer
 import re
 
 User = get_user_model()
 
+USER_ID_PATTERN = re.compile(r'^SPC-\d{8}-[a-f0-9]{6}$')
+
 class UserLiteSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -33,8 +36,7 @@ class ConnectionRequestSerializer(serializers.ModelSerializer):
             value = value[0]  # Take the first element
         
         # Validate the user ID format
-        pattern = r'^SPC-\d{8}-[a-f0-9]{6}$'
-        if not re.match(pattern, value):
+        if not USER_ID_PATTERN.match(value):
             raise serializers.ValidationError("Invalid user ID format.")
         
         # Check if the user exists
@@ -49,24 +51,19 @@ class ConnectionRequestSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         from_user = request.user
         to_user = data.get('to_user_id')  # This is now a User object from validate_to_user_id
+        if to_user is None:
+            # partial update that leaves the recipient alone
+            return data
         
         if to_user == from_user:
             raise serializers.ValidationError("Cannot send request to yourself.")
         
-        # Check if pending request already exists
-        if ConnectionRequest.objects.filter(
-            from_user=from_user, 
-            to_user=to_user, 
-            status=ConnectionRequest.STATUS_PENDING
-        ).exists():
+        # Relationship checks are served from the per-user cached sets
+        # (connections.cache); a cold set is rebuilt from the database.
+        if relationship_cache.has_pending_request(from_user.pk, to_user.pk):
             raise serializers.ValidationError("A pending request already exists.")
         
-        # Check if connection already exists
-        from django.db.models import Q
-        if Connection.objects.filter(
-            (Q(user1=from_user) & Q(user2=to_user)) | 
-            (Q(user1=to_user) & Q(user2=from_user))
-        ).exists():
+        if relationship_cache.is_connected(from_user.pk, to_user.pk):
             raise serializers.ValidationError("You are already connected with this user.")
         
         # Rename to_user_id to to_user for model creation
@@ -78,7 +75,28 @@ class ConnectionRequestSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         request = self.context.get('request')
-        return ConnectionRequest.objects.create(from_user=request.user, **validated_data)
+        instance = ConnectionRequest.objects.create(from_user=request.user, **validated_data)
+        relationship_cache.requests_created([(instance.from_user_id, instance.to_user_id)])
+        return instance
+
+
+class BulkConnectionRequestSerializer(serializers.Serializer):
+    """Input of the bulk request endpoint; per-id checks happen in the view."""
+    MAX_ITEMS = 100
+
+    to_user_ids = serializers.ListField(
+        child=serializers.CharField(), allow_empty=False, max_length=MAX_ITEMS,
+    )
+    message = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BulkRespondSerializer(serializers.Serializer):
+    """Input of the bulk accept/reject endpoints."""
+    MAX_ITEMS = 100
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_ITEMS,
+    )
 
 
 class ConnectionSerializer(serializers.ModelSerializer):
@@ -87,4 +105,12 @@ class ConnectionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Connection
-        fields = ('id', 'user1', 'user2', 'connected_at')
\ No newline at end of file
+        fields = ('id', 'user1', 'user2', 'connected_at')
+
+
+class ConnectionSuggestionSerializer(serializers.ModelSerializer):
+    suggested = UserLiteSerializer(read_only=True)
+
+    class Meta:
+        model = ConnectionSuggestion
+        fields = ('suggested', 'mutual_count', 'shared_company', 'shared_industry', 'score', 'computed_at')
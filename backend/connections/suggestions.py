@@ -0,0 +1,171 @@
+# connections/suggestions.py
+"""
+"People you may know" engine.
+
+Suggestions are second-degree users (friends of friends) ranked by the number
+of mutual connections, with a bonus for a shared company or industry. They
+are computed off the request path into ConnectionSuggestion (top K per user)
+by the Celery beat tasks in connections.tasks:
+
+- refresh_connection_suggestions recomputes only users whose neighbourhood
+  gained an edge since the previous run started (both endpoints of each new
+  edge and their neighbours), remembered in the cache;
+- a periodic full rebuild also catches removed connections.
+
+The endpoint only reads the precomputed rows and drops users that became
+connected or were sent a request since the last computation.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ConnectionEdge, ConnectionRequest, ConnectionSuggestion
+
+User = get_user_model()
+
+TOP_K = getattr(settings, 'CONNECTION_SUGGESTIONS_TOP_K', 50)
+# how many friends-of-friends (by mutual count) are scored before the top K is taken
+CANDIDATE_LIMIT = TOP_K * 4
+SHARED_COMPANY_BONUS = 2.0
+SHARED_INDUSTRY_BONUS = 1.0
+REFRESH_BATCH_SIZE = 500
+# start time of the last completed run; a missing key means a full rebuild
+LAST_RUN_CACHE_KEY = 'connections:suggestions:last_run'
+# edges get connected_at before their transaction commits; the incremental
+# window reaches this far before the previous start so late commits are seen
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+
+def _score(mutual_count, shared_company, shared_industry):
+    return (
+        float(mutual_count)
+        + (SHARED_COMPANY_BONUS if shared_company else 0.0)
+        + (SHARED_INDUSTRY_BONUS if shared_industry else 0.0)
+    )
+
+
+def _same(a, b):
+    return bool(a) and bool(b) and a.strip().lower() == b.strip().lower()
+
+
+def compute_suggestions(user, computed_at=None):
+    """Return the (unsaved) top-K ConnectionSuggestion rows for `user`."""
+    computed_at = computed_at or timezone.now()
+    peers = ConnectionEdge.objects.filter(user_id=user.pk).values('peer_id')
+    candidates = list(
+        ConnectionEdge.objects.filter(user_id__in=peers)
+        .exclude(peer_id=user.pk)
+        .exclude(peer_id__in=peers)
+        .values('peer_id')
+        .annotate(mutual=Count('user_id'))
+        .order_by('-mutual', 'peer_id')[:CANDIDATE_LIMIT]
+    )
+    if not candidates:
+        return []
+
+    candidate_ids = [row['peer_id'] for row in candidates]
+    requested = set()
+    for from_id, to_id in ConnectionRequest.objects.filter(
+        Q(from_user_id=user.pk, to_user_id__in=candidate_ids)
+        | Q(to_user_id=user.pk, from_user_id__in=candidate_ids),
+        status=ConnectionRequest.STATUS_PENDING,
+    ).values_list('from_user_id', 'to_user_id'):
+        requested.add(to_id if from_id == user.pk else from_id)
+
+    profiles = {
+        row['user_id']: row
+        for row in User.objects.filter(user_id__in=candidate_ids, is_active=True)
+        .values('user_id', 'company_name', 'industry')
+    }
+
+    rows = []
+    for candidate in candidates:
+        profile = profiles.get(candidate['peer_id'])
+        if profile is None or candidate['peer_id'] in requested:
+            continue
+        shared_company = _same(user.company_name, profile['company_name'])
+        shared_industry = _same(user.industry, profile['industry'])
+        rows.append(ConnectionSuggestion(
+            user_id=user.pk,
+            suggested_id=candidate['peer_id'],
+            mutual_count=candidate['mutual'],
+            shared_company=shared_company,
+            shared_industry=shared_industry,
+            score=_score(candidate['mutual'], shared_company, shared_industry),
+            computed_at=computed_at,
+        ))
+    rows.sort(key=lambda row: (-row.score, row.suggested_id))
+    return rows[:TOP_K]
+
+
+def refresh_suggestions_for(user_ids, computed_at=None):
+    """Recompute and replace the stored suggestions of `user_ids`; returns the user count."""
+    computed_at = computed_at or timezone.now()
+    user_ids = list(user_ids)
+    refreshed = 0
+    for start in range(0, len(user_ids), REFRESH_BATCH_SIZE):
+        chunk = user_ids[start:start + REFRESH_BATCH_SIZE]
+        users = User.objects.filter(user_id__in=chunk).only('user_id', 'company_name', 'industry')
+        for user in users:
+            rows = compute_suggestions(user, computed_at)
+            with transaction.atomic():
+                ConnectionSuggestion.objects.filter(user_id=user.pk).delete()
+                ConnectionSuggestion.objects.bulk_create(rows)
+            refreshed += 1
+    return refreshed
+
+
+def stale_user_ids(since):
+    """
+    Users whose friends-of-friends may have changed because an edge was added
+    after `since`: the endpoints of the new edges and all of their neighbours.
+    """
+    changed = set(
+        ConnectionEdge.objects.filter(connected_at__gt=since).values_list('user_id', flat=True)
+    )
+    if not changed:
+        return set()
+    neighbours = set(
+        ConnectionEdge.objects.filter(user_id__in=changed).values_list('peer_id', flat=True)
+    )
+    return changed | neighbours
+
+
+def refresh_stale_suggestions():
+    """
+    Incremental refresh of the users affected by edges added since the
+    previous run started, less REFRESH_OVERLAP. Without a previous run,
+    rebuild everything.
+    """
+    started = timezone.now()
+    last_run = cache.get(LAST_RUN_CACHE_KEY)
+    if last_run is None:
+        return rebuild_all_suggestions(started)
+    refreshed = refresh_suggestions_for(sorted(stale_user_ids(last_run - REFRESH_OVERLAP)), started)
+    cache.set(LAST_RUN_CACHE_KEY, started, None)
+    return refreshed
+
+
+def rebuild_all_suggestions(computed_at=None):
+    """Recompute every user that has at least one connection, in user_id order."""
+    computed_at = computed_at or timezone.now()
+    refreshed = 0
+    last_id = ''
+    while True:
+        chunk = list(
+            ConnectionEdge.objects.filter(user_id__gt=last_id)
+            .order_by('user_id').values_list('user_id', flat=True).distinct()[:REFRESH_BATCH_SIZE]
+        )
+        if not chunk:
+            break
+        refreshed += refresh_suggestions_for(chunk, computed_at)
+        last_id = chunk[-1]
+    # users who lost all their connections since the previous rebuild
+    ConnectionSuggestion.objects.filter(computed_at__lt=computed_at).delete()
+    cache.set(LAST_RUN_CACHE_KEY, computed_at, None)
+    return refreshed
@@ -0,0 +1,33 @@
+# connections/tasks.py
+from celery import shared_task
+import logging
+
+from . import graph
+from .suggestions import rebuild_all_suggestions, refresh_stale_suggestions, refresh_suggestions_for
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def refresh_connection_suggestions(self, user_ids=None, full=False):
+    """
+    Recompute "people you may know" rows.
+    - user_ids: recompute exactly these users
+    - full: rebuild every connected user (also drops suggestions made stale by removed connections)
+    - default: incremental refresh of users whose neighbourhood changed since the last run
+    """
+    if user_ids:
+        refreshed = refresh_suggestions_for(user_ids)
+    elif full:
+        refreshed = rebuild_all_suggestions()
+    else:
+        refreshed = refresh_stale_suggestions()
+    logger.info("Connection suggestions refreshed for %s users (full=%s)", refreshed, full)
+    return {'status': 'ok', 'refreshed': refreshed}
+
+
+@shared_task(bind=True)
+def rebuild_connection_graph(self):
+    """Rebuild the CSR snapshot used for degrees-of-separation queries."""
+    path = graph.build_snapshot()
+    return {'status': 'ok', 'path': str(path)}
@@ -0,0 +1,512 @@
+import tempfile
+from asyncio import iscoroutinefunction
+from collections import deque
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework import status
+
+from backend.pagination import KeysetCursorPagination
+from backend.testing import QueryBudgetAPITestCase
+from notifications import outbox as notification_outbox
+from notifications.models import Notification, NotificationOutbox
+from . import cache as relationship_cache
+from . import graph as connection_graph
+from . import suggestions
+from .models import Connection, ConnectionEdge, ConnectionRequest, ConnectionSuggestion
+from .search import SEARCH_FIELD_WEIGHTS, search_users_queryset
+from .tasks import refresh_connection_suggestions
+
+User = get_user_model()
+
+
+class ConnectionRequestEndpointTests(QueryBudgetAPITestCase):
+
+    def incoming_pending(self):
+        return ConnectionRequest.objects.filter(
+            to_user=self.user, status=ConnectionRequest.STATUS_PENDING
+        ).order_by('id')
+
+    def test_list_requests(self):
+        with self.assertQueryBudget(2, 'GET /api/connections/requests/'):
+            response = self.client.get('/api/connections/requests/?limit=100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            len(response.data['results']),
+            ConnectionRequest.objects.filter(Q(from_user=self.user) | Q(to_user=self.user)).count(),
+        )
+
+    def test_list_incoming_requests_paginates(self):
+        with self.assertQueryBudget(2, 'GET /api/connections/requests/?direction=incoming'):
+            response = self.client.get('/api/connections/requests/?direction=incoming&limit=2')
+        self.assertEqual(len(response.data['results']), 2)
+        with self.assertQueryBudget(2, 'GET /api/connections/requests/?cursor='):
+            next_page = self.client.get(response.data['next'])
+        first_ids = {row['id'] for row in response.data['results']}
+        self.assertFalse(first_ids & {row['id'] for row in next_page.data['results']})
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN output is PostgreSQL-specific')
+    def test_cursor_filter_bounds_the_index_scan(self):
+        ordering = ('-created_at', '-id')
+        after = KeysetCursorPagination._after_position(ordering, [timezone.now(), 0])
+        with transaction.atomic(), connection.cursor() as cursor:
+            # the seeded table is tiny; make the planner show whether an index can serve the filter
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = ConnectionRequest.objects.filter(after, to_user=self.user).order_by(*ordering)[:20].explain()
+        self.assertRegex(plan, r'Index Cond: .*created_at')
+
+    def test_create_request(self):
+        connected = Connection.objects.filter(Q(user1=self.user) | Q(user2=self.user))
+        excluded = set(connected.values_list('user1_id', flat=True)) | set(connected.values_list('user2_id', flat=True))
+        excluded |= set(ConnectionRequest.objects.filter(from_user=self.user).values_list('to_user_id', flat=True))
+        excluded |= set(ConnectionRequest.objects.filter(to_user=self.user).values_list('from_user_id', flat=True))
+        target = next(u for u in self.users[1:] if u.user_id not in excluded)
+
+        with self.assertQueryBudget(5, 'POST /api/connections/requests/'):
+            response = self.client.post('/api/connections/requests/', {'to_user_id': target.user_id, 'message': 'hi'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data['to_user']['user_id'], target.user_id)
+
+    def test_create_request_to_connection_is_rejected(self):
+        connection = Connection.objects.filter(user1=self.user).first()
+        response = self.client.post('/api/connections/requests/', {'to_user_id': connection.user2_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_accept_request(self):
+        req = self.incoming_pending().first()
+        with self.assertQueryBudget(13, 'POST /api/connections/requests/{id}/accept/'):
+            response = self.client.post(f'/api/connections/requests/{req.id}/accept/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        req.refresh_from_db()
+        self.assertEqual(req.status, ConnectionRequest.STATUS_ACCEPTED)
+        self.assertTrue(Connection.objects.filter(
+            user1_id=min(req.from_user_id, req.to_user_id),
+            user2_id=max(req.from_user_id, req.to_user_id),
+        ).exists())
+        self.assertTrue(ConnectionEdge.objects.filter(user=req.from_user_id, peer=req.to_user_id).exists())
+        self.assertTrue(ConnectionEdge.objects.filter(user=req.to_user_id, peer=req.from_user_id).exists())
+
+        again = self.client.post(f'/api/connections/requests/{req.id}/accept/')
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reject_request(self):
+        req = self.incoming_pending().first()
+        with self.assertQueryBudget(6, 'POST /api/connections/requests/{id}/reject/'):
+            response = self.client.post(f'/api/connections/requests/{req.id}/reject/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        req.refresh_from_db()
+        self.assertEqual(req.status, ConnectionRequest.STATUS_REJECTED)
+
+    def test_bulk_create_requests(self):
+        contacted = set(ConnectionRequest.objects.filter(from_user=self.user).values_list('to_user_id', flat=True))
+        connected = set(ConnectionEdge.objects.filter(user=self.user).values_list('peer_id', flat=True))
+        fresh = [u.pk for u in self.users[1:] if u.pk not in contacted | connected][:5]
+        pending = ConnectionRequest.objects.filter(from_user=self.user, status=ConnectionRequest.STATUS_PENDING).first()
+        to_user_ids = fresh + [
+            fresh[0], next(iter(connected)), 'SPC-20250101-ffffff', 'not-an-id', self.user.pk,
+        ] + ([pending.to_user_id] if pending else [])
+        notifications_before = Notification.objects.count()
+
+        with self.assertQueryBudget(8, 'POST /api/connections/requests/bulk/'):
+            response = self.client.post(
+                '/api/connections/requests/bulk/', {'to_user_ids': to_user_ids, 'message': 'hi'}, format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], len(fresh))
+        self.assertEqual([r['to_user_id'] for r in response.data['results']], to_user_ids)
+        statuses = [r['status'] for r in response.data['results']]
+        self.assertEqual(statuses[:len(fresh)], ['created'] * len(fresh))
+        self.assertEqual(set(statuses[len(fresh):]), {'error'})
+        self.assertEqual(
+            ConnectionRequest.objects.filter(from_user=self.user, to_user_id__in=fresh, message='hi').count(), len(fresh),
+        )
+        self.assertEqual(NotificationOutbox.objects.filter(published_at__isnull=True).count(), len(fresh))
+        self.assertEqual(notification_outbox.relay_outbox(), len(fresh))
+        self.assertEqual(Notification.objects.count(), notifications_before + len(fresh))
+        self.assertTrue(relationship_cache.has_pending_request(self.user.pk, fresh[0]))
+
+    def test_bulk_create_rejects_empty_list(self):
+        response = self.client.post('/api/connections/requests/bulk/', {'to_user_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_accept_requests(self):
+        incoming = list(self.incoming_pending()[:3])
+        foreign = ConnectionRequest.objects.exclude(to_user=self.user).first()
+        ids = [req.pk for req in incoming] + [foreign.pk, 999999]
+        with self.assertQueryBudget(9, 'POST /api/connections/requests/bulk-accept/'):
+            response = self.client.post('/api/connections/requests/bulk-accept/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], len(incoming))
+        self.assertEqual([r.get('code') for r in response.data['results'][-2:]], [403, 404])
+        for req in incoming:
+            req.refresh_from_db()
+            self.assertEqual(req.status, ConnectionRequest.STATUS_ACCEPTED)
+            self.assertTrue(ConnectionEdge.objects.filter(user=self.user, peer_id=req.from_user_id).exists())
+            self.assertTrue(ConnectionEdge.objects.filter(user_id=req.from_user_id, peer=self.user).exists())
+        self.assertEqual(response.data['results'][0]['connection']['user1']['user_id'],
+                         min(self.user.pk, incoming[0].from_user_id))
+
+        # already-accepted requests are reported, not re-applied
+        again = self.client.post('/api/connections/requests/bulk-accept/', {'ids': ids[:1]}, format='json')
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(again.data['results'][0]['code'], 400)
+
+    def test_bulk_reject_requests(self):
+        incoming = list(self.incoming_pending()[:2])
+        with self.assertQueryBudget(6, 'POST /api/connections/requests/bulk-reject/'):
+            response = self.client.post(
+                '/api/connections/requests/bulk-reject/', {'ids': [req.pk for req in incoming]}, format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            ConnectionRequest.objects.filter(pk__in=[r.pk for r in incoming], status=ConnectionRequest.STATUS_REJECTED).count(),
+            len(incoming),
+        )
+
+    def test_only_recipient_can_accept(self):
+        req = self.incoming_pending().first()
+        response = self.client_for(req.from_user).post(f'/api/connections/requests/{req.id}/accept/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConnectionEndpointTests(QueryBudgetAPITestCase):
+
+    def test_list_connections(self):
+        with self.assertQueryBudget(2, 'GET /api/connections/connections/'):
+            response = self.client.get('/api/connections/connections/?limit=100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            len(response.data['results']),
+            Connection.objects.filter(Q(user1=self.user) | Q(user2=self.user)).count(),
+        )
+
+    def test_retrieve_connection(self):
+        connection = Connection.objects.filter(user1=self.user).first()
+        with self.assertQueryBudget(2, 'GET /api/connections/connections/{id}/'):
+            response = self.client.get(f'/api/connections/connections/{connection.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_destroy_connection(self):
+        connection = Connection.objects.filter(user1=self.user).first()
+        with self.assertQueryBudget(4, 'DELETE /api/connections/connections/{id}/'):
+            response = self.client.delete(f'/api/connections/connections/{connection.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Connection.objects.filter(pk=connection.id).exists())
+        self.assertFalse(ConnectionEdge.objects.filter(connection_id=connection.id).exists())
+
+    def test_list_is_served_by_async_view(self):
+        match = resolve('/api/connections/connections/')
+        self.assertTrue(iscoroutinefunction(match.func))
+
+        response = self.client_class().get('/api/connections/connections/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        response = self.client.get('/api/connections/connections/?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class SearchEndpointTests(QueryBudgetAPITestCase):
+
+    def test_search_users(self):
+        with self.assertQueryBudget(2, 'GET /api/connections/search/'):
+            response = self.client.get('/api/connections/search/?q=user1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['username'], 'user1')
+
+    def test_short_query_matches_prefix(self):
+        response = self.client.get('/api/connections/search/?q=us')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['results'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram indexes exist on PostgreSQL only')
+    def test_search_filter_uses_trigram_indexes(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # the seeded table is tiny; make the planner show whether an index can serve the filter
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = search_users_queryset('user1').explain()
+        self.assertNotIn('Seq Scan', plan)
+        for field in SEARCH_FIELD_WEIGHTS:
+            self.assertIn(f'registered_users_{field}_trgm', plan)
+
+    def test_empty_query(self):
+        with self.assertQueryBudget(1, 'GET /api/connections/search/?q='):
+            response = self.client.get('/api/connections/search/?q=')
+        self.assertEqual(response.data, {'results': []})
+
+
+class SeedSocialGraphCommandTests(TestCase):
+
+    def seed(self):
+        call_command('seed_social_graph', users=200, avg_degree=6, batch_size=64, seed=3, stdout=StringIO())
+        return (
+            sorted(Connection.objects.values_list('user1_id', 'user2_id')),
+            sorted(ConnectionRequest.objects.values_list('from_user_id', 'to_user_id', 'status')),
+        )
+
+    def test_seeding_is_deterministic(self):
+        first = self.seed()
+        Connection.objects.all().delete()
+        ConnectionRequest.objects.all().delete()
+        User.objects.all().delete()
+        self.assertEqual(first, self.seed())
+        self.assertEqual(User.objects.count(), 200)
+
+    def test_no_pending_request_between_connected_users(self):
+        connections, requests = self.seed()
+        connected = set(connections)
+        for from_id, to_id, status_ in requests:
+            if status_ == ConnectionRequest.STATUS_PENDING:
+                self.assertNotIn(tuple(sorted((from_id, to_id))), connected)
+
+
+class RelationshipCacheTests(QueryBudgetAPITestCase):
+
+    def test_cold_miss_rebuilds_then_serves_from_cache(self):
+        peer = ConnectionEdge.objects.filter(user=self.user).first().peer_id
+        with self.assertQueryBudget(1, 'relationship cache cold miss'):
+            self.assertTrue(relationship_cache.is_connected(self.user.pk, peer))
+        with self.assertQueryBudget(0, 'relationship cache hit'):
+            self.assertTrue(relationship_cache.is_connected(self.user.pk, peer))
+            self.assertFalse(relationship_cache.is_connected(self.user.pk, self.user.pk))
+
+    def test_accept_and_destroy_write_through(self):
+        req = ConnectionRequest.objects.filter(
+            to_user=self.user, status=ConnectionRequest.STATUS_PENDING
+        ).first()
+        # warm both users' sets
+        self.assertFalse(relationship_cache.is_connected(self.user.pk, req.from_user_id))
+        self.assertFalse(relationship_cache.is_connected(req.from_user_id, self.user.pk))
+        self.assertTrue(relationship_cache.has_pending_request(req.from_user_id, self.user.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/connections/requests/{req.id}/accept/')
+        with self.assertQueryBudget(0, 'relationship cache after accept'):
+            self.assertTrue(relationship_cache.is_connected(self.user.pk, req.from_user_id))
+            self.assertTrue(relationship_cache.is_connected(req.from_user_id, self.user.pk))
+            self.assertFalse(relationship_cache.has_pending_request(req.from_user_id, self.user.pk))
+
+        connection = Connection.objects.get(edges__user=self.user, edges__peer=req.from_user_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/connections/connections/{connection.id}/')
+        self.assertFalse(relationship_cache.is_connected(self.user.pk, req.from_user_id))
+
+    def test_duplicate_request_rejected_from_cache(self):
+        target = next(
+            u for u in self.users[1:]
+            if not relationship_cache.is_connected(self.user.pk, u.pk)
+            and not ConnectionRequest.objects.filter(
+                Q(from_user=self.user, to_user=u) | Q(from_user=u, to_user=self.user)
+            ).exists()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/connections/requests/', {'to_user_id': target.user_id})
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(relationship_cache.has_pending_request(self.user.pk, target.pk))
+        second = self.client.post('/api/connections/requests/', {'to_user_id': target.user_id})
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_withdrawn_request_can_be_sent_again(self):
+        req = ConnectionRequest.objects.filter(
+            to_user=self.user, status=ConnectionRequest.STATUS_PENDING
+        ).first()
+        sender = self.client_for(req.from_user)
+        self.assertTrue(relationship_cache.has_pending_request(req.from_user_id, self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = sender.delete(f'/api/connections/requests/{req.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(relationship_cache.has_pending_request(req.from_user_id, self.user.pk))
+        response = sender.post('/api/connections/requests/', {'to_user_id': self.user.user_id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+    def test_write_during_rebuild_is_not_cached_over(self):
+        target = next(
+            u for u in self.users[1:]
+            if not ConnectionRequest.objects.filter(
+                Q(from_user=self.user, to_user=u) | Q(from_user=u, to_user=self.user)
+            ).exists()
+        )
+        load_pending = relationship_cache._load_pending
+
+        def racing_load(user_id):
+            members = list(load_pending(user_id))
+            # a request commits between the rebuild's load and its store
+            with self.captureOnCommitCallbacks(execute=True):
+                ConnectionRequest.objects.create(from_user=self.user, to_user=target)
+                relationship_cache.requests_created([(self.user.pk, target.pk)])
+            return members
+
+        with mock.patch.object(relationship_cache, '_load_pending', racing_load):
+            self.assertFalse(relationship_cache.has_pending_request(self.user.pk, target.pk))
+        self.assertTrue(relationship_cache.has_pending_request(self.user.pk, target.pk))
+
+
+class ConnectionSuggestionTests(QueryBudgetAPITestCase):
+
+    def test_refresh_ranks_friends_of_friends(self):
+        refresh_connection_suggestions(full=True)
+        peers = set(ConnectionEdge.objects.filter(user=self.user).values_list('peer_id', flat=True))
+        rows = list(ConnectionSuggestion.objects.filter(user=self.user).order_by('-score'))
+        self.assertTrue(rows)
+        for row in rows:
+            self.assertNotIn(row.suggested_id, peers)
+            self.assertNotEqual(row.suggested_id, self.user.pk)
+            mutual = ConnectionEdge.objects.filter(user=row.suggested_id, peer__in=peers).count()
+            self.assertEqual(row.mutual_count, mutual)
+        self.assertEqual([r.score for r in rows], sorted((r.score for r in rows), reverse=True))
+
+    def test_incremental_refresh_picks_up_new_edges(self):
+        refresh_connection_suggestions(full=True)
+        outsider = self.users[-1]
+        friend = ConnectionEdge.objects.filter(user=self.user).exclude(peer=outsider).first().peer
+        ConnectionEdge.objects.filter(user=outsider).delete()
+        Connection.objects.filter(Q(user1=outsider) | Q(user2=outsider)).delete()
+        ConnectionSuggestion.objects.filter(user=self.user, suggested=outsider).delete()
+        Connection.objects.create(user1=friend, user2=outsider)
+
+        result = refresh_connection_suggestions()
+        self.assertGreater(result['refreshed'], 0)
+        self.assertTrue(ConnectionSuggestion.objects.filter(user=self.user, suggested=outsider).exists())
+
+    def test_incremental_refresh_sees_edges_committed_after_the_previous_start(self):
+        refresh_connection_suggestions(full=True)
+        previous_start = cache.get(suggestions.LAST_RUN_CACHE_KEY)
+        # an edge stamped before the previous run started, committed after it
+        outsider = self.users[-1]
+        friend = ConnectionEdge.objects.filter(user=self.user).exclude(peer=outsider).first().peer
+        ConnectionEdge.objects.filter(user=outsider).delete()
+        Connection.objects.filter(Q(user1=outsider) | Q(user2=outsider)).delete()
+        ConnectionSuggestion.objects.filter(user=self.user, suggested=outsider).delete()
+        connection_row = Connection.objects.create(user1=friend, user2=outsider)
+        ConnectionEdge.objects.filter(connection=connection_row).update(connected_at=previous_start - timedelta(minutes=1))
+
+        refresh_connection_suggestions()
+        self.assertTrue(ConnectionSuggestion.objects.filter(user=self.user, suggested=outsider).exists())
+        self.assertGreater(cache.get(suggestions.LAST_RUN_CACHE_KEY), previous_start)
+
+    def test_list_suggestions(self):
+        refresh_connection_suggestions(full=True)
+        with self.assertQueryBudget(4, 'GET /api/connections/suggestions/ (cold cache)'):
+            response = self.client.get('/api/connections/suggestions/?limit=5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(response.data['results']), 5)
+        with self.assertQueryBudget(2, 'GET /api/connections/suggestions/'):
+            self.client.get('/api/connections/suggestions/?limit=5')
+
+
+class ConnectionPathTests(QueryBudgetAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.graph_path = Path(tmp.name) / 'graph.csr'
+        settings_override = override_settings(CONNECTION_GRAPH_PATH=str(self.graph_path))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        connection_graph.build_snapshot(self.graph_path)
+
+    def degrees_via_orm(self, source, target):
+        seen, queue = {source: 0}, deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                return seen[node]
+            for peer in ConnectionEdge.objects.filter(user_id=node).values_list('peer_id', flat=True):
+                if peer not in seen:
+                    seen[peer] = seen[node] + 1
+                    queue.append(peer)
+        return None
+
+    def assertValidPath(self, path, source, target):
+        self.assertEqual((path[0], path[-1]), (source, target))
+        for a, b in zip(path, path[1:]):
+            self.assertTrue(ConnectionEdge.objects.filter(user_id=a, peer_id=b).exists())
+
+    def test_snapshot_matches_breadth_first_search(self):
+        graph = connection_graph.CSRGraph(self.graph_path)
+        self.addCleanup(graph.close)
+        for target in self.users[1::7]:
+            path = graph.find_path(self.user.pk, target.pk, max_hops=10)
+            expected = self.degrees_via_orm(self.user.pk, target.pk)
+            if expected is None:
+                self.assertIsNone(path)
+                continue
+            self.assertValidPath(path, self.user.pk, target.pk)
+            self.assertEqual(len(path) - 1, expected)
+
+    def test_incremental_refresh(self):
+        graph = connection_graph.CSRGraph(self.graph_path)
+        self.addCleanup(graph.close)
+        newcomer = User.objects.create_user(
+            username='newcomer', email='newcomer@example.test', password='x', full_name='New Comer',
+            contact='+15550000000',
+        )
+        friend = ConnectionEdge.objects.filter(user=self.user).first().peer
+        Connection.objects.create(user1=friend, user2=newcomer)
+        self.assertIsNone(graph.find_path(self.user.pk, newcomer.pk, max_hops=6))
+        graph.apply_new_edges()
+        self.assertEqual(graph.find_path(self.user.pk, newcomer.pk, max_hops=6), [self.user.pk, friend.pk, newcomer.pk])
+
+        # a removed connection is detected when the path is verified
+        Connection.objects.filter(edges__user=friend, edges__peer=newcomer).delete()
+        path = graph.find_path(self.user.pk, newcomer.pk, max_hops=6)
+        self.assertIsNone(path)
+
+    def test_refresh_picks_up_edges_committed_below_the_watermark(self):
+        graph = connection_graph.CSRGraph(self.graph_path)
+        self.addCleanup(graph.close)
+        friend = ConnectionEdge.objects.filter(user=self.user).first().peer
+        newcomer = User.objects.create_user(
+            username='latecomer', email='latecomer@example.test', password='x', full_name='Late Comer',
+            contact='+15550000001',
+        )
+        Connection.objects.create(user1=friend, user2=newcomer)
+        # a higher key was seen before this edge's transaction committed
+        graph.watermark = ConnectionEdge.objects.order_by('-pk').first().pk + 10
+        graph.apply_new_edges()
+        self.assertEqual(graph.find_path(self.user.pk, newcomer.pk, max_hops=6), [self.user.pk, friend.pk, newcomer.pk])
+
+    def second_degree_peer(self):
+        return ConnectionEdge.objects.exclude(user=self.user).exclude(peer=self.user) \
+            .filter(user__in=ConnectionEdge.objects.filter(user=self.user).values('peer')).first().peer
+
+    def test_path_without_snapshot_is_searched_in_the_database(self):
+        self.graph_path.unlink()
+        self.addCleanup(setattr, connection_graph, '_rebuild_requested_at', None)
+        target = self.second_degree_peer()
+        with mock.patch('connections.tasks.rebuild_connection_graph.delay') as rebuild, \
+                self.assertLogs('connections.graph', 'WARNING'):
+            response = self.client.get(f'/api/connections/path/?to={target.pk}&max_hops=4')
+            self.client.get(f'/api/connections/path/?to={target.pk}&max_hops=4')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertValidPath([row['user_id'] for row in response.data['path']], self.user.pk, target.pk)
+        self.assertEqual(response.data['degrees'], self.degrees_via_orm(self.user.pk, target.pk))
+        rebuild.assert_called_once_with()
+        self.assertFalse(self.graph_path.exists())
+
+    def test_path_endpoint(self):
+        target = self.second_degree_peer()
+        self.client.get(f'/api/connections/path/?to={target.pk}')  # loads the snapshot
+        with self.assertQueryBudget(3, 'GET /api/connections/path/'):
+            response = self.client.get(f'/api/connections/path/?to={target.pk}&max_hops=4')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(response.data['degrees'], 2)
+        self.assertEqual(response.data['path'][0]['user_id'], self.user.pk)
+        self.assertEqual(response.data['path'][-1]['user_id'], target.pk)
+
+    def test_path_endpoint_validates_params(self):
+        self.assertEqual(self.client.get('/api/connections/path/').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f'/api/connections/path/?to={self.users[1].pk}&max_hops=99')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
@@ -1,12 +1,23 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from .views import ConnectionRequestViewSet, ConnectionViewSet, search_users
+from backend.async_api import get_or_sync
+from .views import (
+    ConnectionRequestViewSet, ConnectionViewSet, ConnectionSuggestionViewSet, connection_list, connection_path,
+    connection_request_list, search_users,
+)
 
 router = DefaultRouter()
 router.register(r'requests', ConnectionRequestViewSet, basename='connectionrequest')
 router.register(r'connections', ConnectionViewSet, basename='connection')
+router.register(r'suggestions', ConnectionSuggestionViewSet, basename='connectionsuggestion')
 
 urlpatterns = [
+    # GET served by async views (backend.async_api); other methods by the viewsets
+    path('requests/', get_or_sync(
+        connection_request_list, ConnectionRequestViewSet.as_view({'get': 'list', 'post': 'create'}),
+    )),
+    path('connections/', get_or_sync(connection_list, ConnectionViewSet.as_view({'get': 'list'}))),
     path('', include(router.urls)),
     path('search/', search_users, name='user-search'),
+    path('path/', connection_path, name='connection-path'),
 ]
@@ -0,0 +1,28 @@
+# connections/utils.py
+from django.db import transaction
+
+from .models import Connection, ConnectionEdge
+
+
+def sync_connection_edges(batch_size=5000, connections=None):
+    """
+    Create any missing ConnectionEdge rows for `connections` (default: all).
+
+    Needed after inserting Connection rows with bulk_create, which bypasses
+    Connection.save(). Walks the connections by primary key in batches, so
+    memory stays bounded; existing edges are left alone. Returns the number of
+    connections visited.
+    """
+    qs = Connection.objects.all() if connections is None else connections
+    qs = qs.order_by('pk').only('pk', 'user1_id', 'user2_id', 'connected_at')
+    last_pk = 0
+    visited = 0
+    while True:
+        batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return visited
+        edges = [edge for connection in batch for edge in ConnectionEdge.for_connection(connection)]
+        with transaction.atomic():
+            ConnectionEdge.objects.bulk_create(edges, batch_size=batch_size, ignore_conflicts=True)
+        last_pk = batch[-1].pk
+        visited += len(batch)
@@ -1,12 +1,21 @@
-from rest_framework import viewsets, status, permissions
+from rest_framework import viewsets, status, permissions, mixins
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import F, Q
 from django.db import transaction, IntegrityError
-from .models import ConnectionRequest, Connection
-from .serializers import ConnectionRequestSerializer, ConnectionSerializer, UserLiteSerializer
-from notifications.tasks import send_connection_response_notification
+from .models import ConnectionRequest, Connection, ConnectionEdge, ConnectionSuggestion
+from .serializers import (
+    BulkConnectionRequestSerializer, BulkRespondSerializer, ConnectionRequestSerializer, ConnectionSerializer, USER_ID_PATTERN, ConnectionSuggestionSerializer, UserLiteSerializer,
+)
+from .search import search_users_queryset
+from . import cache as relationship_cache
+from . import suggestions
+from . import graph as connection_graph
+from notifications import outbox as notification_outbox
+from backend.async_api import async_api_view, list_page
+from backend.pagination import KeysetCursorPagination
+from django.conf import settings
 from django.utils import timezone
 import logging
 
@@ -18,20 +27,35 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
+        # compare raw FK ids so the check never loads the related users
+        user_id = request.user.pk
         if isinstance(obj, ConnectionRequest):
-            return obj.from_user == request.user or obj.to_user == request.user
+            return user_id in (obj.from_user_id, obj.to_user_id)
         if isinstance(obj, Connection):
-            return obj.user1 == request.user or obj.user2 == request.user
+            return user_id in (obj.user1_id, obj.user2_id)
         return False
 
+class ConnectionRequestPagination(KeysetCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class ConnectionPagination(KeysetCursorPagination):
+    # ordered by the requesting user's edge columns so each page is a range
+    # scan of the (user, -connected_at, -connection) edge index
+    ordering = ('-edge_connected_at', '-edge_connection_id')
+
+
 class ConnectionRequestViewSet(viewsets.ModelViewSet):
     queryset = ConnectionRequest.objects.all()
     serializer_class = ConnectionRequestSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = ConnectionRequestPagination
 
     def get_queryset(self):
         user = self.request.user
-        qs = ConnectionRequest.objects.filter(Q(from_user=user) | Q(to_user=user))
+        qs = ConnectionRequest.objects.filter(
+            Q(from_user=user) | Q(to_user=user)
+        ).select_related('from_user', 'to_user')
         direction = self.request.query_params.get('direction')
         if direction == 'incoming':
             qs = qs.filter(to_user=user)
@@ -42,6 +66,102 @@ class ConnectionRequestViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    def perform_update(self, serializer):
+        before = (serializer.instance.from_user_id, serializer.instance.to_user_id)
+        instance = serializer.save()
+        after = (instance.from_user_id, instance.to_user_id)
+        if after != before and instance.status == ConnectionRequest.STATUS_PENDING:
+            relationship_cache.requests_resolved([before])
+            relationship_cache.requests_created([after])
+
+    def perform_destroy(self, instance):
+        # a withdrawn pending request must not keep blocking a new one
+        pending = instance.status == ConnectionRequest.STATUS_PENDING
+        instance.delete()
+        if pending:
+            relationship_cache.requests_resolved([(instance.from_user_id, instance.to_user_id)])
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        Send requests to many users at once: {"to_user_ids": [...], "message": ""}.
+        Users, existing requests and connections are looked up with one query
+        each, the new requests are written with one bulk insert, and each id
+        gets its own result entry.
+        """
+        input_serializer = BulkConnectionRequestSerializer(data=request.data)
+        input_serializer.is_valid(raise_exception=True)
+        to_user_ids = input_serializer.validated_data['to_user_ids']
+        message = input_serializer.validated_data['message']
+        me = request.user
+
+        errors = {}
+        candidates = []
+        seen = set()
+        for to_user_id in to_user_ids:
+            if to_user_id in seen:
+                continue
+            seen.add(to_user_id)
+            if not USER_ID_PATTERN.match(to_user_id):
+                errors[to_user_id] = 'Invalid user ID format.'
+            elif to_user_id == me.pk:
+                errors[to_user_id] = 'Cannot send request to yourself.'
+            else:
+                candidates.append(to_user_id)
+
+        users = User.objects.in_bulk(candidates) if candidates else {}
+        existing = dict(
+            ConnectionRequest.objects.filter(from_user_id=me.pk, to_user_id__in=list(users)).order_by()
+            .values_list('to_user_id', 'status')
+        ) if users else {}
+        connected = relationship_cache.connected_ids(me.pk) if users else frozenset()
+
+        to_create = []
+        for to_user_id in candidates:
+            if to_user_id not in users:
+                errors[to_user_id] = 'User with this ID does not exist.'
+            elif to_user_id in connected:
+                errors[to_user_id] = 'You are already connected with this user.'
+            elif existing.get(to_user_id) == ConnectionRequest.STATUS_PENDING:
+                errors[to_user_id] = 'A pending request already exists.'
+            elif to_user_id in existing:
+                errors[to_user_id] = f'A request was already sent (current: {existing[to_user_id]}).'
+            else:
+                to_create.append(ConnectionRequest(from_user=me, to_user=users[to_user_id], message=message))
+
+        if to_create:
+            try:
+                with transaction.atomic():
+                    ConnectionRequest.objects.bulk_create(to_create)
+                    relationship_cache.requests_created([(me.pk, req.to_user_id) for req in to_create])
+                    notification_outbox.enqueue([
+                        {'recipient_id': req.to_user_id, 'actor_id': me.pk, 'action': 'requested', 'request_id': req.id}
+                        for req in to_create
+                    ])
+            except IntegrityError:
+                return Response(
+                    {'detail': 'Some of these requests were created concurrently; please retry.'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+        created = {req.to_user_id: req for req in to_create}
+        results = []
+        for to_user_id in to_user_ids:
+            if to_user_id not in seen:
+                results.append({'to_user_id': to_user_id, 'status': 'error', 'detail': 'Duplicate user ID.'})
+                continue
+            seen.discard(to_user_id)
+            if to_user_id in created:
+                data = ConnectionRequestSerializer(created[to_user_id], context={'request': request}).data
+                results.append({'to_user_id': to_user_id, 'status': 'created', 'request': data})
+            else:
+                results.append({'to_user_id': to_user_id, 'status': 'error', 'detail': errors[to_user_id]})
+        return Response({
+            'created': len(to_create),
+            'failed': len(results) - len(to_create),
+            'results': results,
+        }, status=status.HTTP_201_CREATED if to_create else status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['post'], url_path='accept')
     def accept(self, request, pk=None):
         """
@@ -52,15 +172,23 @@ class ConnectionRequestViewSet(viewsets.ModelViewSet):
         # Lock the request row to avoid concurrent responders stomping each other
         try:
             with transaction.atomic():
-                req = ConnectionRequest.objects.select_for_update().get(pk=pk)
-                if req.to_user != request.user:  # Compare objects, not IDs
+                # join the sender in the same query but only lock the request row
+                req = (
+                    ConnectionRequest.objects.select_related('from_user')
+                    .select_for_update(of=('self',))
+                    .get(pk=pk)
+                )
+                if req.to_user_id != request.user.pk:
                     return Response({'detail': 'Only the recipient can accept.'}, status=status.HTTP_403_FORBIDDEN)
                 if req.status != ConnectionRequest.STATUS_PENDING:
                     # idempotent: if already accepted/rejected, return appropriate message
                     return Response({'detail': f'Request is not pending (current: {req.status}).'}, status=status.HTTP_400_BAD_REQUEST)
 
+                # the recipient is the authenticated user; reuse it instead of loading it again
+                req.to_user = request.user
+
                 # determine ordering so connection is stored consistently (user1.user_id < user2.user_id)
-                if req.from_user.user_id < req.to_user.user_id:
+                if req.from_user_id < req.to_user_id:
                     a, b = req.from_user, req.to_user
                 else:
                     a, b = req.to_user, req.from_user
@@ -71,26 +199,27 @@ class ConnectionRequestViewSet(viewsets.ModelViewSet):
                 except IntegrityError:
                     # another worker created it in the meantime; fetch existing
                     connection = Connection.objects.filter(user1=a, user2=b).first()
+                # attach the users we already hold so serialization needs no extra queries
+                connection.user1, connection.user2 = a, b
 
                 # mark request accepted
                 req.status = ConnectionRequest.STATUS_ACCEPTED
                 req.responded_at = timezone.now()
                 req.save(update_fields=['status', 'responded_at'])
 
+                # write-through to the cached relationship sets once committed
+                relationship_cache.connections_added([(a.pk, b.pk)])
+                relationship_cache.requests_resolved([(req.from_user_id, req.to_user_id)])
+
+                # notify the sender via the outbox, committed with the accept
+                notification_outbox.enqueue([{
+                    'recipient_id': req.from_user_id, 'actor_id': req.to_user_id,
+                    'action': 'accepted', 'request_id': req.id,
+                }])
+
         except ConnectionRequest.DoesNotExist:
             return Response({'detail': 'Connection request not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        # send notification asynchronously (don't fail the endpoint if task fails)
-        try:
-            send_connection_response_notification.delay(
-                recipient_id=req.from_user.user_id,  # Use user_id instead of id
-                actor_id=req.to_user.user_id,        # Use user_id instead of id
-                action='accepted',
-                request_id=req.id
-            )
-        except Exception as e:
-            logger.exception("Failed to queue notification task for accept: %s", e)
-
         return Response({
             'detail': 'Connection accepted.',
             'connection': ConnectionSerializer(connection, context={'request': request}).data
@@ -104,7 +233,7 @@ class ConnectionRequestViewSet(viewsets.ModelViewSet):
         try:
             with transaction.atomic():
                 req = ConnectionRequest.objects.select_for_update().get(pk=pk)
-                if req.to_user != request.user:  # Compare objects, not IDs
+                if req.to_user_id != request.user.pk:
                     return Response({'detail': 'Only the recipient can reject.'}, status=status.HTTP_403_FORBIDDEN)
                 if req.status != ConnectionRequest.STATUS_PENDING:
                     return Response({'detail': f'Request is not pending (current: {req.status}).'}, status=status.HTTP_400_BAD_REQUEST)
@@ -112,36 +241,164 @@ class ConnectionRequestViewSet(viewsets.ModelViewSet):
                 req.status = ConnectionRequest.STATUS_REJECTED
                 req.responded_at = timezone.now()
                 req.save(update_fields=['status', 'responded_at'])
+                relationship_cache.requests_resolved([(req.from_user_id, req.to_user_id)])
+                notification_outbox.enqueue([{
+                    'recipient_id': req.from_user_id, 'actor_id': req.to_user_id,
+                    'action': 'rejected', 'request_id': req.id,
+                }])
 
         except ConnectionRequest.DoesNotExist:
             return Response({'detail': 'Connection request not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        try:
-            send_connection_response_notification.delay(
-                recipient_id=req.from_user.user_id,  # Use user_id instead of id
-                actor_id=req.to_user.user_id,        # Use user_id instead of id
-                action='rejected',
-                request_id=req.id
-            )
-        except Exception as e:
-            logger.exception("Failed to queue notification task for reject: %s", e)
-
         return Response({'detail': 'Connection rejected.'}, status=status.HTTP_200_OK)
 
-class ConnectionViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['post'], url_path='bulk-accept')
+    def bulk_accept(self, request):
+        """Accept many incoming requests at once: {"ids": [...]}."""
+        return self._bulk_respond(request, ConnectionRequest.STATUS_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        """Reject many incoming requests at once: {"ids": [...]}."""
+        return self._bulk_respond(request, ConnectionRequest.STATUS_REJECTED)
+
+    def _bulk_respond(self, request, new_status):
+        """
+        Set-based version of accept/reject with the same per-request rules
+        (only the recipient may respond, only pending requests change). All
+        rows are locked with one SELECT ... FOR UPDATE, connections and their
+        edges are inserted with one bulk insert each (conflicts from concurrent
+        accepts are ignored), statuses change in one UPDATE, and the
+        notification events go to the outbox in the same transaction.
+        """
+        input_serializer = BulkRespondSerializer(data=request.data)
+        input_serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(input_serializer.validated_data['ids']))
+        me = request.user
+        verb = 'accept' if new_status == ConnectionRequest.STATUS_ACCEPTED else 'reject'
+
+        errors = {}
+        connections = {}
+        with transaction.atomic():
+            requests_by_id = {
+                req.pk: req for req in
+                ConnectionRequest.objects.select_related('from_user')
+                .select_for_update(of=('self',)).filter(pk__in=ids).order_by('pk')
+            }
+            responded = []
+            for pk in ids:
+                req = requests_by_id.get(pk)
+                if req is None:
+                    errors[pk] = (status.HTTP_404_NOT_FOUND, 'Connection request not found.')
+                elif req.to_user_id != me.pk:
+                    errors[pk] = (status.HTTP_403_FORBIDDEN, f'Only the recipient can {verb}.')
+                elif req.status != ConnectionRequest.STATUS_PENDING:
+                    errors[pk] = (status.HTTP_400_BAD_REQUEST, f'Request is not pending (current: {req.status}).')
+                else:
+                    req.to_user = me
+                    responded.append(req)
+
+            if responded and new_status == ConnectionRequest.STATUS_ACCEPTED:
+                senders = {req.from_user_id: req.from_user for req in responded}
+                Connection.objects.bulk_create(
+                    [Connection(user1_id=min(me.pk, s), user2_id=max(me.pk, s)) for s in senders],
+                    ignore_conflicts=True,
+                )
+                # ignore_conflicts returns no primary keys; read the rows back
+                # (new and pre-existing alike) in one query
+                for connection in Connection.objects.filter(
+                    Q(user1_id=me.pk, user2_id__in=list(senders)) | Q(user2_id=me.pk, user1_id__in=list(senders))
+                ):
+                    peer = connection.user2_id if connection.user1_id == me.pk else connection.user1_id
+                    connection.user1, connection.user2 = sorted((me, senders[peer]), key=lambda u: u.pk)
+                    connections[peer] = connection
+                ConnectionEdge.objects.bulk_create(
+                    [edge for connection in connections.values() for edge in ConnectionEdge.for_connection(connection)],
+                    ignore_conflicts=True,
+                )
+                relationship_cache.connections_added([(me.pk, peer) for peer in connections])
+
+            if responded:
+                responded_at = timezone.now()
+                ConnectionRequest.objects.filter(pk__in=[req.pk for req in responded]).update(
+                    status=new_status, responded_at=responded_at,
+                )
+                for req in responded:
+                    req.status, req.responded_at = new_status, responded_at
+                relationship_cache.requests_resolved([(req.from_user_id, me.pk) for req in responded])
+                notification_outbox.enqueue([
+                    {'recipient_id': req.from_user_id, 'actor_id': me.pk, 'action': new_status, 'request_id': req.pk}
+                    for req in responded
+                ])
+
+        context = {'request': request}
+        results = []
+        for pk in ids:
+            if pk in errors:
+                code, detail = errors[pk]
+                results.append({'id': pk, 'status': 'error', 'code': code, 'detail': detail})
+                continue
+            item = {'id': pk, 'status': new_status}
+            if new_status == ConnectionRequest.STATUS_ACCEPTED:
+                peer = requests_by_id[pk].from_user_id
+                item['connection'] = ConnectionSerializer(connections[peer], context=context).data
+            results.append(item)
+        return Response({
+            'updated': len(responded),
+            'failed': len(errors),
+            'results': results,
+        }, status=status.HTTP_200_OK if responded else status.HTTP_400_BAD_REQUEST)
+
+
+class ConnectionViewSet(mixins.DestroyModelMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Connection.objects.all()
     serializer_class = ConnectionSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = ConnectionPagination
 
     def get_queryset(self):
         user = self.request.user
-        return Connection.objects.filter(Q(user1=user) | Q(user2=user))
+        return (
+            Connection.objects.filter(edges__user=user)
+            .annotate(edge_connected_at=F('edges__connected_at'), edge_connection_id=F('edges__connection_id'))
+            .select_related('user1', 'user2')
+        )
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
+        relationship_cache.connections_removed([(instance.user1_id, instance.user2_id)])
         return Response({'detail': 'Connection removed.'}, status=status.HTTP_204_NO_CONTENT)
 
+class ConnectionSuggestionViewSet(viewsets.GenericViewSet):
+    """
+    GET -> "people you may know" for the authenticated user, best first.
+    Reads the rows precomputed by connections.tasks.refresh_connection_suggestions
+    and skips users the caller has connected with or requested since then.
+    """
+    serializer_class = ConnectionSuggestionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    default_limit = 20
+
+    def get_queryset(self):
+        return (
+            ConnectionSuggestion.objects.filter(user=self.request.user)
+            .select_related('suggested')
+            .order_by('-score', 'suggested')
+        )
+
+    def list(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), suggestions.TOP_K)
+        except ValueError:
+            limit = self.default_limit
+        user_id = request.user.pk
+        excluded = relationship_cache.connected_ids(user_id) | relationship_cache.pending_ids(user_id)
+        rows = [row for row in self.get_queryset() if row.suggested_id not in excluded][:max(limit, 0)]
+        serializer = self.get_serializer(rows, many=True)
+        return Response({'results': serializer.data})
+
+
 class NotificationProxyViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Optional: lightweight viewset to show notifications via notifications.serializers.
@@ -150,23 +407,57 @@ class NotificationProxyViewSet(viewsets.ReadOnlyModelViewSet):
     from notifications.serializers import NotificationSerializer
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         from notifications.models import Notification
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('actor', 'recipient')
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def search_users(request):
+@async_api_view(['GET'])
+async def connection_request_list(request):
+    """Async GET of the request inbox (ConnectionRequestViewSet.list)."""
+    return await list_page(ConnectionRequestViewSet, request)
+
+
+@async_api_view(['GET'])
+async def connection_list(request):
+    """Async GET of the connection list (ConnectionViewSet.list)."""
+    return await list_page(ConnectionViewSet, request)
+
+
+@async_api_view(['GET'])
+async def search_users(request):
     q = request.query_params.get('q', '').strip()
     if not q:
-        return Response({'results': []})
-    qs = User.objects.filter(
-        Q(full_name__icontains=q) |
-        Q(company_name__icontains=q) |
-        Q(email__icontains=q) |
-        Q(contact__icontains=q) |
-        Q(username__icontains=q)
-    )[:50]
-    serializer = UserLiteSerializer(qs, many=True)
-    return Response({'results': serializer.data})
\ No newline at end of file
+        return {'results': []}
+    users = [user async for user in search_users_queryset(q)]
+    serializer = UserLiteSerializer(users, many=True)
+    return {'results': serializer.data}
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def connection_path(request):
+    """
+    Shortest chain of connections from the current user to ?to=<user_id>,
+    at most ?max_hops= hops (capped by CONNECTION_PATH_MAX_HOPS).
+    """
+    target = request.query_params.get('to', '').strip()
+    if not target:
+        return Response({'detail': 'Query parameter "to" is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    max_allowed = settings.CONNECTION_PATH_MAX_HOPS
+    try:
+        max_hops = int(request.query_params.get('max_hops', max_allowed))
+    except ValueError:
+        return Response({'detail': 'max_hops must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= max_hops <= max_allowed:
+        return Response({'detail': f'max_hops must be between 1 and {max_allowed}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    path_ids = connection_graph.find_path(request.user.pk, target, max_hops)
+    if path_ids is None:
+        return Response({'detail': f'No connection path within {max_hops} hops.'}, status=status.HTTP_404_NOT_FOUND)
+    users = User.objects.in_bulk(path_ids)
+    if len(users) != len(set(path_ids)):
+        return Response({'detail': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+    serializer = UserLiteSerializer([users[user_id] for user_id in path_ids], many=True)
+    return Response({'degrees': len(path_ids) - 1, 'path': serializer.data})
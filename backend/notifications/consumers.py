@@ -1,15 +1,52 @@
 # notifications/consumers.py
-from channels.generic.websocket import AsyncJsonWebsocketConsumer
+import asyncio
 import logging
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from backend import metrics
+from . import counters, read_state
+from .models import Notification
+from .read_state import with_read_status
+from .serializers import NotificationSerializer
 
 logger = logging.getLogger(__name__)
 
+# notifications read from the database per replay query
+REPLAY_CHUNK_SIZE = 100
+# beyond this many missed notifications the client should reload over REST
+REPLAY_LIMIT = 1000
+# live notifications held back during a replay; past this the buffer is
+# dropped and the replay reads them from the database instead
+HELD_BACK_LIMIT = 500
+# read receipts arriving within this many seconds are written together
+MARK_READ_WINDOW = 0.25
+# per command; a client with more should send ranges or mark_all_read
+MARK_READ_MAX_IDS = 500
+MARK_READ_MAX_RANGES = 50
+
 
 class NotificationConsumer(AsyncJsonWebsocketConsumer):
     """
     WebSocket consumer that subscribes the connected user to a per-user group
     named `user_<user_id>`. Expects scope['user'] to be set (either by session
     auth via AuthMiddlewareStack or by custom TokenAuthMiddleware below).
+
+    Reconnecting clients pass the id of the last notification they saw, either
+    as `?last_seen_id=` or as a first message {"type": "resume", "last_seen_id": N}.
+    Newer notifications are replayed from the database in chunks of
+    REPLAY_CHUNK_SIZE, followed by {"type": "replay_complete"}; live
+    notifications that arrive meanwhile are held back and sent afterwards,
+    skipping any the replay already delivered. If more than HELD_BACK_LIMIT
+    arrive, they are dropped and the replay reads on from the database.
+
+    Read receipts: {"type": "mark_read", "ids": [...], "ranges": [[first, last], ...]}
+    and {"type": "mark_all_read"}, each with an optional client `ref`. Commands
+    received within MARK_READ_WINDOW are coalesced into one write
+    (read_state.mark_read / mark_all_read) and acknowledged together with
+    {"type": "mark_read_ack", "refs", "updated", "unread"}.
     """
 
     async def connect(self):
@@ -23,13 +60,34 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         # otherwise fall back to user.pk.
         user_key = getattr(user, "user_id", None) or getattr(user, "pk", None)
         self.group_name = f"user_{user_key}"
+        self.replay_task = None
+        self.held_back = None  # live notifications buffered while a replay runs
+        self.held_back_dropped = False
+        self.replayed_through = 0
+        self.reset_pending_reads()
+        self.flush_task = None
 
-        # Register to group and accept connection
+        # join the group before replaying so nothing falls between the two
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
+        metrics.WEBSOCKET_CONNECTIONS.inc()
+        self.counted = True
         logger.debug("WS connect: user=%s joined group=%s", user_key, self.group_name)
 
+        last_seen = parse_qs(self.scope.get("query_string", b"").decode()).get("last_seen_id")
+        if last_seen:
+            self.start_replay(last_seen[0])
+
     async def disconnect(self, close_code):
+        if getattr(self, "counted", False):
+            metrics.WEBSOCKET_CONNECTIONS.dec()
+            self.counted = False
+        if getattr(self, "replay_task", None) is not None:
+            self.replay_task.cancel()
+        if getattr(self, "flush_task", None) is not None:
+            # write receipts still waiting for their window; nobody is left to ack
+            self.flush_task.cancel()
+            await self.write_pending_reads()
         # Remove from group on disconnect
         try:
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
@@ -39,17 +97,140 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
 
     async def receive_json(self, content, **kwargs):
         """
-        Optionally handle incoming JSON from client.
-        We'll support a simple 'ping' message so the client can keep the connection alive.
+        Handle incoming JSON from the client: `ping` keep-alives and `resume`.
         """
         typ = content.get("type")
         if typ == "ping":
             await self.send_json({"type": "pong"})
             return
+        if typ == "resume":
+            if not self.start_replay(content.get("last_seen_id")):
+                await self.send_json({"type": "error", "detail": "Invalid or duplicate resume."})
+            return
+        if typ in ("mark_read", "mark_all_read"):
+            await self.queue_read_receipt(typ, content)
+            return
 
-        # you can extend this to handle client actions (e.g., mark-read via WS)
         logger.debug("WS received message: %s", content)
 
+    # --- replay ---
+
+    def start_replay(self, last_seen_id):
+        """Start replaying notifications newer than `last_seen_id` in the background."""
+        try:
+            last_seen_id = int(last_seen_id)
+        except (TypeError, ValueError):
+            return False
+        if self.replay_task is not None or last_seen_id < 0:
+            return False
+        self.held_back = []
+        # run alongside the dispatch loop so live messages keep being received
+        self.replay_task = asyncio.ensure_future(self.replay(last_seen_id))
+        return True
+
+    async def replay(self, last_seen_id):
+        user = self.scope["user"]
+        last_id = last_seen_id
+        sent = 0
+        truncated = False
+        try:
+            while True:
+                rows = with_read_status(
+                    Notification.objects.filter(recipient_id=user.pk, id__gt=last_id)
+                    .select_related("actor", "recipient").order_by("id")
+                )[:REPLAY_CHUNK_SIZE]
+                chunk = [notification async for notification in rows]
+                for notification in chunk:
+                    await self.send_json({
+                        "type": "notification", "data": NotificationSerializer(notification).data, "replay": True,
+                    })
+                if chunk:
+                    last_id = chunk[-1].id
+                    self.replayed_through = last_id
+                sent += len(chunk)
+                if len(chunk) < REPLAY_CHUNK_SIZE:
+                    if not self.held_back_dropped:
+                        break
+                    # the dropped notifications are committed; read on from here
+                    self.held_back_dropped = False
+                    continue
+                if sent >= REPLAY_LIMIT:
+                    truncated = True
+                    break
+            await self.send_json({"type": "replay_complete", "count": sent, "last_id": last_id, "truncated": truncated})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Notification replay failed for %s", user.pk)
+            await self.send_json({"type": "replay_complete", "count": sent, "last_id": last_id, "truncated": True})
+        # from here on live messages are sent as they arrive
+        held_back, self.held_back = self.held_back, None
+        for notification in held_back:
+            await self.send_live(notification)
+
+    # --- read receipts ---
+
+    def reset_pending_reads(self):
+        self.pending_ids = set()
+        self.pending_ranges = []
+        self.pending_all = False
+        self.pending_refs = []
+
+    async def queue_read_receipt(self, typ, content):
+        if typ == "mark_all_read":
+            self.pending_all = True
+        else:
+            ids, ranges = content.get("ids") or [], content.get("ranges") or []
+            if not (isinstance(ids, list) and isinstance(ranges, list)) or (
+                len(ids) > MARK_READ_MAX_IDS or len(ranges) > MARK_READ_MAX_RANGES
+                or not all(type(i) is int for i in ids)
+                or not all(
+                    isinstance(r, list) and len(r) == 2 and all(type(i) is int for i in r) and r[0] <= r[1]
+                    for r in ranges
+                )
+            ):
+                await self.send_json({"type": "error", "detail": "Invalid mark_read.", "ref": content.get("ref")})
+                return
+            self.pending_ids.update(ids)
+            self.pending_ranges.extend(tuple(r) for r in ranges)
+        self.pending_refs.append(content.get("ref"))
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_reads_later())
+
+    async def flush_reads_later(self):
+        await asyncio.sleep(MARK_READ_WINDOW)
+        self.flush_task = None
+        refs = self.pending_refs
+        try:
+            updated, unread = await self.write_pending_reads()
+        except Exception:
+            logger.exception("Writing read receipts failed for %s", self.scope["user"].pk)
+            await self.send_json({"type": "error", "detail": "Could not mark notifications read.", "refs": refs})
+            return
+        await self.send_json({"type": "mark_read_ack", "refs": refs, "updated": updated, "unread": unread})
+
+    async def write_pending_reads(self):
+        """Write and clear the pending receipts; returns (updated, unread)."""
+        ids, ranges, mark_all = self.pending_ids, self.pending_ranges, self.pending_all
+        self.reset_pending_reads()
+        return await self._write_reads(self.scope["user"].pk, ids, ranges, mark_all)
+
+    @database_sync_to_async
+    def _write_reads(self, user_id, ids, ranges, mark_all):
+        if mark_all:
+            # the watermark covers every id the client can have seen
+            return read_state.mark_all_read(user_id), 0
+        updated = read_state.mark_read(user_id, ids=ids, ranges=ranges)
+        return updated, counters.unread_count(user_id)
+
+    # --- live delivery ---
+
+    async def send_live(self, notification):
+        # already delivered by the replay
+        if notification.get("id") is not None and notification["id"] <= self.replayed_through:
+            return
+        await self.send_json({"type": "notification", "data": notification})
+
     async def notification_message(self, event):
         """
         Handler for group messages sent via channel_layer.group_send.
@@ -59,5 +240,11 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         if not notification:
             # nothing to send
             return
-        # ensure the payload is JSON-serializable
-        await self.send_json({"type": "notification", "data": notification})
+        if self.held_back is not None:
+            if len(self.held_back) >= HELD_BACK_LIMIT:
+                self.held_back = []
+                self.held_back_dropped = True
+            else:
+                self.held_back.append(notification)
+            return
+        await self.send_live(notification)
@@ -0,0 +1,127 @@
+# notifications/counters.py
+"""
+Maintained per-user unread counters (NotificationState.unread).
+
+- increment(): called in the same transaction that inserts notifications,
+  before the insert; one upsert statement per batch, whatever the number of
+  recipients.
+- decrement(): used by mark-read in the same transaction as the read-flag
+  change; mark-all-read zeroes it with the read watermark
+  (notifications.read_state).
+- unread_count(): the badge; a primary-key lookup, initialised from a COUNT
+  on the partial unread index the first time a user asks.
+- reconcile(): periodic job that recomputes counters from the notifications
+  table, fixing drift from writers that bypass increment() (bulk loads,
+  admin edits).
+
+Inserts take the counter row lock (the upsert) before they allocate
+notification ids, and mark-all-read locks the row before reading the highest
+notification id. A notification is therefore either committed before the
+watermark is read, or gets an id above it; it can never end up under the
+watermark while still counted as unread.
+
+"Unread" means read=False and above the user's read watermark.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Notification, NotificationState
+from .read_state import unread_q, with_read_status
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def increment(recipient_ids):
+    """Add one unread notification per occurrence of a recipient id in `recipient_ids`."""
+    counts = Counter(recipient_ids)
+    if not counts:
+        return
+    qn = connection.ops.quote_name
+    table = qn(NotificationState._meta.db_table)
+    user_col = qn(NotificationState._meta.get_field('user').column)
+    unread_col = qn('unread')
+    rows = sorted(counts.items())  # consistent lock order between writers
+    watermark_col = qn('read_through_id')
+    values = ', '.join(['(%s, %s, 0)'] * len(rows))
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_col}, {unread_col}, {watermark_col}) VALUES {values} '
+            f'ON CONFLICT ({user_col}) DO UPDATE SET {unread_col} = {table}.{unread_col} + EXCLUDED.{unread_col}',
+            params,
+        )
+
+
+def decrement(user_id, by=1):
+    NotificationState.objects.filter(user_id=user_id).update(unread=F('unread') - by)
+
+
+def unread_count(user_id):
+    unread = NotificationState.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+    if unread is None:
+        state, _ = NotificationState.objects.get_or_create(
+            user_id=user_id,
+            defaults={'unread': Notification.objects.filter(recipient_id=user_id, read=False).count()},  # no watermark yet
+        )
+        unread = state.unread
+    return max(unread, 0)
+
+
+def backfill(batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Set the counter of every user with unread notifications from the
+    notifications table (creating missing rows). Used after bulk loads that
+    bypass increment(); returns the number of counters written.
+    """
+    counts = (
+        with_read_status(Notification.objects.filter(read=False)).filter(unread_q()).order_by()
+        .values_list('recipient_id').annotate(unread=Count('id'))
+    )
+    written = 0
+    batch = []
+    for user_id, unread in counts.iterator(chunk_size=batch_size):
+        batch.append(NotificationState(user_id=user_id, unread=unread))
+        if len(batch) >= batch_size:
+            written += _upsert(batch)
+            batch = []
+    return written + _upsert(batch)
+
+
+def _upsert(states):
+    NotificationState.objects.bulk_create(
+        states, update_conflicts=True, unique_fields=['user'], update_fields=['unread'],
+    )
+    return len(states)
+
+
+def reconcile(batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Recompute every stored counter from the notifications table, in batches
+    of users (each batch locks its counter rows while counting). Returns the
+    number of counters that had drifted.
+    """
+    fixed = 0
+    last_user = ''
+    while True:
+        with transaction.atomic():
+            states = list(
+                NotificationState.objects.select_for_update().filter(user_id__gt=last_user)
+                .order_by('user_id')[:batch_size]
+            )
+            if not states:
+                return fixed
+            actual = dict(
+                with_read_status(Notification.objects.filter(recipient_id__in=[s.user_id for s in states]))
+                .filter(unread_q()).order_by().values_list('recipient_id').annotate(unread=Count('id'))
+            )
+            now = timezone.now()
+            for state in states:
+                if state.unread != actual.get(state.user_id, 0):
+                    fixed += 1
+                state.unread = actual.get(state.user_id, 0)
+                state.reconciled_at = now
+            NotificationState.objects.bulk_update(states, ['unread', 'reconciled_at'])
+        last_user = states[-1].user_id
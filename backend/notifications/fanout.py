@@ -0,0 +1,85 @@
+# notifications/fanout.py
+"""
+Broadcast fan-out: one notification to every connection of a user.
+
+Recipients are streamed from ConnectionEdge in (user, peer) order, which is
+the edge table's unique index, in chunks of FANOUT_CHUNK_SIZE. Each chunk's
+notifications are bulk-inserted in the same transaction that advances the
+Broadcast's cursor. The row is locked, so two workers never write the same
+chunk, and a worker that dies loses nothing: the next run (or
+resume_stalled_broadcasts) continues after the last committed recipient.
+Pushes happen after each chunk commits, with bounded concurrency. A push lost
+to a crash is not retried; the notification is already stored.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from connections.models import ConnectionEdge
+
+from . import counters
+from .models import Broadcast, Notification
+from .tasks import fan_out_broadcast, push_notifications
+
+FANOUT_CHUNK_SIZE = 1000
+FANOUT_PUSH_CONCURRENCY = 50
+# chunks handled per task run before the task re-queues itself
+CHUNKS_PER_RUN = 20
+STALL_AFTER = timedelta(minutes=5)
+
+
+def start_broadcast(actor, verb, message=''):
+    """Record a broadcast and queue its fan-out once the transaction commits."""
+    broadcast = Broadcast.objects.create(actor=actor, verb=verb, message=message)
+    transaction.on_commit(lambda: fan_out_broadcast.delay(broadcast.pk))
+    return broadcast
+
+
+def _write_chunk(broadcast_id):
+    """Deliver the next chunk; returns (notifications, done)."""
+    with transaction.atomic():
+        broadcast = Broadcast.objects.select_for_update().select_related('actor').get(pk=broadcast_id)
+        if broadcast.status == Broadcast.STATUS_DONE:
+            return [], True
+        recipients = list(
+            ConnectionEdge.objects.filter(user_id=broadcast.actor_id, peer_id__gt=broadcast.cursor)
+            .order_by('peer_id').values_list('peer_id', flat=True)[:FANOUT_CHUNK_SIZE]
+        )
+        notifications = [
+            Notification(recipient_id=recipient_id, actor=broadcast.actor, verb=broadcast.verb, message=broadcast.message)
+            for recipient_id in recipients
+        ]
+        # counter row locks before the ids are allocated (see notifications.counters)
+        counters.increment(recipients)
+        Notification.objects.bulk_create(notifications)
+        done = len(recipients) < FANOUT_CHUNK_SIZE
+        if recipients:
+            broadcast.cursor = recipients[-1]
+            broadcast.delivered += len(recipients)
+        broadcast.status = Broadcast.STATUS_DONE if done else Broadcast.STATUS_RUNNING
+        if done:
+            broadcast.finished_at = timezone.now()
+        broadcast.save(update_fields=['cursor', 'delivered', 'status', 'finished_at', 'updated_at'])
+    return notifications, done
+
+
+def run_broadcast(broadcast_id, max_chunks=CHUNKS_PER_RUN):
+    """Deliver up to `max_chunks` chunks; returns True once the broadcast is done."""
+    for _ in range(max_chunks):
+        notifications, done = _write_chunk(broadcast_id)
+        if notifications:
+            push_notifications(notifications, concurrency=FANOUT_PUSH_CONCURRENCY)
+        if done:
+            return True
+    return False
+
+
+def stalled_broadcast_ids(now=None):
+    """Unfinished broadcasts whose heartbeat is older than STALL_AFTER."""
+    cutoff = (now or timezone.now()) - STALL_AFTER
+    return list(
+        Broadcast.objects.filter(
+            status__in=[Broadcast.STATUS_PENDING, Broadcast.STATUS_RUNNING], updated_at__lt=cutoff,
+        ).values_list('pk', flat=True)
+    )
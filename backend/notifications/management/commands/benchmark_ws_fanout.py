@@ -0,0 +1,240 @@
+# notifications/management/commands/benchmark_ws_fanout.py
+"""
+End-to-end benchmark of notification WebSockets in one process.
+
+    python manage.py benchmark_ws_fanout --sockets 5000 --batch-size 100
+
+Creates --sockets users, each with a pending connection request to one
+acceptor user. It then opens one authenticated NotificationConsumer socket
+per user through the real WebSocket stack (QueryStringTokenAuthMiddleware and
+the URL router, driven by Channels' WebsocketCommunicator). The acceptor
+accepts the requests through POST /api/connections/requests/bulk-accept/ in
+--batch-size chunks, and the outbox relay task runs in Celery eager mode.
+Reported:
+- connect rate;
+- resident memory added per open socket;
+- accept-to-delivery latency (p50/p99/max), from the start of the accept
+  call until the socket receives the notification.
+
+By default the in-memory channel layer is used; --layer configured uses
+CHANNEL_LAYERS (e.g. a local Redis). Database and cache are the configured
+ones. Benchmark users get ids under --id-date and are deleted afterwards
+(with everything that references them) unless --keep is given; leftovers of
+an interrupted run are removed at the start of the next one.
+"""
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import resource
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from backend.celery_app import app as celery_app
+from connections.models import ConnectionRequest
+from notifications.routing import websocket_urlpatterns
+from notifications.tasks import relay_notification_outbox
+from notifications.token_middleware import QueryStringTokenAuthMiddleware
+
+User = get_user_model()
+
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 1000}}}
+MAX_SOCKETS = 16 ** 6 - 1
+# bulk-accept takes at most this many ids per call
+MAX_BATCH_SIZE = 100
+
+
+def _rss_bytes():
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm', encoding='ascii') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark notification WebSockets: connect rate, memory per socket and accept-to-push latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=1000)
+        parser.add_argument('--connect-concurrency', type=int, default=200,
+                            help='Sockets connecting at the same time.')
+        parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE,
+                            help=f'Requests accepted per bulk-accept call (at most {MAX_BATCH_SIZE}).')
+        parser.add_argument('--layer', choices=('memory', 'configured'), default='memory',
+                            help='Channel layer: in-memory, or the CHANNEL_LAYERS setting.')
+        parser.add_argument('--timeout', type=float, default=10.0,
+                            help='Seconds to wait for a connect or a notification.')
+        parser.add_argument('--id-date', default='19990101',
+                            help='Date segment of the benchmark user ids.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **opts):
+        if not 0 < opts['sockets'] <= MAX_SOCKETS:
+            raise CommandError(f'--sockets must be between 1 and {MAX_SOCKETS}.')
+        if not 0 < opts['batch_size'] <= MAX_BATCH_SIZE:
+            raise CommandError(f'--batch-size must be between 1 and {MAX_BATCH_SIZE}.')
+        self.opts = opts
+        self.id_prefix = f"SPC-{opts['id_date']}-"
+
+        layer = override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER) if opts['layer'] == 'memory' else contextlib.nullcontext()
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with layer:
+                self.remove_users()
+                acceptor, requests, tokens = self.create_users(opts['sockets'])
+                try:
+                    results = async_to_sync(self.run)(acceptor, requests, tokens)
+                finally:
+                    if not opts['keep']:
+                        self.remove_users()
+        finally:
+            celery_app.conf.task_always_eager = eager
+        self.report(results)
+
+    # --- setup ---
+
+    def remove_users(self):
+        User.objects.filter(user_id__startswith=self.id_prefix).delete()
+
+    def create_users(self, count):
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(
+                user_id=f'{self.id_prefix}{index:06x}',
+                username=f'wsbench_{index}',
+                email=f'wsbench_{index}@example.invalid',
+                full_name=f'WS Bench {index}',
+                contact=f'wsbench-{index}',
+                password=password,
+            )
+            for index in range(count + 1)
+        ])
+        acceptor, senders = users[0], users[1:]
+        requests = ConnectionRequest.objects.bulk_create([
+            ConnectionRequest(from_user=sender, to_user=acceptor) for sender in senders
+        ])
+        tokens = {sender.pk: str(SlidingToken.for_user(sender)) for sender in senders}
+        return acceptor, [(request.pk, request.from_user_id) for request in requests], tokens
+
+    # --- benchmark ---
+
+    async def run(self, acceptor, requests, tokens):
+        opts = self.opts
+        application = QueryStringTokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        communicators = {}
+        semaphore = asyncio.Semaphore(opts['connect_concurrency'])
+
+        async def connect(user_id, token):
+            async with semaphore:
+                communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={token}')
+                connected, _ = await communicator.connect(timeout=opts['timeout'])
+                if connected:
+                    communicators[user_id] = communicator
+
+        gc.collect()
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(user_id, token) for user_id, token in tokens.items()))
+        connect_seconds = time.perf_counter() - started
+        gc.collect()
+        rss_added = _rss_bytes() - rss_before
+
+        latencies = []
+
+        async def receive(communicator, sent_at):
+            try:
+                await communicator.receive_json_from(timeout=opts['timeout'])
+            except asyncio.TimeoutError:
+                return
+            latencies.append(time.perf_counter() - sent_at)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {SlidingToken.for_user(acceptor)}')
+        post = sync_to_async(client.post)
+        relay = sync_to_async(relay_notification_outbox.delay)
+        receivers = []
+        started = time.perf_counter()
+        for offset in range(0, len(requests), opts['batch_size']):
+            batch = requests[offset:offset + opts['batch_size']]
+            sent_at = time.perf_counter()
+            receivers.extend(
+                asyncio.ensure_future(receive(communicators[user_id], sent_at))
+                for _, user_id in batch if user_id in communicators
+            )
+            response = await post(
+                '/api/connections/requests/bulk-accept/', {'ids': [pk for pk, _ in batch]}, format='json',
+            )
+            if response.status_code != 200:
+                raise CommandError(f'bulk-accept failed ({response.status_code}): {response.data}')
+            await relay()
+        await asyncio.gather(*receivers)
+        delivery_seconds = time.perf_counter() - started
+
+        for communicator in communicators.values():
+            await communicator.disconnect()
+
+        return {
+            'sockets': len(tokens),
+            'connected': len(communicators),
+            'connect_seconds': round(connect_seconds, 3),
+            'connects_per_second': round(len(communicators) / connect_seconds, 1) if connect_seconds else None,
+            'rss_added_bytes': rss_added,
+            'bytes_per_socket': round(rss_added / len(communicators)) if communicators else None,
+            'accepted': len(requests),
+            'delivered': len(latencies),
+            'delivery_seconds': round(delivery_seconds, 3),
+            'latency_ms': {
+                name: None if value is None else round(value * 1000, 2)
+                for name, value in (
+                    ('p50', _percentile(latencies, 50)),
+                    ('p99', _percentile(latencies, 99)),
+                    ('max', max(latencies, default=None)),
+                )
+            },
+            'layer': opts['layer'],
+        }
+
+    # --- output ---
+
+    def report(self, results):
+        if self.opts['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        latency = results['latency_ms']
+        self.stdout.write(
+            f"sockets:  {results['connected']}/{results['sockets']} connected in {results['connect_seconds']} s "
+            f"({results['connects_per_second']} connects/s)"
+        )
+        if results['bytes_per_socket'] is not None:
+            self.stdout.write(
+                f"memory:   {results['bytes_per_socket'] / 1024:.1f} KiB per socket "
+                f"(RSS +{results['rss_added_bytes'] / 2 ** 20:.1f} MiB)"
+            )
+        self.stdout.write(
+            f"delivery: {results['delivered']}/{results['accepted']} notifications in "
+            f"{results['delivery_seconds']} s; p50 {latency['p50']} ms, p99 {latency['p99']} ms, "
+            f"max {latency['max']} ms"
+        )
+        style = self.style.SUCCESS if results['delivered'] == results['accepted'] else self.style.WARNING
+        self.stdout.write(style(f"channel layer: {results['layer']}"))
@@ -0,0 +1,42 @@
+# notifications/management/commands/relay_notification_outbox.py
+"""
+Long-running outbox relay, an alternative to the beat task when
+notifications should go out within a fraction of a second:
+
+    python manage.py relay_notification_outbox --interval 0.2
+
+Several relays can run at once; they claim disjoint rows (SKIP LOCKED).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications.outbox import RELAY_BATCH_SIZE, relay_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver notification outbox events continuously (or once with --once).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELAY_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox and exit.')
+
+    def handle(self, *args, **opts):
+        batch_size = opts['batch_size']
+        relayed = 0
+        try:
+            while True:
+                close_old_connections()
+                claimed = relay_batch(batch_size)
+                relayed += claimed
+                if claimed < batch_size:
+                    if opts['once']:
+                        break
+                    time.sleep(opts['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Relayed {relayed} outbox events')
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'notification_outbox',
+                'indexes': [models.Index(condition=models.Q(('published_at__isnull', True)), fields=['id'], name='notif_outbox_unpublished_idx')],
+            },
+        ),
+    ]
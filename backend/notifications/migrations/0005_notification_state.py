@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_unread_counts(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationState = apps.get_model('notifications', 'NotificationState')
+    counts = (
+        Notification.objects.filter(read=False).order_by()
+        .values_list('recipient_id').annotate(unread=models.Count('id'))
+    )
+    batch = []
+    for user_id, unread in counts.iterator(chunk_size=5000):
+        batch.append(NotificationState(user_id=user_id, unread=unread))
+        if len(batch) >= 5000:
+            NotificationState.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    NotificationState.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notification_outbox'),
+        ('users', '0003_user_search_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'notification_state',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient', '-created_at', '-id'], name='notif_recipient_unread_idx'),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationstate',
+            name='read_through_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
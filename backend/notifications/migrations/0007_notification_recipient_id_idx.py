@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-16 22:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_read_watermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'id'], name='notif_recipient_id_idx'),
+        ),
+    ]
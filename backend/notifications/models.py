@@ -26,6 +26,112 @@ class Notification(models.Model):
     class Meta:
         ordering = ['-created_at']
         db_table = 'Notification'
+        # backs keyset pagination of a recipient's notifications
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notif_recipient_created_idx'),
+            # WebSocket replay: a recipient's notifications after a given id
+            models.Index(fields=['recipient', 'id'], name='notif_recipient_id_idx'),
+            # unread listings (?unread=true) and unread-count reconciliation; rows
+            # under the read watermark leave it once clear_read_flags has run
+            models.Index(
+                fields=['recipient', '-created_at', '-id'], name='notif_recipient_unread_idx',
+                condition=models.Q(read=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Notification to {self.recipient}: {self.verb}"
+
+
+class Broadcast(models.Model):
+    """
+    One notification sent to every connection of `actor` ("X updated their
+    company"). Delivery is done in chunks by notifications.fanout; `cursor`
+    is the last recipient id written, committed together with each chunk's
+    notifications, so an interrupted fan-out resumes where it stopped.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    actor = models.ForeignKey(
+        UserModel,
+        related_name='broadcasts',
+        on_delete=models.CASCADE,
+    )
+    verb = models.CharField(max_length=100)
+    message = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    cursor = models.CharField(max_length=64, blank=True, default='')
+    delivered = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # heartbeat: bumped with every chunk, used to find stalled fan-outs
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        db_table = 'notification_broadcast'
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='notif_broadcast_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Broadcast from {self.actor_id}: {self.verb} [{self.status}]"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Notification events written in the same transaction as the change that
+    caused them (e.g. accepting a request) and delivered afterwards by the
+    relay in notifications.outbox, so the request never waits on, or loses an
+    event to, the broker.
+    """
+    # same keys as the notification tasks take: recipient_id, actor_id, action, request_id
+    event = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'notification_outbox'
+        indexes = [
+            # the relay only ever scans unpublished rows, oldest first
+            models.Index(
+                fields=['id'], name='notif_outbox_unpublished_idx',
+                condition=models.Q(published_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Outbox #{self.pk} ({'published' if self.published_at else 'pending'})"
+
+
+class NotificationState(models.Model):
+    """
+    Per-user notification bookkeeping, one row per user:
+    - unread: maintained unread counter (see notifications.counters), so the
+      unread badge is a primary-key lookup instead of a COUNT over the backlog.
+    - read_through_id: read watermark; every notification of the user with
+      id <= read_through_id counts as read whatever its own `read` flag
+      (see notifications.read_state).
+    """
+    user = models.OneToOneField(
+        UserModel,
+        primary_key=True,
+        related_name='notification_state',
+        on_delete=models.CASCADE,
+    )
+    unread = models.IntegerField(default=0)
+    read_through_id = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'notification_state'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
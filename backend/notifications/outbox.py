@@ -0,0 +1,64 @@
+# notifications/outbox.py
+"""
+Transactional outbox for notification events.
+
+Request handlers call enqueue() inside their transaction; the rows commit or
+roll back with the change they describe, and no broker call happens on the
+request path. The relay (relay_outbox) claims the oldest unpublished rows
+with SELECT ... FOR UPDATE SKIP LOCKED, so several relays can run side by
+side. It creates their notifications with one bulk insert in the same
+transaction that marks the rows published, so every event becomes exactly one
+notification, and pushes them to the channel groups after commit.
+
+The relay runs from Celery beat (notifications.tasks.relay_notification_outbox)
+or as a long-running process (manage.py relay_notification_outbox).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NotificationOutbox
+from .tasks import create_notifications, push_notifications
+
+RELAY_BATCH_SIZE = 500
+# published rows are kept this long for inspection, then purged
+RETENTION = timedelta(days=1)
+
+
+def enqueue(events):
+    """Write `events` to the outbox; call inside the transaction that produced them."""
+    NotificationOutbox.objects.bulk_create([NotificationOutbox(event=event) for event in events])
+
+
+def relay_batch(batch_size=RELAY_BATCH_SIZE):
+    """Deliver one batch of unpublished events; returns how many rows were claimed."""
+    with transaction.atomic():
+        rows = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(published_at__isnull=True).order_by('id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        notifications = create_notifications([row.event for row in rows])
+        NotificationOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(published_at=timezone.now())
+    if notifications:
+        push_notifications(notifications)
+    return len(rows)
+
+
+def relay_outbox(batch_size=RELAY_BATCH_SIZE, max_batches=20):
+    """Relay until the outbox is drained or `max_batches` batches were sent."""
+    relayed = 0
+    for _ in range(max_batches):
+        claimed = relay_batch(batch_size)
+        relayed += claimed
+        if claimed < batch_size:
+            break
+    return relayed
+
+
+def purge_published(now=None):
+    cutoff = (now or timezone.now()) - RETENTION
+    deleted, _ = NotificationOutbox.objects.filter(published_at__lt=cutoff).delete()
+    return deleted
@@ -15,8 +15,8 @@ class IsRecipientOrReadOnly(permissions.BasePermission):
         # Read-only permissions are allowed for any authenticated user
         if request.method in permissions.SAFE_METHODS:
             return True
-        # Otherwise only the recipient can modify/delete
-        return obj.recipient == request.user
+        # Otherwise only the recipient can modify/delete (id comparison avoids loading the FK)
+        return obj.recipient_id == request.user.pk
 
 
 class IsStaffOrSystemCreateOnly(permissions.BasePermission):
@@ -27,7 +27,8 @@ class IsStaffOrSystemCreateOnly(permissions.BasePermission):
     - Celery tasks that create Notification objects directly in DB are unaffected because they don't use this API permission.
     """
     def has_permission(self, request, view):
-        if request.method != 'POST':
+        # Only guard creation; other POST actions (e.g. mark-read) are not creates.
+        if request.method != 'POST' or getattr(view, 'action', None) != 'create':
             return True
         # Only staff/superuser may create via the API.
         user = request.user
@@ -45,4 +46,4 @@ class IsRecipientOrActorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return (obj.recipient == request.user) or (obj.actor == request.user)
+        return request.user.pk in (obj.recipient_id, obj.actor_id)
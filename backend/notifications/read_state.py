@@ -0,0 +1,133 @@
+# notifications/read_state.py
+"""
+Read status = per-row flag OR the user's read watermark.
+
+mark-all-read moves NotificationState.read_through_id up to the user's highest
+notification id: a write to one row, however long the backlog. The per-row
+`read` flag is set by single mark-read calls for notifications above the
+watermark, and afterwards for the rows under it by clear_read_flags(), in
+batches off the request path, so the partial index on unread rows only holds
+rows that are actually unread. Querysets get the derived status through
+with_read_status(); the watermark comes from a join on the recipient's state
+row, so it costs no extra query. Filters for one user compare ids against
+that user's watermark as a scalar (see unread_q()), which the database can
+use as an index bound; a join column cannot be one.
+
+mark_read() flips the flag for a batch of ids and id ranges in one UPDATE;
+the WebSocket consumer coalesces a client's read receipts into it. delete()
+removes one notification and takes it off the counter if it was unread.
+"""
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Notification, NotificationState
+
+# rows per UPDATE in clear_read_flags()
+CLEAR_BATCH_SIZE = 1000
+
+WATERMARK = Coalesce(F('recipient__notification_state__read_through_id'), Value(0))
+
+
+def with_read_status(queryset):
+    """Annotate `is_read` (flag or watermark) on a Notification queryset."""
+    return queryset.annotate(
+        read_through_id=WATERMARK,
+        is_read=ExpressionWrapper(Q(read=True) | Q(id__lte=F('read_through_id')), output_field=BooleanField()),
+    )
+
+
+def _watermark_of(user_id):
+    # uncorrelated, so evaluated once per query (an InitPlan on Postgres)
+    watermark = NotificationState.objects.filter(user_id=user_id).values('read_through_id')[:1]
+    return Coalesce(Subquery(watermark), Value(0))
+
+
+def unread_q(user_id=None):
+    """
+    Filter for unread rows. With `user_id`, for a queryset of that user's
+    notifications, compared against the watermark as a scalar; without, on a
+    queryset annotated by with_read_status() (batch jobs over many users).
+    """
+    if user_id is None:
+        return Q(read=False, id__gt=F('read_through_id'))
+    return Q(read=False, id__gt=_watermark_of(user_id))
+
+
+def mark_all_read(user_id):
+    """
+    Mark every current notification of `user_id` read by moving the
+    watermark to the highest notification id (status compares ids, not
+    timestamps) and zeroing the unread counter: a single-row write. The
+    per-row flags under the new watermark are cleared afterwards by the
+    clear_read_flags task. Returns how many notifications were unread.
+    """
+    from .tasks import clear_read_flags  # tasks imports this module via counters
+    with transaction.atomic():
+        # lock the state row first; the highest id is read after any concurrent
+        # insert holding the row has committed (see notifications.counters)
+        state = NotificationState.objects.select_for_update().filter(user_id=user_id).first()
+        if state is None:
+            # a concurrent counter upsert or mark-all-read may create it first
+            NotificationState.objects.bulk_create([NotificationState(user_id=user_id)], ignore_conflicts=True)
+            state = NotificationState.objects.select_for_update().get(user_id=user_id)
+        highest = Notification.objects.filter(recipient_id=user_id).order_by('-id').values('id')[:1]
+        NotificationState.objects.filter(pk=state.pk).update(
+            read_through_id=Greatest(Coalesce(Subquery(highest), Value(0)), F('read_through_id')), unread=0,
+        )
+        transaction.on_commit(lambda: clear_read_flags.delay(user_id))
+    return max(state.unread, 0)
+
+
+def clear_read_flags(user_id, batch_size=CLEAR_BATCH_SIZE):
+    """
+    Set the `read` flag on the notifications of `user_id` under the
+    watermark, `batch_size` rows per UPDATE, so they leave the partial index
+    on unread rows. Their status and the counter do not change. Returns the
+    number of rows updated.
+    """
+    cleared = 0
+    while True:
+        batch = list(
+            Notification.objects.filter(recipient_id=user_id, read=False, id__lte=_watermark_of(user_id))
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not batch:
+            return cleared
+        cleared += Notification.objects.filter(pk__in=batch, read=False).update(read=True)
+
+
+def _unread_of(user_id):
+    return Notification.objects.filter(unread_q(user_id), recipient_id=user_id)
+
+
+def delete(user_id, notification_id):
+    """Delete a notification of `user_id`, decrementing the unread counter if it was unread."""
+    from . import counters  # counters imports this module
+    with transaction.atomic():
+        # conditional delete first, so a concurrent mark-read and this cannot both decrement
+        unread, _ = _unread_of(user_id).filter(pk=notification_id).delete()
+        if unread:
+            counters.decrement(user_id, by=unread)
+        else:
+            Notification.objects.filter(recipient_id=user_id, pk=notification_id).delete()
+
+
+def mark_read(user_id, ids=(), ranges=()):
+    """
+    Mark the notifications of `user_id` with an id in `ids` or in one of the
+    inclusive (first, last) `ranges` read, with one UPDATE, and decrement the
+    unread counter by the number of rows that changed. Rows already read,
+    including those under the watermark, are left alone. Returns that number.
+    """
+    match = Q(id__in=list(ids)) if ids else Q()
+    for first, last in ranges:
+        match |= Q(id__gte=first, id__lte=last)
+    if not match:
+        return 0
+    from . import counters  # counters imports this module
+    with transaction.atomic():
+        updated = _unread_of(user_id).filter(match).update(read=True)
+        if updated:
+            counters.decrement(user_id, by=updated)
+    return updated
@@ -22,7 +22,14 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ('id', 'recipient', 'recipient_id', 'actor', 'verb', 'message', 'read', 'created_at')
-        read_only_fields = ('actor', 'created_at', 'recipient')
+        # read status changes only through mark-read / mark-all-read, which keep the unread counter
+        read_only_fields = ('actor', 'created_at', 'recipient', 'read')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # querysets annotated by notifications.read_state also honour the read watermark
+        data['read'] = getattr(instance, 'is_read', instance.read)
+        return data
 
     def validate_recipient_id(self, value):
         """Validate and return a User instance for recipient_id."""
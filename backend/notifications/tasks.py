@@ -1,94 +1,175 @@
 # notifications/tasks.py
-from celery import shared_task
-from django.contrib.auth import get_user_model
-from django.utils import timezone
+"""
+Notification delivery.
+
+Producers write events to the transactional outbox (notifications.outbox),
+which relay_notification_outbox delivers at least once. Delivery goes through
+one batch core (create_notifications / push_notifications): the recipients
+and actors of all events are resolved in one query, the rows are written with
+one bulk insert, and the pushes to the `user_<user_id>` channel groups run
+concurrently inside a single event loop (one async_to_sync bridge per batch
+rather than one per notification).
+
+Broadcasts to all of a user's connections are chunked by notifications.fanout.
+"""
+import asyncio
+import logging
+import time
+
 from asgiref.sync import async_to_sync
+from celery import shared_task
 from channels.layers import get_channel_layer
-import logging
+from django.contrib.auth import get_user_model
+from django.db import transaction
 
+from backend import metrics
+from . import counters, read_state
 from .models import Notification
 from .serializers import NotificationSerializer
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-@shared_task(bind=True)
-def send_connection_response_notification(self, recipient_id, actor_id=None, action='notified', request_id=None):
-    """
-    Creates a Notification for `recipient_id` about `actor_id` performing `action`,
-    and attempts to push it via Channels to the recipient's group `user_<user_id>`.
+# concurrent group_send calls in flight per batch
+PUSH_CONCURRENCY = 100
 
-    Returns a dict with status and (when available) serialized notification.
-    """
-    # Lookup recipient using custom user_id field
-    try:
-        recipient = User.objects.get(user_id=recipient_id)
-    except User.DoesNotExist:
-        logger.warning("Notification task: recipient not found: %s", recipient_id)
-        return {'status': 'error', 'reason': 'recipient_not_found', 'recipient_id': recipient_id}
-
-    actor = None
-    if actor_id:
-        try:
-            actor = User.objects.get(user_id=actor_id)
-        except User.DoesNotExist:
-            # actor is optional; continue with None
-            actor = None
-
-    # Build verb/message
+
+def describe(action, actor):
+    """Return the (verb, message) pair stored for `actor` performing `action`."""
+    name = actor.username if actor else 'Someone'
     if action == 'accepted':
-        verb = 'accepted your connection request'
-        message = f"{actor.username if actor else 'Someone'} accepted your connection request."
-    elif action == 'rejected':
-        verb = 'rejected your connection request'
-        message = f"{actor.username if actor else 'Someone'} rejected your connection request."
-    else:
-        verb = str(action)
-        message = f"{actor.username if actor else 'Someone'}: {action}"
+        return 'accepted your connection request', f"{name} accepted your connection request."
+    if action == 'rejected':
+        return 'rejected your connection request', f"{name} rejected your connection request."
+    if action == 'requested':
+        return 'sent you a connection request', f"{name} sent you a connection request."
+    return str(action), f"{name}: {action}"
 
-    try:
-        notif = Notification.objects.create(
-            recipient=recipient,
-            actor=actor,
-            verb=verb,
-            message=message,
-            # created_at is auto set by model's auto_now_add=True
-        )
-    except Exception as exc:
-        logger.exception("Failed to create Notification for recipient %s: %s", recipient_id, exc)
-        return {'status': 'error', 'reason': 'db_error', 'details': str(exc)}
 
-    # Serialize the notification for sending to clients
-    try:
-        serialized = NotificationSerializer(notif, context={}).data
-    except Exception as exc:
-        logger.exception("Failed to serialize Notification id=%s: %s", getattr(notif, 'id', None), exc)
-        serialized = {
-            'id': getattr(notif, 'id', None),
-            'recipient': getattr(recipient, 'user_id', None),
-            'actor': getattr(actor, 'user_id', None) if actor else None,
-            'verb': verb,
-            'message': message,
-            'read': notif.read,
-            'created_at': notif.created_at.isoformat() if getattr(notif, 'created_at', None) else timezone.now().isoformat(),
-        }
-
-    # Attempt to push via Channels to the recipient's group
+def create_notifications(events):
+    """
+    Write one Notification per event (dicts with recipient_id, actor_id and
+    action) and return them with recipient/actor attached. Events whose
+    recipient does not exist are skipped.
+    """
+    user_ids = {e['recipient_id'] for e in events} | {e['actor_id'] for e in events if e.get('actor_id')}
+    users = User.objects.in_bulk(user_ids) if user_ids else {}
+
+    notifications = []
+    for event in events:
+        recipient = users.get(event['recipient_id'])
+        if recipient is None:
+            logger.warning("Notification: recipient not found: %s", event['recipient_id'])
+            continue
+        # actor is optional; an unknown actor is stored as None
+        actor = users.get(event.get('actor_id'))
+        verb, message = describe(event.get('action', 'notified'), actor)
+        notifications.append(Notification(recipient=recipient, actor=actor, verb=verb, message=message))
+    if notifications:
+        # joins the caller's transaction when there is one (outbox relay)
+        with transaction.atomic(savepoint=False):
+            # counter row locks before the ids are allocated (see notifications.counters)
+            counters.increment(n.recipient_id for n in notifications)
+            Notification.objects.bulk_create(notifications)
+    return notifications
+
+
+async def _group_send_all(channel_layer, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(group, message):
+        async with semaphore:
+            started = time.perf_counter()
+            await channel_layer.group_send(group, message)
+            metrics.GROUP_SEND_SECONDS.observe(time.perf_counter() - started)
+
+    results = await asyncio.gather(*(send(g, m) for g, m in messages), return_exceptions=True)
+    return [r for r in results if isinstance(r, Exception)]
+
+
+def push_notifications(notifications, concurrency=PUSH_CONCURRENCY):
+    """
+    Push serialized notifications to their recipients' groups, concurrently in
+    one event loop. Returns the serialized payloads. Push failures are logged
+    and never raised: the notifications are already persisted.
+    """
+    payloads = NotificationSerializer(notifications, many=True).data
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        logger.debug("Channel layer not configured; skipping push of %s notifications", len(payloads))
+        return payloads
+    messages = [
+        (f"user_{notif.recipient_id}", {"type": "notification.message", "notification": payload})
+        for notif, payload in zip(notifications, payloads)
+    ]
     try:
-        channel_layer = get_channel_layer()
-        if channel_layer is not None:
-            group_name = f"user_{recipient.user_id}"  # ensure this matches your consumer's group naming
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    "type": "notification.message",  # consumer must implement notification_message handler
-                    "notification": serialized,
-                }
-            )
-        else:
-            logger.debug("Channel layer not configured; skipping push for notification id=%s", getattr(notif, 'id', None))
+        failures = async_to_sync(_group_send_all)(channel_layer, messages, concurrency)
     except Exception as exc:
-        # Do not fail the task if push fails; notification is persisted in DB
-        logger.exception("Failed to push Notification id=%s via Channels: %s", getattr(notif, 'id', None), exc)
+        logger.exception("Failed to push %s notifications via Channels: %s", len(messages), exc)
+        return payloads
+    for exc in failures:
+        logger.error("Failed to push a notification via Channels: %r", exc)
+    return payloads
+
+
+@shared_task(bind=True)
+def fan_out_broadcast(self, broadcast_id):
+    """Deliver a Broadcast in chunks, re-queueing itself until it is done."""
+    from .fanout import run_broadcast
+
+    if not run_broadcast(broadcast_id):
+        fan_out_broadcast.delay(broadcast_id)
+        return {'status': 'running', 'broadcast_id': broadcast_id}
+    return {'status': 'ok', 'broadcast_id': broadcast_id}
+
+
+@shared_task(bind=True)
+def resume_stalled_broadcasts(self):
+    """Re-queue broadcasts whose worker stopped (the cursor makes this safe)."""
+    from .fanout import stalled_broadcast_ids
 
-    return {'status': 'ok', 'notification': serialized}
+    broadcast_ids = stalled_broadcast_ids()
+    for broadcast_id in broadcast_ids:
+        fan_out_broadcast.delay(broadcast_id)
+    return {'status': 'ok', 'resumed': len(broadcast_ids)}
+
+
+@shared_task(bind=True)
+def relay_notification_outbox(self):
+    """Deliver events committed to the notification outbox."""
+    from .outbox import relay_outbox
+
+    return {'status': 'ok', 'relayed': relay_outbox()}
+
+
+@shared_task(bind=True)
+def send_connection_response_notification(self, recipient_id, actor_id=None, action='notified', request_id=None):
+    """
+    Deprecated; remove in the next release. Messages queued under this name
+    before producers moved to the outbox still arrive during a rolling
+    deploy, so the event is written to the outbox for the relay to deliver.
+    """
+    from .outbox import enqueue
+
+    enqueue([{'recipient_id': recipient_id, 'actor_id': actor_id, 'action': action, 'request_id': request_id}])
+    return {'status': 'ok', 'queued': 1}
+
+
+@shared_task(bind=True)
+def purge_notification_outbox(self):
+    """Delete outbox rows published longer ago than outbox.RETENTION."""
+    from .outbox import purge_published
+
+    return {'status': 'ok', 'deleted': purge_published()}
+
+
+@shared_task(bind=True)
+def clear_read_flags(self, user_id):
+    """Set the read flag on a user's notifications under the read watermark."""
+    return {'status': 'ok', 'cleared': read_state.clear_read_flags(user_id)}
+
+
+@shared_task(bind=True)
+def reconcile_unread_counters(self):
+    """Recompute the maintained unread counters from the notifications table."""
+    return {'status': 'ok', 'fixed': counters.reconcile()}
@@ -1,3 +1,485 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from backend.testing import TEST_CHANNEL_LAYERS, TEST_PASSWORD, QueryBudgetAPITestCase
+from connections.models import ConnectionEdge, ConnectionRequest
+from . import counters, fanout, read_state
+from .consumers import NotificationConsumer
+from .routing import websocket_urlpatterns
+from .token_middleware import QueryStringTokenAuthMiddleware, token_user_cache
+from . import outbox as notification_outbox
+from .models import Broadcast, Notification, NotificationOutbox, NotificationState
+from .tasks import reconcile_unread_counters, resume_stalled_broadcasts, send_connection_response_notification
+
+
+def notify(events):
+    """Deliver `events` the way producers do: through the outbox and its relay."""
+    notification_outbox.enqueue(events)
+    return notification_outbox.relay_outbox()
+
+
+class NotificationEndpointTests(QueryBudgetAPITestCase):
+
+    def test_list_notifications(self):
+        with self.assertQueryBudget(2, 'GET /api/notifications/notifications/'):
+            response = self.client.get('/api/notifications/notifications/?limit=100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            len(response.data['results']),
+            min(100, Notification.objects.filter(recipient=self.user).count()),
+        )
+
+    def test_pages_do_not_overlap(self):
+        seen = []
+        url = '/api/notifications/notifications/?limit=7'
+        while url:
+            with self.assertQueryBudget(2, 'GET /api/notifications/notifications/?cursor='):
+                response = self.client.get(url)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        expected = list(
+            Notification.objects.filter(recipient=self.user)
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_cursor_with_invalid_values(self):
+        for position in (['garbage', 1], [timezone.now().isoformat(), 'x'], [None, 1], [{}, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+            response = self.client.get(f'/api/notifications/notifications/?cursor={cursor}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_retrieve_notification(self):
+        notification = Notification.objects.filter(recipient=self.user).first()
+        with self.assertQueryBudget(2, 'GET /api/notifications/notifications/{id}/'):
+            response = self.client.get(f'/api/notifications/notifications/{notification.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_other_users_notifications_are_hidden(self):
+        notification = Notification.objects.exclude(recipient=self.user).first()
+        response = self.client.get(f'/api/notifications/notifications/{notification.id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_mark_read(self):
+        notification = Notification.objects.filter(recipient=self.user, read=False).first()
+        with self.assertQueryBudget(6, 'POST /api/notifications/notifications/{id}/mark-read/'):
+            response = self.client.post(f'/api/notifications/notifications/{notification.id}/mark-read/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        notification.refresh_from_db()
+        self.assertTrue(notification.read)
+
+    def test_mark_all_read(self):
+        with self.assertQueryBudget(5, 'POST /api/notifications/notifications/mark-all-read/'):
+            response = self.client.post('/api/notifications/notifications/mark-all-read/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # rows are not rewritten; the watermark makes all of them read
+        self.assertTrue(Notification.objects.filter(recipient=self.user, read=False).exists())
+        listing = self.client.get('/api/notifications/notifications/?limit=100')
+        self.assertTrue(all(row['read'] for row in listing.data['results']))
+        unread = self.client.get('/api/notifications/notifications/?unread=true')
+        self.assertEqual(unread.data['results'], [])
+
+        # newer notifications are unread again and can be marked individually
+        notify([{'recipient_id': self.user.pk, 'actor_id': self.users[1].pk, 'action': 'posted'}])
+        newest = self.client.get('/api/notifications/notifications/?unread=true').data['results']
+        self.assertEqual(len(newest), 1)
+        self.client.post(f"/api/notifications/notifications/{newest[0]['id']}/mark-read/")
+        self.assertEqual(self.client.get('/api/notifications/notifications/?unread=true').data['results'], [])
+
+    def test_mark_all_read_watermark_follows_ids(self):
+        notify([{'recipient_id': self.user.pk, 'actor_id': self.users[1].pk, 'action': 'posted'}])
+        # highest id, but older than the rest of the backlog
+        highest = Notification.objects.filter(recipient=self.user).latest('id')
+        Notification.objects.filter(pk=highest.pk).update(created_at=timezone.now() - timedelta(days=365))
+        self.client.post('/api/notifications/notifications/mark-all-read/')
+        self.assertEqual(self.client.get('/api/notifications/notifications/?unread=true').data['results'], [])
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_mark_all_read_clears_flags_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/notifications/notifications/mark-all-read/')
+        self.assertFalse(Notification.objects.filter(recipient=self.user, read=False).exists())
+        self.assertEqual(self.unread_count(), 0)
+
+        notify([{'recipient_id': self.user.pk, 'actor_id': self.users[1].pk, 'action': 'posted'}])
+        self.assertEqual(read_state.clear_read_flags(self.user.pk, batch_size=2), 0)
+        self.assertEqual(len(self.client.get('/api/notifications/notifications/?unread=true').data['results']), 1)
+        self.assertEqual(self.unread_count(), 1)
+
+    def unread_count(self):
+        response = self.client.get('/api/notifications/notifications/unread-count/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['unread']
+
+    def test_unread_count_follows_reads_and_new_notifications(self):
+        actual = Notification.objects.filter(recipient=self.user, read=False).count()
+        with self.assertQueryBudget(2, 'GET /api/notifications/notifications/unread-count/'):
+            self.assertEqual(self.unread_count(), actual)
+
+        notification = Notification.objects.filter(recipient=self.user, read=False).first()
+        self.client.post(f'/api/notifications/notifications/{notification.id}/mark-read/')
+        self.client.post(f'/api/notifications/notifications/{notification.id}/mark-read/')
+        self.assertEqual(self.unread_count(), actual - 1)
+
+        notify([{'recipient_id': self.user.pk, 'actor_id': self.users[1].pk, 'action': 'posted'}] * 3)
+        self.assertEqual(self.unread_count(), actual + 2)
+
+        self.client.post('/api/notifications/notifications/mark-all-read/')
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_unread_listing(self):
+        response = self.client.get('/api/notifications/notifications/?unread=true&limit=100')
+        self.assertEqual(
+            len(response.data['results']), Notification.objects.filter(recipient=self.user, read=False).count(),
+        )
+        self.assertFalse(any(row['read'] for row in response.data['results']))
+
+    def test_reconcile_fixes_drift(self):
+        NotificationState.objects.filter(user=self.user).update(unread=999)
+        self.assertGreaterEqual(reconcile_unread_counters()['fixed'], 1)
+        self.assertEqual(self.unread_count(), Notification.objects.filter(recipient=self.user, read=False).count())
+
+    def test_edit_and_delete_keep_the_unread_count(self):
+        before = self.unread_count()
+        first, second = Notification.objects.filter(recipient=self.user, read=False).order_by('id')[:2]
+        response = self.client.patch(
+            f'/api/notifications/notifications/{first.id}/', {'verb': first.verb, 'read': True}, format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['read'])
+
+        response = self.client.delete(f'/api/notifications/notifications/{second.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.unread_count(), before - 1)
+        read = Notification.objects.filter(recipient=self.user, read=True).first()
+        self.client.delete(f'/api/notifications/notifications/{read.id}/')
+        self.assertFalse(Notification.objects.filter(pk=read.pk).exists())
+        self.assertEqual(self.unread_count(), before - 1)
+
+    def test_create_requires_staff(self):
+        response = self.client.post('/api/notifications/notifications/', {
+            'recipient_id': self.users[1].user_id, 'verb': 'poked you',
+        })
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class NotificationTaskTests(QueryBudgetAPITestCase):
+
+    def test_relay_delivers_a_batch(self):
+        layer = get_channel_layer()
+        recipients = self.users[1:6]
+        channels = {}
+        for user in recipients:
+            channels[user.pk] = async_to_sync(layer.new_channel)()
+            async_to_sync(layer.group_add)(f'user_{user.pk}', channels[user.pk])
+        events = [
+            {'recipient_id': user.pk, 'actor_id': self.user.pk, 'action': 'accepted'} for user in recipients
+        ] + [{'recipient_id': 'SPC-20250101-ffffff', 'actor_id': self.user.pk, 'action': 'accepted'}]
+
+        notification_outbox.enqueue(events)
+        before = Notification.objects.count()
+        with self.assertQueryBudget(7, 'outbox relay batch'):
+            self.assertEqual(notification_outbox.relay_batch(), len(events))
+        self.assertEqual(Notification.objects.count(), before + len(recipients))
+        for user in recipients:
+            message = async_to_sync(layer.receive)(channels[user.pk])
+            self.assertEqual(message['notification']['recipient']['user_id'], user.pk)
+            self.assertEqual(message['notification']['actor']['user_id'], self.user.pk)
+
+
+@mock.patch.object(fanout, 'FANOUT_CHUNK_SIZE', 2)
+class BroadcastFanOutTests(QueryBudgetAPITestCase):
+
+    def connection_ids(self):
+        return set(ConnectionEdge.objects.filter(user=self.user).values_list('peer_id', flat=True))
+
+    def broadcast_recipients(self):
+        return list(
+            Notification.objects.filter(actor=self.user, verb='posted').values_list('recipient_id', flat=True)
+        )
+
+    def test_broadcast_reaches_every_connection(self):
+        layer = get_channel_layer()
+        recipient = next(iter(self.connection_ids()))
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'user_{recipient}', channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            broadcast = fanout.start_broadcast(self.user, verb='posted', message='Hello')
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.status, Broadcast.STATUS_DONE)
+        self.assertEqual(broadcast.delivered, len(self.connection_ids()))
+        self.assertCountEqual(self.broadcast_recipients(), self.connection_ids())
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['notification']['message'], 'Hello')
+
+    def test_interrupted_broadcast_resumes_without_duplicates(self):
+        broadcast = Broadcast.objects.create(actor=self.user, verb='posted')
+        fanout.run_broadcast(broadcast.pk, max_chunks=1)  # worker "dies" after one chunk
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.delivered), (Broadcast.STATUS_RUNNING, 2))
+
+        Broadcast.objects.filter(pk=broadcast.pk).update(updated_at=broadcast.updated_at - timedelta(hours=1))
+        self.assertEqual(resume_stalled_broadcasts()['resumed'], 1)
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.status, Broadcast.STATUS_DONE)
+        recipients = self.broadcast_recipients()
+        self.assertEqual(len(recipients), len(set(recipients)))
+        self.assertCountEqual(recipients, self.connection_ids())
+
+
+class NotificationOutboxTests(QueryBudgetAPITestCase):
+
+    def test_accept_writes_outbox_and_relay_delivers_once(self):
+        req = ConnectionRequest.objects.filter(to_user=self.user, status=ConnectionRequest.STATUS_PENDING).first()
+        response = self.client.post(f'/api/connections/requests/{req.id}/accept/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = NotificationOutbox.objects.get(published_at__isnull=True)
+        self.assertEqual(row.event['recipient_id'], req.from_user_id)
+
+        with self.assertQueryBudget(7, 'outbox relay batch'):
+            self.assertEqual(notification_outbox.relay_batch(), 1)
+        self.assertEqual(notification_outbox.relay_outbox(), 0)
+        self.assertEqual(
+            Notification.objects.filter(
+                recipient_id=req.from_user_id, actor=self.user, verb='accepted your connection request',
+            ).count(),
+            1,
+        )
+
+    def test_rolled_back_change_leaves_no_event(self):
+        try:
+            with transaction.atomic():
+                notification_outbox.enqueue([{'recipient_id': self.user.pk, 'action': 'posted'}])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_relay_command_drains_outbox(self):
+        notification_outbox.enqueue(
+            [{'recipient_id': user.pk, 'actor_id': self.user.pk, 'action': 'posted'} for user in self.users[1:4]]
+        )
+        out = StringIO()
+        call_command('relay_notification_outbox', '--once', '--batch-size', '2', stdout=out)
+        self.assertIn('Relayed 3', out.getvalue())
+        self.assertFalse(NotificationOutbox.objects.filter(published_at__isnull=True).exists())
+
+    def test_purge_published(self):
+        notification_outbox.enqueue([{'recipient_id': self.user.pk, 'action': 'posted'}])
+        notification_outbox.relay_outbox()
+        self.assertEqual(notification_outbox.purge_published(), 0)
+        self.assertEqual(notification_outbox.purge_published(now=timezone.now() + timedelta(days=2)), 1)
+
+    def test_legacy_task_name_goes_through_the_outbox(self):
+        send_connection_response_notification.delay(self.user.pk, self.users[1].pk, 'accepted')
+        self.assertEqual(notification_outbox.relay_outbox(), 1)
+        self.assertTrue(Notification.objects.filter(recipient=self.user, actor=self.users[1]).exists())
+
+
+class NotificationConsumerTests(QueryBudgetAPITestCase):
+
+    def communicator(self, path='/ws/notifications/', user=None):
+        consumer = NotificationConsumer.as_asgi()
+        user = user or self.user
+
+        async def application(scope, receive, send):
+            return await consumer(dict(scope, user=user), receive, send)
+
+        return WebsocketCommunicator(application, path)
+
+    def test_replay_after_last_seen_id(self):
+        ids = list(Notification.objects.filter(recipient=self.user).order_by('id').values_list('id', flat=True))
+
+        async def scenario():
+            communicator = self.communicator(f'/ws/notifications/?last_seen_id={ids[-4]}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            replayed = [await communicator.receive_json_from() for _ in range(3)]
+            complete = await communicator.receive_json_from()
+
+            # a live copy of a replayed notification is dropped, a new one is delivered
+            layer = get_channel_layer()
+            group = f'user_{self.user.pk}'
+            await layer.group_send(group, {'type': 'notification.message', 'notification': {'id': ids[-1]}})
+            await layer.group_send(group, {'type': 'notification.message', 'notification': {'id': ids[-1] + 1}})
+            live = await communicator.receive_json_from()
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            return replayed, complete, live
+
+        replayed, complete, live = async_to_sync(scenario)()
+        self.assertEqual([m['data']['id'] for m in replayed], ids[-3:])
+        self.assertTrue(all(m['replay'] for m in replayed))
+        self.assertEqual(complete, {'type': 'replay_complete', 'count': 3, 'last_id': ids[-1], 'truncated': False})
+        self.assertEqual(live['data']['id'], ids[-1] + 1)
+
+    def test_resume_message_and_chunking(self):
+        ids = list(Notification.objects.filter(recipient=self.user).order_by('id').values_list('id', flat=True))
+
+        async def scenario():
+            communicator = self.communicator()
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'resume', 'last_seen_id': 0})
+            messages = []
+            while True:
+                message = await communicator.receive_json_from()
+                messages.append(message)
+                if message['type'] == 'replay_complete':
+                    break
+            await communicator.send_json_to({'type': 'resume', 'last_seen_id': 0})
+            duplicate = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return messages, duplicate
+
+        with mock.patch('notifications.consumers.REPLAY_CHUNK_SIZE', 7):
+            messages, duplicate = async_to_sync(scenario)()
+        self.assertEqual([m['data']['id'] for m in messages[:-1]], ids)
+        self.assertEqual(messages[-1]['count'], len(ids))
+        self.assertEqual(duplicate['type'], 'error')
+
+    def test_held_back_overflow_is_read_from_the_database(self):
+        ids = list(Notification.objects.filter(recipient=self.user).order_by('id').values_list('id', flat=True))
+        consumer = NotificationConsumer()
+        consumer.scope = {'user': self.user}
+        consumer.held_back, consumer.held_back_dropped = [], False
+        consumer.replayed_through = 0
+        sent = []
+
+        async def send_json(content):
+            sent.append(content)
+            if len(sent) == 1:
+                # three notifications are created and pushed while the replay runs
+                created = await database_sync_to_async(Notification.objects.bulk_create)([
+                    Notification(recipient=self.user, actor=self.users[1], verb='posted', message='Posted.')
+                    for _ in range(3)
+                ])
+                for notification in created:
+                    await consumer.notification_message({'notification': {'id': notification.id}})
+
+        consumer.send_json = send_json
+        with mock.patch('notifications.consumers.HELD_BACK_LIMIT', 2):
+            async_to_sync(consumer.replay)(ids[-2])
+        new_ids = list(Notification.objects.filter(recipient=self.user, id__gt=ids[-1]).values_list('id', flat=True))
+        self.assertEqual([m['data']['id'] for m in sent[:-1]], ids[-1:] + sorted(new_ids))
+        self.assertTrue(all(m['replay'] for m in sent[:-1]))
+        self.assertEqual(sent[-1]['count'], 4)
+        self.assertIsNone(consumer.held_back)
+
+    def test_mark_read_commands_are_coalesced(self):
+        unread = list(
+            Notification.objects.filter(recipient=self.user, read=False).order_by('id').values_list('id', flat=True)
+        )
+        before = counters.unread_count(self.user.pk)
+
+        async def scenario():
+            communicator = self.communicator()
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'mark_read', 'ids': unread[:1], 'ref': 'a'})
+            await communicator.send_json_to({'type': 'mark_read', 'ranges': [[unread[1], unread[2]]], 'ref': 'b'})
+            await communicator.send_json_to({'type': 'mark_read', 'ids': ['x'], 'ref': 'c'})
+            invalid = await communicator.receive_json_from()
+            ack = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return invalid, ack
+
+        with mock.patch('notifications.read_state.mark_read', wraps=read_state.mark_read) as mark_read:
+            invalid, ack = async_to_sync(scenario)()
+        mark_read.assert_called_once()
+        self.assertEqual(invalid['type'], 'error')
+        self.assertEqual(ack['refs'], ['a', 'b'])
+        self.assertEqual(ack['updated'], 3)
+        self.assertEqual(ack['unread'], before - ack['updated'])
+        self.assertFalse(Notification.objects.filter(pk__in=unread[:3], read=False).exists())
+
+    def test_mark_all_read_command(self):
+        async def scenario():
+            communicator = self.communicator()
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'mark_all_read'})
+            ack = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return ack
+
+        ack = async_to_sync(scenario)()
+        self.assertEqual(ack['unread'], 0)
+        self.assertEqual(counters.unread_count(self.user.pk), 0)
+
+    def test_anonymous_connection_is_refused(self):
+        async def scenario():
+            communicator = self.communicator(user=AnonymousUser())
+            connected, code = await communicator.connect()
+            return connected, code
+
+        self.assertEqual(async_to_sync(scenario)(), (False, 4401))
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class TokenMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('ws-token', 'ws-token@example.com', TEST_PASSWORD)
+
+    def setUp(self):
+        token_user_cache.clear()
+        self.application = QueryStringTokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def connect(self, token):
+        async def scenario():
+            communicator = WebsocketCommunicator(self.application, f'/ws/notifications/?token={token}')
+            connected, code = await communicator.connect()
+            if connected:
+                await communicator.disconnect()
+            return connected, code
+
+        return async_to_sync(scenario)()
+
+    def test_token_user_is_cached(self):
+        token = SlidingToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.connect(token)[0])
+        with self.assertNumQueries(0):
+            self.assertTrue(self.connect(token)[0])
+
+    def test_invalid_token_is_refused(self):
+        token = SlidingToken.for_user(self.user)
+        token.set_exp(lifetime=-timedelta(seconds=1))
+        self.assertEqual(self.connect(token), (False, 4401))
+        self.assertEqual(self.connect('not-a-token'), (False, 4401))
+
+    def test_unknown_user_is_refused(self):
+        token = SlidingToken.for_user(self.user)
+        token['user_id'] = 'SPC-20250101-ffffff'
+        self.assertEqual(self.connect(token), (False, 4401))
+
+
+class WebSocketBenchmarkCommandTests(QueryBudgetAPITestCase):
+
+    def test_smoke(self):
+        out = StringIO()
+        call_command('benchmark_ws_fanout', sockets=15, batch_size=4, connect_concurrency=5, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(results['connected'], 15)
+        self.assertEqual(results['delivered'], 15)
+        self.assertIsNotNone(results['latency_ms']['p99'])
+        # benchmark users are removed afterwards
+        self.assertFalse(ConnectionRequest.objects.filter(from_user__user_id__startswith='SPC-19990101-').exists())
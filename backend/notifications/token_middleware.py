@@ -1,18 +1,100 @@
 # notifications/token_middleware.py
+"""
+WebSocket authentication from a `?token=` query parameter.
+
+Reconnect storms are the hot path here: every client of a restarted worker
+comes back within seconds. So the token is decoded once (SlidingToken checks
+signature, expiry and token type together), the user lookup runs in the
+thread pool via database_sync_to_async instead of on the event loop, and
+validated tokens are remembered in a small LRU keyed by the token's jti and
+exp for TOKEN_CACHE_TTL seconds (never past the token's own expiry).
+"""
+import logging
+import time
+from collections import OrderedDict
 from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from django.db import close_old_connections
-from rest_framework_simplejwt.tokens import UntypedToken, SlidingToken
-from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
-from django.conf import settings
-import logging
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import SlidingToken
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# seconds a token -> user mapping is reused; bounds how long a deleted user
+# can still open sockets with an unexpired token
+TOKEN_CACHE_TTL = 30
+TOKEN_CACHE_SIZE = 10000
+
 
-class QueryStringTokenAuthMiddleware:
+class _TokenUserCache:
+    """
+    LRU of (jti, exp) -> (user, expires_at). Only touched from the event loop
+    thread, so it needs no lock.
+    """
+
+    def __init__(self, size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key, now=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at <= (now or time.time()):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user
+
+    def set(self, key, user, token_exp, now=None):
+        expires_at = min((now or time.time()) + self.ttl, token_exp)
+        self._entries[key] = (user, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_user_cache = _TokenUserCache()
+
+
+@database_sync_to_async
+def _load_user(claim_value):
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: claim_value}).first()
+
+
+async def get_user_for_token(raw_token):
+    """Return the user `raw_token` belongs to, or AnonymousUser."""
+    try:
+        token = SlidingToken(raw_token)
+    except TokenError as exc:
+        logger.debug("Token auth failed for websocket connection: %s", exc)
+        return AnonymousUser()
+
+    key = (token.get(api_settings.JTI_CLAIM), token.get("exp"))
+    user = token_user_cache.get(key)
+    if user is not None:
+        return user
+
+    claim_value = token.get(api_settings.USER_ID_CLAIM)
+    user = await _load_user(claim_value) if claim_value is not None else None
+    if user is None:
+        logger.debug("Token valid but user not found: claim=%s", claim_value)
+        return AnonymousUser()
+    token_user_cache.set(key, user, token["exp"])
+    return user
+
+
+class QueryStringTokenAuthMiddleware(BaseMiddleware):
     """
     ASGI middleware that checks for a `token` query parameter on WebSocket connect,
     validates the token using SimpleJWT, and sets scope['user'] accordingly.
@@ -26,67 +108,14 @@ class QueryStringTokenAuthMiddleware:
         })
     """
 
-    def __init__(self, inner):
-        self.inner = inner
-
-    def __call__(self, scope):
-        return QueryStringTokenAuthMiddlewareInstance(scope, self.inner)
-
-
-class QueryStringTokenAuthMiddlewareInstance:
-    def __init__(self, scope, inner):
-        self.scope = dict(scope)
-        self.inner = inner
-
-    async def __call__(self, receive, send):
-        query_string = self.scope.get("query_string", b"").decode()
-        qs = parse_qs(query_string)
-        token = None
-
-        # Prefer 'token' query param; you can also read from headers if you implement that
-        if "token" in qs:
-            token = qs["token"][0]
+    async def __call__(self, scope, receive, send):
+        qs = parse_qs(scope.get("query_string", b"").decode())
+        token = qs.get("token", [None])[0]
 
         if token:
-            try:
-                # Validate token signature (will raise on invalid/expired)
-                # Using UntypedToken ensures signature and expiration are checked.
-                UntypedToken(token)
-
-                # Use SlidingToken to read claims (works for Sliding/JWT tokens)
-                sliding = SlidingToken(token)
-
-                # The default user-id claim used by SimpleJWT is "user_id", but check settings
-                user_id_claim = getattr(settings, "SIMPLE_JWT", {}).get("USER_ID_CLAIM", "user_id")
-                claim_value = sliding.get(user_id_claim) or sliding.get("user_id") or sliding.get("id")
-
-                user = None
-                if claim_value is not None:
-                    # Try to find by your custom user_id field first, then pk
-                    # (This mirrors your project which uses user.user_id)
-                    try:
-                        user = User.objects.get(user_id=claim_value)
-                    except Exception:
-                        try:
-                            user = User.objects.get(pk=claim_value)
-                        except Exception:
-                            user = None
-
-                if user:
-                    self.scope["user"] = user
-                else:
-                    logger.debug("Token valid but user not found: claim=%s", claim_value)
-                    self.scope["user"] = AnonymousUser()
-
-            except (TokenError, InvalidToken, Exception) as exc:
-                logger.debug("Token auth failed for websocket connection: %s", exc)
-                self.scope["user"] = AnonymousUser()
-        else:
+            scope = dict(scope, user=await get_user_for_token(token))
+        elif "user" not in scope:
             # No token provided; leave scope['user'] for other middleware (e.g., session auth)
-            # If no other auth in stack, set AnonymousUser
-            self.scope.setdefault("user", AnonymousUser())
+            scope = dict(scope, user=AnonymousUser())
 
-        # Ensure DB connections are fresh for this connection handler
-        close_old_connections()
-        inner = self.inner(self.scope)
-        return await inner(receive, send)
+        return await super().__call__(scope, receive, send)
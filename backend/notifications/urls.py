@@ -1,10 +1,15 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from .views import NotificationViewSet
+from backend.async_api import get_or_sync
+from .views import NotificationViewSet, notification_list
 
 router = DefaultRouter()
 router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
+    # GET served by an async view (backend.async_api); POST by the viewset
+    path('notifications/', get_or_sync(
+        notification_list, NotificationViewSet.as_view({'get': 'list', 'post': 'create'}),
+    )),
     path('', include(router.urls)),
 ]
@@ -2,17 +2,23 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
 
+from . import counters
+from . import read_state
 from .models import Notification
 from .serializers import NotificationSerializer
 from .permissions import IsRecipientOrReadOnly, IsStaffOrSystemCreateOnly
+from backend.async_api import async_api_view, list_page
+from backend.pagination import KeysetCursorPagination
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
     """
     Manage notifications:
     - list/retrieve: only the recipient sees their notifications (get_queryset)
-    - update/partial_update/destroy: only recipient can modify/delete (IsRecipientOrReadOnly)
+    - update/partial_update/destroy: only recipient can modify/delete (IsRecipientOrReadOnly);
+      `read` is read-only here, reads go through mark-read/mark-all-read so the unread counter stays right
     - create: allowed only for staff via API (IsStaffOrSystemCreateOnly); server-side tasks should
       create notifications directly in DB instead of calling this API.
     """
@@ -22,10 +28,18 @@ class NotificationViewSet(viewsets.ModelViewSet):
         IsRecipientOrReadOnly,
         IsStaffOrSystemCreateOnly,
     ]
+    # newest first; ?cursor=/?limit= (see backend.pagination)
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         # Only show recipient's notifications
-        return Notification.objects.filter(recipient=self.request.user)
+        qs = read_state.with_read_status(
+            Notification.objects.filter(recipient=self.request.user).select_related('actor', 'recipient')
+        )
+        if self.action == 'list' and self.request.query_params.get('unread') in ('1', 'true'):
+            # served by the partial index on unread rows
+            qs = qs.filter(read_state.unread_q(self.request.user.pk))
+        return qs
 
     def perform_create(self, serializer):
         """
@@ -33,7 +47,14 @@ class NotificationViewSet(viewsets.ModelViewSet):
         Note: serializer should accept a write-only `recipient_id` (and map to a User instance).
         Server-side tasks (Celery) that create Notification objects directly are unaffected.
         """
-        serializer.save(actor=self.request.user)
+        recipient = serializer.validated_data.get('recipient_id')
+        with transaction.atomic():
+            # counter row lock before the id is allocated (see notifications.counters)
+            counters.increment([recipient.pk] if recipient else [])
+            serializer.save(actor=self.request.user)
+
+    def perform_destroy(self, instance):
+        read_state.delete(instance.recipient_id, instance.pk)
 
     @action(detail=True, methods=["post"], url_path="mark-read")
     def mark_read(self, request, pk=None):
@@ -42,11 +63,14 @@ class NotificationViewSet(viewsets.ModelViewSet):
         Returns the updated serialized notification.
         """
         notification = self.get_object()
-        if notification.read:
+        if notification.is_read:
             return Response({"detail": "Already marked read."}, status=status.HTTP_200_OK)
 
-        notification.read = True
-        notification.save(update_fields=["read"])
+        with transaction.atomic():
+            # conditional update: only the request that flips the flag decrements the counter
+            if Notification.objects.filter(pk=notification.pk, read=False).update(read=True):
+                counters.decrement(notification.recipient_id)
+        notification.read = notification.is_read = True
 
         serializer = self.get_serializer(notification)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -55,7 +79,18 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def mark_all_read(self, request):
         """
         Convenience endpoint: mark all unread notifications for the authenticated user as read.
+        Moves the user's read watermark instead of updating every row (see notifications.read_state).
         """
-        qs = self.get_queryset().filter(read=False)
-        updated_count = qs.update(read=True)
+        updated_count = read_state.mark_all_read(request.user.pk)
         return Response({"detail": f"{updated_count} notifications marked read."}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], url_path="unread-count")
+    def unread_count(self, request):
+        """Unread badge, read from the maintained counter (see notifications.counters)."""
+        return Response({"unread": counters.unread_count(request.user.pk)}, status=status.HTTP_200_OK)
+
+
+@async_api_view(['GET'])
+async def notification_list(request):
+    """Async GET of the notification list (NotificationViewSet.list)."""
+    return await list_page(NotificationViewSet, request)
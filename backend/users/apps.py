@@ -5,3 +5,7 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        # connects the receivers that invalidate cached users
+        from . import authentication  # noqa: F401
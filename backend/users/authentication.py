@@ -0,0 +1,142 @@
+# users/authentication.py
+"""
+JWT authentication that serves the user from a cache instead of the database.
+
+Every user has a version token in the default cache. The user row is cached
+under a key that includes that version, in the shared cache and in a small
+process-local LRU. A request reads the version (one cache round trip), and
+the local copy is used when its version still matches. Otherwise the shared
+copy is used, and the database only on a miss.
+
+Saving or deleting a user replaces its version once the transaction commits
+(see `invalidate_user`), so a profile update, an is_active change or a new
+password is seen by every process on its next request. Writes that skip the
+model signals (QuerySet.update) must call invalidate_user() themselves.
+"""
+import copy
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+CACHE_ALIAS = 'default'
+CACHE_TTL = 60 * 15
+KEY_VERSION = 1
+LOCAL_CACHE_SIZE = 4096
+# a version outlives every token that may still be refreshed; a missing key
+# only means a new version and one database read
+VERSION_TTL = int(api_settings.SLIDING_TOKEN_REFRESH_LIFETIME.total_seconds())
+
+User = get_user_model()
+
+
+def _version_key(user_id):
+    return f'users:v{KEY_VERSION}:{user_id}:version'
+
+
+def _user_key(user_id, version):
+    return f'users:v{KEY_VERSION}:{user_id}:{version}'
+
+
+class _LocalUsers:
+    """LRU of user_id -> (version, user), shared by the threads of a process."""
+
+    def __init__(self, size=LOCAL_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, version, user):
+        with self._lock:
+            self._entries[user_id] = (version, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_users = _LocalUsers()
+
+
+def _current_version(cache, user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # first use or evicted: start a fresh version, so copies cached under
+        # an older one are never trusted again
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=VERSION_TTL)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def get_cached_user(user_id):
+    """Return the user with primary key `user_id`, or None if there is none."""
+    cache = caches[CACHE_ALIAS]
+    version = _current_version(cache, user_id)
+    user = local_users.get(user_id, version)
+    if user is None:
+        user = cache.get(_user_key(user_id, version))
+        if user is None:
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if user is None:
+                return None
+            cache.set(_user_key(user_id, version), user, CACHE_TTL)
+        local_users.set(user_id, version, user)
+    # views may modify request.user; keep the cached instance clean
+    return copy.copy(user)
+
+
+def invalidate_user(user_id):
+    """Drop every cached copy of `user_id` once the current transaction commits."""
+    transaction.on_commit(
+        lambda: caches[CACHE_ALIAS].set(_version_key(user_id), uuid.uuid4().hex, timeout=VERSION_TTL)
+    )
+
+
+@receiver(post_save, sender=User, dispatch_uid='users.authentication.user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='users.authentication.user_deleted')
+def _user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with the user lookup served by get_cached_user()."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Trigram GIN indexes backing connections.search on PostgreSQL. They make
+# ILIKE '%q%' and the word-similarity operator index scans instead of a
+# sequential scan over registered_users. Other backends are left untouched.
+TRIGRAM_INDEXED_FIELDS = ('full_name', 'username', 'company_name', 'email', 'contact')
+
+
+def _index_name(field):
+    return f'registered_users_{field}_trgm'
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in TRIGRAM_INDEXED_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {_index_name(field)} '
+            f'ON registered_users USING gin ({field} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in TRIGRAM_INDEXED_FIELDS:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {_index_name(field)}')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_alter_appuser_options_remove_appuser_id_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,3 +1,105 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework import status
 
-# Create your tests here.
+from backend.testing import QueryBudgetAPITestCase, TEST_PASSWORD
+from connections.models import ConnectionEdge
+from notifications.models import Broadcast, Notification
+from .authentication import local_users
+
+User = get_user_model()
+
+
+class UserEndpointTests(QueryBudgetAPITestCase):
+
+    def test_register(self):
+        with self.assertQueryBudget(5, 'POST /api/users/register/'):
+            response = self.client_class().post('/api/users/register/', {
+                'username': 'newcomer',
+                'email': 'newcomer@example.com',
+                'password': TEST_PASSWORD,
+                'full_name': 'New Comer',
+                'contact': '+9779812345678',
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertTrue(response.data['user']['user_id'].startswith('SPC-'))
+
+    def test_register_duplicate_username(self):
+        response = self.client_class().post('/api/users/register/', {
+            'username': self.user.username,
+            'email': 'other@example.com',
+            'password': TEST_PASSWORD,
+            'full_name': 'Someone',
+            'contact': '+9779812345679',
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login(self):
+        with self.assertQueryBudget(9, 'POST /api/users/login/'):
+            response = self.client_class().post('/api/users/login/', {
+                'username': self.user.username, 'password': TEST_PASSWORD,
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertIn('token', response.data)
+
+    def test_login_wrong_password(self):
+        response = self.client_class().post('/api/users/login/', {
+            'username': self.user.username, 'password': 'wrong',
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_token_refresh(self):
+        login = self.client_class().post('/api/users/login/', {
+            'username': self.user.username, 'password': TEST_PASSWORD,
+        })
+        with self.assertQueryBudget(0, 'POST /api/users/token/refresh/'):
+            response = self.client_class().post('/api/users/token/refresh/', {'token': login.data['token']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+    def test_company_change_broadcasts_to_connections(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/users/profile/', {'company_name': 'Newco'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        broadcast = Broadcast.objects.get(actor=self.user)
+        self.assertEqual(broadcast.status, Broadcast.STATUS_DONE)
+        self.assertEqual(
+            Notification.objects.filter(actor=self.user, verb='updated their company').count(),
+            ConnectionEdge.objects.filter(user=self.user).count(),
+        )
+
+        # saving the profile without changing the company does not broadcast again
+        self.client.patch('/api/users/profile/', {'company_name': 'Newco'})
+        self.assertEqual(Broadcast.objects.filter(actor=self.user).count(), 1)
+
+    def test_authenticated_user_is_served_from_cache(self):
+        with self.assertQueryBudget(1, 'GET /api/users/profile/ (cold user cache)'):
+            self.client.get('/api/users/profile/')
+        with self.assertQueryBudget(0, 'GET /api/users/profile/'):
+            response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.data['user_id'], self.user.user_id)
+
+        # a fresh process only has the shared copy
+        local_users.clear()
+        with self.assertQueryBudget(0, 'GET /api/users/profile/ (shared user cache)'):
+            self.client.get('/api/users/profile/')
+
+    def test_profile_update_invalidates_cached_user(self):
+        self.client.get('/api/users/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/api/users/profile/', {'full_name': 'Renamed User'})
+        self.assertEqual(self.client.get('/api/users/profile/').data['full_name'], 'Renamed User')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.user.pk)
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_is_throttled(self):
+        client = self.client_class()
+        for _ in range(5):
+            response = client.post('/api/users/login/', {'username': self.user.username, 'password': 'wrong'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.post('/api/users/login/', {'username': self.user.username, 'password': TEST_PASSWORD})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
@@ -1,5 +1,5 @@
 # users/throttles.py
-from rest_framework.throttling import UserRateThrottle
+from backend.throttling import UserRateThrottle
 
 class LoginRateThrottle(UserRateThrottle):
     scope = 'login'
@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import RegisterUserAPIView, LoginAPIView, SlidingTokenRefreshView
+from backend.async_api import get_or_sync
+from .views import RegisterUserAPIView, LoginAPIView, UserProfileAPIView, SlidingTokenRefreshView, profile_detail
 
 urlpatterns = [
     path('register/', RegisterUserAPIView.as_view(), name='register'),
     path('login/', LoginAPIView.as_view(), name='login'),
+    # GET served by an async view (backend.async_api)
+    path('profile/', get_or_sync(profile_detail, UserProfileAPIView.as_view()), name='profile'),
     path('token/refresh/', SlidingTokenRefreshView.as_view(), name='token_refresh'),
 ]
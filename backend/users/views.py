@@ -8,6 +8,8 @@ from django.contrib.auth import get_user_model
 from .serializers import RegistrationSerializer, LoginSerializer, UserDetailSerializer
 from .throttles import LoginRateThrottle
 from rest_framework_simplejwt.views import TokenRefreshSlidingView
+from notifications.fanout import start_broadcast
+from backend.async_api import async_api_view
 
 User = get_user_model()
 
@@ -84,6 +86,23 @@ class UserProfileAPIView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+    def perform_update(self, serializer):
+        previous_company = serializer.instance.company_name
+        user = serializer.save()
+        if user.company_name != previous_company and user.company_name:
+            # tell every connection; delivered in chunks by notifications.fanout
+            start_broadcast(
+                user,
+                verb='updated their company',
+                message=f"{user.username} now works at {user.company_name}.",
+            )
+
+
+@async_api_view(['GET'])
+async def profile_detail(request):
+    """Async GET of the profile (UserProfileAPIView); the user comes from the auth cache."""
+    return UserDetailSerializer(request.user).data
+
 
 class SlidingTokenRefreshView(TokenRefreshSlidingView):
     permission_classes = [permissions.AllowAny]
\ No newline at end of file